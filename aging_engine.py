@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from datetime import date
+import cache_engine
+import core_engine
+import cashflow_engine
+import list_engine
+
+# --- 應收 / 應付 帳齡引擎 (首頁任務中心) ---
+# 1. 只撈「回溯期間起 ~ 本月底」的收付款 (expected_date 範圍篩選，keyset 分頁)，多年歷史不會整包拉回；
+#    表上有 paid_date 欄位 (po_payments) 時另排除已付款項
+# 2. 逾期天數、本月到期、帳齡區間全部以向量運算算出 (不逐列迴圈)
+# 3. 依 (AR/AP, 今天, 回溯天數, SO/PO 版本) 快取；存檔 bump 後自動換新
+# so_payments 沒有實收標記，AR 只是「預計日已過的排程期數」，不代表實際未收 (畫面上依 paid_tracked 標示)；
+# 90+ 區間也只涵蓋回溯期間內的款項。
+
+LOOKBACK_DAYS = 365
+PAID_COL = "paid_date"
+AGING_EDGES = [30, 60, 90]                       # 逾期天數上限 (含)
+AGING_LABELS = ["0-30", "31-60", "61-90", "90+"]
+KINDS = {
+    # kind: (收付款表, 單號欄位, 表頭關聯)
+    "ar": ("so_payments", "so_number", "sales_orders"),
+    "ap": ("po_payments", "po_number", "purchase_orders"),
+}
+COLUMNS = ["doc_no", "term_name", "expected_date", "amount", "project_code", "partner"]
+
+def month_bounds(today):
+    start = pd.Timestamp(today).replace(day=1)
+    return start, start + pd.offsets.MonthEnd(0)
+
+def _page_rows(rows, doc_col, parent):
+    for r in rows:
+        head = r.get(parent) or {}
+        yield (r.get(doc_col), r.get("term_name") or "", r.get("expected_date"), r.get("amount") or 0,
+               head.get("project_code") or "", (head.get("partners") or {}).get("name") or "")
+
+def _fetch(supabase, kind, date_from, date_to, open_only):
+    table, doc_col, parent = KINDS[kind]
+    cols = f"id, {doc_col}, term_name, expected_date, amount, {parent}!inner(project_code, partners(name))"
+    out, cursor = [], None
+    while True:
+        q = supabase.table(table).select(cols).gte("expected_date", str(date_from)).lte("expected_date", str(date_to))
+        if open_only:
+            q = q.is_(PAID_COL, "null")
+        rows, cursor = list_engine.fetch_page(q, cashflow_engine.PAY_KEYS, cursor, cashflow_engine.PAGE_SIZE)
+        out.extend(_page_rows(rows, doc_col, parent))
+        if cursor is None:
+            break
+    return out
+
+def fetch(supabase, kind, date_from, date_to, open_only=True):
+    # date_from <= expected_date <= date_to 的收付款，含專案與對象名稱
+    # open_only: 排除已有 paid_date 的款項；表上沒有該欄位時全部列出，df.attrs["paid_tracked"] 為 False
+    tracked = open_only
+    try:
+        out = _fetch(supabase, kind, date_from, date_to, open_only)
+    except Exception as e:
+        if not (open_only and core_engine.is_missing_column(e)): raise
+        out, tracked = _fetch(supabase, kind, date_from, date_to, False), False
+    df = pd.DataFrame(out, columns=COLUMNS)
+    df["amount"] = pd.to_numeric(df["amount"], errors="coerce").fillna(0.0)
+    df.attrs["paid_tracked"] = tracked
+    return df
+
+def age(df, today):
+    # 加上 days_overdue / due_this_month / bucket (未逾期為 NaN)
+    df = df.copy()
+    d = pd.to_datetime(df["expected_date"], errors="coerce", format="ISO8601")
+    days = (pd.Timestamp(today) - d).dt.days.fillna(-1).astype(int).to_numpy()
+    m_start, m_end = month_bounds(today)
+    df["days_overdue"] = np.maximum(days, 0)
+    df["due_this_month"] = ((d >= m_start) & (d <= m_end)).to_numpy()
+    codes = np.where(days > 0, np.searchsorted(AGING_EDGES, days, side="left"), -1)
+    df["bucket"] = pd.Categorical.from_codes(codes, categories=AGING_LABELS)
+    return df
+
+def aging_table(df, by):
+    # by: "partner" / "project_code"；每列一個對象，欄位為帳齡區間與合計
+    over = df[df["days_overdue"] > 0]
+    t = over.pivot_table(index=by, columns="bucket", values="amount", aggfunc="sum", fill_value=0.0, observed=False)
+    t = t.reindex(columns=AGING_LABELS, fill_value=0.0)
+    t["合計"] = t.sum(axis=1)
+    return t.sort_values("合計", ascending=False)
+
+def summarize(df, today):
+    df = age(df, today)
+    due = df[df["due_this_month"]].sort_values("expected_date")
+    overdue = df[df["days_overdue"] > 0].sort_values("days_overdue", ascending=False)
+    return {
+        "due": due, "overdue": overdue,
+        "by_partner": aging_table(df, "partner"),
+        "by_project": aging_table(df, "project_code"),
+        "due_total": float(due["amount"].sum()),
+        "overdue_total": float(overdue["amount"].sum()),
+    }
+
+@st.cache_data(ttl=cache_engine.DEFAULT_TTL, show_spinner=False)
+def _cached_ledger(kind, today, lookback_days, ver, _supabase):
+    date_from = (pd.Timestamp(today) - pd.Timedelta(days=lookback_days)).strftime("%Y-%m-%d")
+    _, m_end = month_bounds(today)
+    df = fetch(_supabase, kind, date_from, m_end.strftime("%Y-%m-%d"))
+    res = summarize(df, today)
+    # paid_tracked=False：沒有實收/實付標記，逾期金額只是預計日已過的排程期數
+    res["paid_tracked"], res["date_from"] = df.attrs["paid_tracked"], date_from
+    return res
+
+def ledger(supabase, kind, today=None, lookback_days=LOOKBACK_DAYS):
+    # kind: "ar" (應收，so_payments) / "ap" (應付，po_payments)
+    today = str(today or date.today())
+    parent = KINDS[kind][2]
+    ver = (cache_engine.version(parent), cache_engine.version("partners"))
+    return _cached_ledger(kind, today, int(lookback_days), ver, supabase)
+
+# --- 效能測試 (python aging_engine.py [筆數])：5 年歷史的收付款 ---
+def _benchmark(n_rows=200000):
+    import time
+    rng = np.random.default_rng(0)
+    today = "2026-10-18"
+    days = pd.Timestamp(today) - pd.to_timedelta(rng.integers(-60, 5 * 365, n_rows), unit="D")
+    df = pd.DataFrame({
+        "doc_no": [f"SO-{i:06d}" for i in range(n_rows)],
+        "term_name": "尾款",
+        "expected_date": days.strftime("%Y-%m-%d"),
+        "amount": rng.integers(1000, 100000, n_rows).astype(float),
+        "project_code": [f"P{i:03d}" for i in rng.integers(0, 300, n_rows)],
+        "partner": [f"Partner {i:03d}" for i in rng.integers(0, 500, n_rows)],
+    })
+    t0 = time.perf_counter()
+    res = summarize(df, today)
+    dt = time.perf_counter() - t0
+    print(f"summarize(): {n_rows:,} rows, {len(res['due'])} due, {len(res['overdue']):,} overdue, "
+          f"{len(res['by_partner'])} partners in {dt * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -31,6 +31,7 @@ menu = {
     "crm": "👥 合作夥伴管理",
     "project": "🚀 專案身分建檔",
     "matrix": "📅 專案36個月預算",
+    "cashflow": "💵 現金流規劃",
     "so": "📝 銷售訂單 (SO)", 
     "po": "🛒 採購訂單 (PO)",
     "inventory": "📦 倉儲與庫存", # (雖然還沒實作，先留著位子)
@@ -45,16 +46,49 @@ choice = [k for k, v in menu.items() if v == choice_label][0]
 # --- 路由分發 ---
 try:
     if choice == "home":
+        import aging_engine
         st.title("🏠 財務任務中心 (Financial Task Center)")
+        try:
+            ledgers = {k: aging_engine.ledger(supabase, k) for k in ("ar", "ap")}
+        except Exception as e:
+            st.error(f"應收/應付資料讀取失敗: {e}")
+            ledgers = {}
+
+        due_cols = {"doc_no": "單號", "partner": "對象", "project_code": "專案", "term_name": "期數", "expected_date": "預計日期", "amount": "金額"}
         c1, c2 = st.columns(2)
-        with c1:
-            with st.container(border=True):
-                st.subheader("📥 本月應開立發票 (AR)")
-                st.caption("連動 SO 模組開發中...")
-        with c2:
-            with st.container(border=True):
-                st.subheader("📤 本月應付帳款 (AP)")
-                st.caption("連動 PO 模組開發中...")
+        for col, kind, title in ((c1, "ar", "📥 本月應開立發票 (AR)"), (c2, "ap", "📤 本月應付帳款 (AP)")):
+            with col:
+                with st.container(border=True):
+                    st.subheader(title)
+                    led = ledgers.get(kind)
+                    if not led: continue
+                    m1, m2 = st.columns(2)
+                    m1.metric("本月到期", f"${led['due_total']:,.0f}", f"{len(led['due'])} 筆", delta_color="off")
+                    m2.metric("已逾期 (未結)" if led["paid_tracked"] else "已過預計日 (排程)",
+                              f"${led['overdue_total']:,.0f}", f"{len(led['overdue'])} 筆", delta_color="off")
+                    if not led["paid_tracked"]:
+                        st.caption(f"尚無實收/實付登錄：只列出 {led['date_from']} 起預計日已過的排程期數，不代表實際未收付")
+                    if led["due"].empty:
+                        st.caption("本月沒有到期款項")
+                    else:
+                        st.dataframe(led["due"][list(due_cols)].rename(columns=due_cols), hide_index=True, use_container_width=True,
+                                     column_config={"金額": st.column_config.NumberColumn(format="%,.0f")})
+
+        if ledgers:
+            st.markdown("### ⏳ 帳齡分析 (逾期天數)")
+            st.caption(f"涵蓋預計日期在回溯 {aging_engine.LOOKBACK_DAYS} 天內的款項；未登錄實收/實付的一方以排程期數計")
+            tab_ar, tab_ap = st.tabs(["📥 應收 (AR)", "📤 應付 (AP)"])
+            for tab, kind in ((tab_ar, "ar"), (tab_ap, "ap")):
+                with tab:
+                    led = ledgers[kind]
+                    if led["overdue"].empty:
+                        st.success("沒有逾期款項")
+                        continue
+                    v1, v2 = st.columns(2)
+                    v1.caption("依往來對象")
+                    v1.dataframe(led["by_partner"].rename_axis("對象").style.format("{:,.0f}"), use_container_width=True)
+                    v2.caption("依專案")
+                    v2.dataframe(led["by_project"].rename_axis("專案").style.format("{:,.0f}"), use_container_width=True)
 
     elif choice == "crm":
         import mod_crm
@@ -68,6 +102,10 @@ try:
         import mod_matrix
         mod_matrix.show(supabase)
 
+    elif choice == "cashflow":
+        import mod_cashflow
+        mod_cashflow.show(supabase, "HTT")
+
     elif choice == "so":
         import mod_so
         mod_so.show(supabase)
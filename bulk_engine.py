@@ -0,0 +1,175 @@
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# --- 大量寫入 (Bulk Writer) ---
+# 1. 資料切塊後由有上限的 thread pool 並行送出
+# 2. 塊大小依實際回應時間自動調整：太快就加大、太慢或逾時就縮小
+# 3. 暫時性錯誤 (逾時、連線中斷、5xx、429、死結) 以指數退避重試；
+#    單塊失敗不會中止其他塊，最後回報失敗筆數
+# upsert 以衝突鍵為準 (例如 project_code, year_month, cost_item)，重送同一塊是安全的；
+# 沒有 on_conflict 的純 insert 逾時後可能其實已寫入，重送會產生重複列，所以不重試、也不拆塊重送
+# (唯一例外是 413：請求在伺服器處理前就被拒絕)。
+
+BULK_CHUNK = 500         # 初始塊大小
+BULK_MIN_CHUNK = 50
+BULK_MAX_CHUNK = 2000
+BULK_TARGET_SEC = 1.0    # 希望每個請求大約花多久
+BULK_WORKERS = 4
+BULK_RETRIES = 3
+BULK_BACKOFF = 0.5       # 第 n 次重試等 BACKOFF * 2^(n-1) 秒 (加上隨機抖動)
+
+TRANSIENT_CODES = {"57014", "40001", "40P01", "53300", "PGRST000", "PGRST001", "PGRST002", "PGRST003"}
+TRANSIENT_HINTS = ("timed out", "timeout", "connection", "temporarily", "502", "503", "504", "429")
+
+def is_transient(e):
+    code = str(getattr(e, "code", "") or "")
+    if code in TRANSIENT_CODES or code.startswith("5") or code == "429":
+        return True
+    name = type(e).__name__.lower()
+    if "timeout" in name or "network" in name or "connect" in name or "protocol" in name:
+        return True
+    msg = str(e).lower()
+    return any(h in msg for h in TRANSIENT_HINTS)
+
+def is_rejected_size(e):
+    # 請求太大被拒 (413)：伺服器沒有處理，任何寫入都可以拆塊重送
+    msg = str(e).lower()
+    return "413" in msg or "too large" in msg
+
+def is_too_large(e):
+    # 請求太大 / 逾時時縮小該塊重送
+    msg = str(e).lower()
+    return is_rejected_size(e) or "timeout" in msg or "timed out" in msg or str(getattr(e, "code", "")) == "57014"
+
+class ChunkSizer:
+    # 依最近一次的耗時調整下一塊大小
+    def __init__(self, size=BULK_CHUNK, lo=BULK_MIN_CHUNK, hi=BULK_MAX_CHUNK, target=BULK_TARGET_SEC):
+        self.size, self.lo, self.hi, self.target = size, lo, hi, target
+
+    def observe(self, rows, seconds):
+        if rows < self.size // 2:
+            return  # 最後一塊通常比較小，不拿來估算
+        if seconds < self.target / 2:
+            self.size = min(self.hi, self.size * 2)
+        elif seconds > self.target:
+            self.size = max(self.lo, int(self.size * self.target / seconds))
+
+    def shrink(self):
+        self.size = max(self.lo, self.size // 2)
+
+def _send(supabase, table, rows, on_conflict, retries, backoff):
+    # 回傳 (耗時秒數, 重試次數)；重試用完仍失敗時丟出最後的錯誤
+    attempt = 0
+    while True:
+        t0 = time.perf_counter()
+        try:
+            q = supabase.table(table)
+            if on_conflict:
+                q.upsert(rows, on_conflict=on_conflict).execute()
+            else:
+                q.insert(rows).execute()
+            return time.perf_counter() - t0, attempt
+        except Exception as e:
+            attempt += 1
+            if not on_conflict or attempt > retries or not is_transient(e):
+                e.retries = attempt - 1
+                raise
+            time.sleep(backoff * 2 ** (attempt - 1) * (1 + random.random() * 0.25))
+
+def bulk_write(supabase, table, rows, on_conflict=None, progress=None,
+               chunk_size=BULK_CHUNK, workers=BULK_WORKERS, retries=BULK_RETRIES, backoff=BULK_BACKOFF, adaptive=True):
+    # progress(done_rows, total_rows) 只在呼叫端的 thread 執行 (可直接更新 st.progress)
+    # 回傳 {"rows", "chunks", "retries", "failed": [(筆數, 錯誤)], "failed_rows"}
+    total = len(rows)
+    stats = {"rows": 0, "chunks": 0, "retries": 0, "failed": [], "failed_rows": 0}
+    if not total:
+        return stats
+
+    sizer = ChunkSizer(size=chunk_size)
+    pending = []   # 要重送的較小塊 (拆半後)
+    offset = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        inflight = {}
+        while offset < total or pending or inflight:
+            while len(inflight) < workers and (pending or offset < total):
+                if pending:
+                    chunk = pending.pop()
+                else:
+                    chunk = rows[offset:offset + sizer.size]
+                    offset += len(chunk)
+                inflight[pool.submit(_send, supabase, table, chunk, on_conflict, retries, backoff)] = chunk
+
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for f in done:
+                chunk = inflight.pop(f)
+                try:
+                    seconds, n_retry = f.result()
+                except Exception as e:
+                    stats["retries"] += getattr(e, "retries", 0)
+                    resend = is_too_large(e) if on_conflict else is_rejected_size(e)
+                    if resend and len(chunk) > BULK_MIN_CHUNK:
+                        sizer.shrink()
+                        half = len(chunk) // 2
+                        pending += [chunk[:half], chunk[half:]]
+                        continue
+                    stats["failed"].append((len(chunk), str(e)))
+                    stats["failed_rows"] += len(chunk)
+                else:
+                    if adaptive: sizer.observe(len(chunk), seconds)
+                    stats["rows"] += len(chunk)
+                    stats["chunks"] += 1
+                    stats["retries"] += n_retry
+                if progress:
+                    progress(stats["rows"] + stats["failed_rows"], total)
+    return stats
+
+def upsert_matrix(supabase, rows, progress=None, **kw):
+    return bulk_write(supabase, "project_matrix", rows, on_conflict="project_code, year_month, cost_item", progress=progress, **kw)
+
+# --- 效能測試 (python bulk_engine.py [筆數])：模擬每請求 80ms + 每列 0.2ms，10% 暫時性失敗 ---
+def _benchmark(n_rows=20000):
+    import threading
+
+    class _Request:
+        def __init__(self, client, rows):
+            self.client, self.rows = client, rows
+        def execute(self):
+            time.sleep(0.08 + 0.0002 * len(self.rows))
+            if random.random() < self.client.fail_rate:
+                raise TimeoutError("simulated timeout")
+            with self.client.lock:
+                self.client.rows += len(self.rows)
+
+    class _Flaky:
+        def __init__(self, fail_rate):
+            self.fail_rate, self.lock, self.rows = fail_rate, threading.Lock(), 0
+        def table(self, name):
+            return self
+        def upsert(self, rows, on_conflict=None):
+            return _Request(self, rows)
+        def insert(self, rows):
+            return _Request(self, rows)
+
+    rows = [{"project_code": "P", "year_month": i, "cost_item": "x", "plan_amount": i} for i in range(n_rows)]
+    for label, kw in (("sequential 100", {"chunk_size": 100, "workers": 1, "adaptive": False}),
+                      ("adaptive x1", {"workers": 1}),
+                      (f"adaptive x{BULK_WORKERS}", {})):
+        random.seed(0)
+        client = _Flaky(0.1)
+        t0 = time.perf_counter()
+        stats = bulk_write(client, "project_matrix", rows, on_conflict="k", backoff=0.05, **kw)
+        dt = time.perf_counter() - t0
+        print(f"{label:14s}: {n_rows} rows in {dt:.2f} s, {stats['chunks']} chunks, "
+              f"{stats['retries']} retries, {stats['failed_rows']} failed, stored {client.rows}")
+
+    # 純 insert (沒有衝突鍵)：逾時可能已寫入，不重試，失敗的塊直接回報
+    random.seed(0)
+    client = _Flaky(0.1)
+    stats = bulk_write(client, "project_matrix", rows, backoff=0.05)
+    assert stats["retries"] == 0 and stats["rows"] + stats["failed_rows"] == n_rows
+    print(f"{'insert (no key)':14s}: {stats['retries']} retries, {stats['failed_rows']} failed, stored {client.rows}")
+
+if __name__ == "__main__":
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
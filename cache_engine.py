@@ -0,0 +1,115 @@
+import threading
+import streamlit as st
+import list_engine
+
+# --- 跨 Session 參考資料快取 ---
+# 專案、夥伴、公司設定、SO/PO 單號清單每次 rerun 都在重查。
+# 這裡用 st.cache_data 做全程序共用快取 (含 TTL)，並以「版本戳記」做寫入即失效：
+# 任何存檔/刪除路徑呼叫 bump(table)，該表版本 +1，下一次查詢的快取 key 就會不同。
+
+DEFAULT_TTL = 600  # 秒；即使沒人 bump，最多 10 分鐘也會自動重抓
+
+@st.cache_resource
+def _version_store():
+    return {"lock": threading.Lock(), "versions": {}}
+
+def version(table):
+    return _version_store()["versions"].get(table, 0)
+
+def bump(*tables):
+    store = _version_store()
+    with store["lock"]:
+        for t in tables:
+            store["versions"][t] = store["versions"].get(t, 0) + 1
+
+# 分頁游標欄位 (必須唯一)：PostgREST 單次最多回 max-rows (1000) 筆，整表查詢以 keyset 逐頁讀完
+TABLE_KEYS = {
+    "projects": "project_code",
+    "partners": "id",
+    "company_settings": "id",
+    "sales_orders": "so_number",
+    "purchase_orders": "po_number",
+    "supplier_exposure": "supplier_id",
+}
+
+def _with_column(columns, col):
+    cols = [c.strip() for c in columns.split(",")]
+    return columns if "*" in cols or col in cols else f"{columns}, {col}"
+
+def _sort_rows(rows, order, desc):
+    # 排序欄位可能為 null：有值的依序排列，null 一律放最後
+    filled = sorted((r for r in rows if r.get(order) is not None), key=lambda r: r[order], reverse=desc)
+    return filled + [r for r in rows if r.get(order) is None]
+
+@st.cache_data(ttl=DEFAULT_TTL, show_spinner=False)
+def _cached_select(table, columns, filters, order, desc, limit, ver, _supabase):
+    def make_query():
+        q = _supabase.table(table).select(columns)
+        for op, col, val in filters:
+            q = getattr(q, op)(col, val)
+        return q
+    if limit:
+        # 限筆數的查詢 (例如公司設定) 只需一次請求
+        q = make_query()
+        if order:
+            q = q.order(order, desc=desc)
+        return q.limit(limit).execute().data or []
+    if table not in TABLE_KEYS:
+        raise ValueError(f"cache_engine.select: {table} 未設定分頁欄位 (TABLE_KEYS)，無法完整讀取")
+    key = TABLE_KEYS[table]
+    # 游標與排序欄位一定要在回傳資料內 (make_query 於逐頁呼叫時才讀 columns)
+    columns = _with_column(columns, key)
+    if order:
+        columns = _with_column(columns, order)
+    rows = list_engine.fetch_all(make_query, [(key, False)])
+    return _sort_rows(rows, order, desc) if order else rows
+
+def select(supabase, table, columns="*", filters=(), order=None, desc=False, limit=None, depends=()):
+    # filters: (("eq", "type", "Supplier"), ...)
+    # depends: 嵌入關聯的表 (例如 partners(name))，其版本變動也要讓快取失效
+    # 未指定 limit 時回傳全部符合的列 (分頁讀取)；order 在讀完後於本地排序
+    ver = tuple(version(t) for t in (table, *depends))
+    return _cached_select(table, columns, tuple(filters), order, desc, limit, ver, supabase)
+
+# --- 常用參考表 ---
+def get_projects(supabase, columns="project_code, project_name"):
+    depends = ("partners",) if "partners(" in columns else ()
+    return select(supabase, "projects", columns, depends=depends)
+
+def get_partners(supabase, columns="id, name", p_type=None):
+    filters = (("eq", "type", p_type),) if p_type else ()
+    return select(supabase, "partners", columns, filters)
+
+def get_company_settings(supabase):
+    rows = select(supabase, "company_settings", "*", limit=1)
+    return rows[0] if rows else {}
+
+def get_so_numbers(supabase):
+    return [o["so_number"] for o in select(supabase, "sales_orders", "so_number", order="created_at", desc=True)]
+
+def get_po_numbers(supabase):
+    return [p["po_number"] for p in select(supabase, "purchase_orders", "po_number", order="created_at", desc=True)]
+
+# --- 單據快照 (表頭 + 所有子表，一次 embedded 查詢) ---
+# 表單、匯出、Invoice 共用同一份；以 (單號, 版本) 為 key，存檔 bump 後自動換新。
+PO_DOC_COLUMNS = "*, partners(*), po_items(*), po_provided_materials(*), po_payments(*)"
+SO_DOC_COLUMNS = "*, so_items(*), so_payments(*)"
+
+def _sort_children(doc, *children):
+    # embedded 子表沒有保證順序，依 id 排回輸入順序
+    for c in children:
+        doc[c] = sorted(doc.get(c) or [], key=lambda r: r.get("id") or 0)
+    return doc
+
+def get_po_doc(supabase, po_no):
+    rows = select(supabase, "purchase_orders", PO_DOC_COLUMNS, (("eq", "po_number", po_no),), depends=("partners",))
+    if not rows: return None
+    return _sort_children(rows[0], "po_items", "po_provided_materials", "po_payments")
+
+def get_so_doc(supabase, so_no):
+    rows = select(supabase, "sales_orders", SO_DOC_COLUMNS, (("eq", "so_number", so_no),))
+    if not rows: return None
+    doc = _sort_children(rows[0], "so_items", "so_payments")
+    cust = select(supabase, "partners", "*", (("eq", "id", doc["cust_id"]),)) if doc.get("cust_id") else []
+    doc["partners"] = cust[0] if cust else {}
+    return doc
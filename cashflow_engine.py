@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+import cache_engine
+import list_engine
+
+# --- 現金流預測引擎 ---
+# 1. so_payments (流入) / po_payments (流出) 以 keyset 分頁逐頁讀取，每頁只留需要的三個欄位
+# 2. 月份、專案各自轉成整數索引，一次 bincount 彙總成 專案 x 月份 矩陣 (不逐列迴圈)
+# 3. 結果以 (起始月, 期間, SO/PO 版本) 快取，沒有新存檔時直接取用
+
+# fetch_page 會多要 1 筆判斷有沒有下一頁，必須低於 PostgREST max-rows (預設 1000)，
+# 否則伺服器截到 1000 筆時永遠判斷成「最後一頁」，後面的資料會被默默丟掉
+PAGE_SIZE = 500
+PAY_KEYS = [("expected_date", False), ("id", False)]
+HORIZONS = [6, 12, 18, 24, 36]
+
+def month_index(dates, start):
+    # 日期 -> 相對 start 的月份序號 (start 當月 = 0)
+    d = pd.to_datetime(pd.Series(dates), errors="coerce", format="ISO8601")
+    start = pd.Timestamp(start)
+    idx = (d.dt.year - start.year) * 12 + (d.dt.month - start.month)
+    return idx.fillna(-1).astype(int).to_numpy()
+
+def month_labels(start, horizon):
+    return pd.date_range(pd.Timestamp(start).replace(day=1), periods=horizon, freq="MS").strftime("%Y-%m").tolist()
+
+def stream_payments(make_query, parent, start, end, page_size=PAGE_SIZE):
+    # make_query(): 每頁重新建立的 select builder (postgrest builder 會累加條件，不能重用)
+    # 逐頁產生 (日期, 金額, 專案) 三個 list
+    cursor = None
+    while True:
+        q = make_query().gte("expected_date", str(start)).lt("expected_date", str(end))
+        rows, cursor = list_engine.fetch_page(q, PAY_KEYS, cursor, page_size)
+        if rows:
+            yield (
+                [r["expected_date"] for r in rows],
+                [r.get("amount") or 0 for r in rows],
+                [(r.get(parent) or {}).get("project_code") or "" for r in rows],
+            )
+        if cursor is None:
+            break
+
+def collect(pages):
+    dates, amounts, projects = [], [], []
+    for d, a, p in pages:
+        dates += d; amounts += a; projects += p
+    return pd.DataFrame({"expected_date": dates, "amount": pd.to_numeric(pd.Series(amounts, dtype="object"), errors="coerce"), "project_code": projects})
+
+def bucket(df, start, horizon, projects):
+    # projects: pd.Index；回傳 (專案數 x 期間) 的金額矩陣，超出期間的列丟掉
+    out = np.zeros((len(projects), horizon))
+    if df.empty:
+        return out
+    m = month_index(df["expected_date"], start)
+    p = projects.get_indexer(df["project_code"])
+    amt = df["amount"].fillna(0.0).to_numpy(dtype=float)
+    ok = (m >= 0) & (m < horizon) & (p >= 0)
+    flat = np.bincount(p[ok] * horizon + m[ok], weights=amt[ok], minlength=len(projects) * horizon)
+    return flat.reshape(len(projects), horizon)
+
+def project(df_in, df_out, start, horizon):
+    # 回傳 {"monthly": 月份彙總, "cash_in": 專案 x 月份, "cash_out": 專案 x 月份}
+    projects = pd.Index(pd.concat([df_in["project_code"], df_out["project_code"]]).unique()).sort_values()
+    labels = month_labels(start, horizon)
+    cin = bucket(df_in, start, horizon, projects)
+    cout = bucket(df_out, start, horizon, projects)
+    net = cin.sum(axis=0) - cout.sum(axis=0)
+    monthly = pd.DataFrame({
+        "月份": labels,
+        "現金流入": cin.sum(axis=0),
+        "現金流出": cout.sum(axis=0),
+        "淨現金流": net,
+        "累計淨現金流": np.cumsum(net),
+    })
+    return {
+        "monthly": monthly,
+        "cash_in": pd.DataFrame(cin, index=projects.rename("專案"), columns=labels),
+        "cash_out": pd.DataFrame(cout, index=projects.rename("專案"), columns=labels),
+    }
+
+@st.cache_data(ttl=cache_engine.DEFAULT_TTL, show_spinner=False)
+def _cached_projection(start, horizon, ver, _supabase):
+    end = (pd.Timestamp(start) + pd.DateOffset(months=horizon)).strftime("%Y-%m-%d")
+    df_in = collect(stream_payments(
+        lambda: _supabase.table("so_payments").select("id, expected_date, amount, sales_orders!inner(project_code)"),
+        "sales_orders", start, end))
+    df_out = collect(stream_payments(
+        lambda: _supabase.table("po_payments").select("id, expected_date, amount, purchase_orders!inner(project_code)"),
+        "purchase_orders", start, end))
+    result = project(df_in, df_out, start, horizon)
+    result["rows"] = (len(df_in), len(df_out))
+    return result
+
+def projection(supabase, start, horizon):
+    # start: 起始月第一天 (date / "YYYY-MM-01")；SO/PO 存檔 bump 後版本改變，快取自動換新
+    ver = (cache_engine.version("sales_orders"), cache_engine.version("purchase_orders"))
+    start = pd.Timestamp(start).replace(day=1).strftime("%Y-%m-%d")
+    return _cached_projection(start, int(horizon), ver, supabase)
+
+def with_position(monthly, opening=0.0, fixed_out=0.0):
+    # 加上期初現金與每月固定支出 (薪資/營運/稅)，算出每月底現金部位
+    df = monthly.copy()
+    df["固定支出"] = float(fixed_out)
+    df["淨現金流"] = df["現金流入"] - df["現金流出"] - df["固定支出"]
+    df["累計淨現金流"] = df["淨現金流"].cumsum()
+    df["月底現金部位"] = float(opening) + df["累計淨現金流"]
+    return df
+
+# --- 效能測試 (python cashflow_engine.py [筆數]) ---
+def _check_paging(n_rows=2500, max_rows=1000):
+    # 跨過多個分頁 (且超過伺服器 max-rows) 時要讀到每一筆
+    rows = [{"id": i, "expected_date": f"2026-{i % 12 + 1:02d}-01", "amount": 1, "sales_orders": {"project_code": "P"}}
+            for i in range(n_rows)]
+    got = sum(len(d) for d, _, _ in stream_payments(lambda: list_engine._CappedQuery(rows, PAY_KEYS, max_rows), "sales_orders", "2026-01-01", "2027-01-01"))
+    assert got == n_rows, f"paging lost rows: {got} of {n_rows}"
+    print(f"stream_payments(): {got:,} of {n_rows:,} rows across pages of {PAGE_SIZE} (server max-rows {max_rows})")
+
+def _benchmark(n_rows=50000, horizon=36):
+    import time
+    _check_paging()
+    rng = np.random.default_rng(0)
+    start = "2026-01-01"
+    days = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, horizon * 30, n_rows), unit="D")
+    make = lambda: pd.DataFrame({
+        "expected_date": days.strftime("%Y-%m-%d"),
+        "amount": rng.integers(1000, 100000, n_rows).astype(float),
+        "project_code": [f"P{i:03d}" for i in rng.integers(0, 300, n_rows)],
+    })
+    df_in, df_out = make(), make()
+    t0 = time.perf_counter()
+    res = project(df_in, df_out, start, horizon)
+    dt = time.perf_counter() - t0
+    print(f"project(): {n_rows:,} in + {n_rows:,} out rows, {len(res['cash_in'])} projects x {horizon} months "
+          f"in {dt * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
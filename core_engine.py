@@ -1,13 +1,89 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 from supabase import create_client
 
+try:
+    import httpx
+    from supabase import ClientOptions
+except ImportError:  # 舊版 supabase 沒有 httpx_client 選項，退回預設連線
+    httpx = None
+    ClientOptions = None
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:
+    add_script_run_ctx = get_script_run_ctx = None
+
 # --- 1. 資料庫連線核心 ---
+# 全程序只建一個 client (st.cache_resource)，底層 httpx 連線池 keep-alive，
+# 每次 rerun 重用同一組 TCP/TLS 連線；健康檢查失敗時自動重建。
+POOL_MAX_CONNECTIONS = 20
+POOL_MAX_KEEPALIVE = 10
+POOL_KEEPALIVE_EXPIRY = 60   # 秒
+REQUEST_TIMEOUT = 30         # 秒
+HEALTH_CHECK_INTERVAL = 60   # 秒；兩次健康檢查之間直接信任 client
+
+_health = {"checked_at": 0.0}
+_http = {"client": None}     # 目前 supabase client 底層的 httpx 連線池，重建前要關掉
+
+def _build_client(url, key):
+    if httpx is None or ClientOptions is None:
+        return create_client(url, key)
+    http = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=POOL_MAX_KEEPALIVE,
+            keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+        ),
+        timeout=REQUEST_TIMEOUT,
+    )
+    try:
+        options = ClientOptions(httpx_client=http, postgrest_client_timeout=REQUEST_TIMEOUT)
+    except TypeError:
+        http.close()
+        return create_client(url, key)
+    client = create_client(url, key, options=options)
+    _http["client"] = http
+    return client
+
+def _close_http():
+    http, _http["client"] = _http["client"], None
+    if http is not None:
+        try: http.close()
+        except Exception as e: print(f"關閉舊連線池失敗: {e}")
+
+def _is_healthy(client):
+    now = time.monotonic()
+    if now - _health["checked_at"] < HEALTH_CHECK_INTERVAL:
+        return True
+    try:
+        client.table("company_settings").select("id").limit(1).execute()
+        _health["checked_at"] = now
+        return True
+    except Exception as e:
+        print(f"Supabase 健康檢查失敗，重新建立連線: {e}")
+        # 舊 client 即將被 cache_resource 丟棄，先釋放它的連線 (socket) 再重建
+        _close_http()
+        return False
+
+@st.cache_resource(validate=_is_healthy, show_spinner=False)
+def _get_client(url, key):
+    _health["checked_at"] = time.monotonic()
+    return _build_client(url, key)
+
 def init_connection():
     try:
         # 這裡會抓取 secrets.toml 的設定
         url = st.secrets["supabase"]["url"]
         key = st.secrets["supabase"]["key"]
-        return create_client(url, key)
+    except Exception as e:
+        # secrets 缺漏不快取，補上設定後下次 rerun 即可連線
+        print(f"Supabase 設定讀取失敗: {e}")
+        return None
+    try:
+        return _get_client(url, key)
     except Exception as e:
         # 避免在畫面顯示醜醜的錯誤，僅在 Dev 模式或 Console 顯示
         print(f"Supabase 連線失敗: {e}")
@@ -46,3 +122,47 @@ def apply_custom_style():
         }
         </style>
     """, unsafe_allow_html=True)
+
+# --- 4. 並行查詢 (Query Batch) ---
+# 頁面載入時互不相依的查詢改為同時送出，載入時間趨近最慢的那一支。
+# tasks: {"名稱": 無參數 callable}，回傳 {"名稱": 結果}；任一失敗即拋出第一個例外。
+QUERY_POOL_SIZE = 8
+
+@st.cache_resource(show_spinner=False)
+def _query_pool():
+    return ThreadPoolExecutor(max_workers=QUERY_POOL_SIZE, thread_name_prefix="htx-query")
+
+def run_queries(tasks):
+    if not tasks:
+        return {}
+    ctx = get_script_run_ctx() if get_script_run_ctx else None
+
+    def _run(fn):
+        # 讓 worker thread 掛上目前 session 的 context，st.cache_data 等才能正常運作
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return fn()
+
+    pool = _query_pool()
+    futures = {name: pool.submit(_run, fn) for name, fn in tasks.items()}
+    return {name: f.result() for name, f in futures.items()}
+
+# --- 5. PostgREST 錯誤判斷 (資料庫尚未套用 migration 時退回舊做法) ---
+MISSING_FN_CODES = {"PGRST202", "42883"}                 # 找不到函式 / undefined_function
+MISSING_RELATION_CODES = {"PGRST205", "PGRST200", "42P01"}  # 找不到表、view 或關聯 / undefined_table
+MISSING_COLUMN_CODES = {"42703", "PGRST204"}             # undefined_column / schema cache 沒有該欄位
+
+def error_code(e):
+    code = getattr(e, "code", None)
+    if code is None and e.args and isinstance(e.args[0], dict):
+        code = e.args[0].get("code")
+    return code
+
+def is_missing_function(e):
+    return error_code(e) in MISSING_FN_CODES or "Could not find the function" in str(e)
+
+def is_missing_relation(e):
+    return error_code(e) in MISSING_RELATION_CODES or "Could not find the table" in str(e)
+
+def is_missing_column(e):
+    return error_code(e) in MISSING_COLUMN_CODES or "does not exist" in str(e)
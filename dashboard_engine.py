@@ -0,0 +1,125 @@
+import pandas as pd
+import numpy as np
+
+# --- 全公司專案彙總引擎 ---
+# 依憲法科目編號分類：1.x = 訂單 (order)，2.x = 收入 (rev)，3.x = 費用 (cost)；與 SQL matrix_category 相同
+# 科目只有二十幾種，先對 unique 值分類一次，再用一次分組加總算完所有專案。
+
+def classify_items(cost_items):
+    codes, uniques = pd.factorize(pd.Series(cost_items, dtype="object"))
+    uniques = pd.Series(uniques, dtype="object")
+    labels = np.select(
+        [uniques.str.startswith("1."), uniques.str.startswith("2."), uniques.str.startswith("3.")],
+        ["order", "rev", "cost"],
+        default="other",
+    )
+    # factorize 把 NaN 標成 -1，對應到最後補上的 "other"
+    return np.append(labels, "other")[codes]
+
+def aggregate_matrix(df_matrix):
+    cols = ["plan_rev", "plan_cost", "real_rev", "real_cost"]
+    if df_matrix is None or df_matrix.empty:
+        return pd.DataFrame(columns=cols, dtype=float)
+
+    # 專案代碼 factorize 成整數後，用 bincount 一次加總所有專案
+    proj_codes, proj_index = pd.factorize(df_matrix["project_code"])
+    category = classify_items(df_matrix["cost_item"])
+    plan = pd.to_numeric(df_matrix["plan_amount"], errors="coerce").fillna(0.0).to_numpy()
+    real = pd.to_numeric(df_matrix["real_amount"], errors="coerce").fillna(0.0).to_numpy()
+
+    n = len(proj_index)
+    out = pd.DataFrame(index=pd.Index(proj_index, name="project_code"))
+    for cat in ("rev", "cost"):
+        mask = (category == cat) & (proj_codes >= 0)
+        out[f"plan_{cat}"] = np.bincount(proj_codes[mask], weights=plan[mask], minlength=n)
+        out[f"real_{cat}"] = np.bincount(proj_codes[mask], weights=real[mask], minlength=n)
+    return out[cols].astype(float)
+
+def aggregate_rollup(df_totals):
+    # rollup_engine.project_totals (專案 x 類別) -> 與 aggregate_matrix 相同欄位
+    cols = ["plan_rev", "plan_cost", "real_rev", "real_cost"]
+    if df_totals is None or df_totals.empty:
+        return pd.DataFrame(columns=cols, dtype=float)
+    wide = df_totals.pivot_table(index="project_code", columns="category", values=["plan_amount", "real_amount"], aggfunc="sum")
+    out = pd.DataFrame(index=wide.index)
+    for cat in ("rev", "cost"):
+        out[f"plan_{cat}"] = wide["plan_amount"][cat] if cat in wide["plan_amount"] else 0.0
+        out[f"real_{cat}"] = wide["real_amount"][cat] if cat in wide["real_amount"] else 0.0
+    return out[cols].fillna(0.0).astype(float)
+
+def _safe_ratio(num, den):
+    num = np.asarray(num, dtype=float)
+    den = np.asarray(den, dtype=float)
+    out = np.zeros_like(num)
+    np.divide(num, den, out=out, where=den != 0)
+    return out * 100
+
+def build_dashboard(df_proj, df_matrix=None, agg=None):
+    # agg: 已彙總好的專案總計 (aggregate_rollup)；沒有時由 df_matrix 原始格子計算
+    columns = [
+        "專案代碼", "專案名稱", "客戶",
+        "預算總收入", "預算總成本", "預算毛利 $", "預算毛利率 %",
+        "實際總收入", "實際總成本", "實際毛利 $", "實際毛利率 %", "達成率 (Rev)"
+    ]
+    if df_proj is None or df_proj.empty:
+        return pd.DataFrame(columns=columns)
+
+    if agg is None:
+        agg = aggregate_matrix(df_matrix)
+    agg = agg.reindex(df_proj["project_code"]).fillna(0.0)
+
+    if "partners" in df_proj.columns:
+        cust = df_proj["partners"].map(lambda p: p.get("name") if isinstance(p, dict) else None).fillna("未知")
+    else:
+        cust = pd.Series("未知", index=df_proj.index)
+
+    plan_rev = agg["plan_rev"].to_numpy()
+    plan_cost = agg["plan_cost"].to_numpy()
+    real_rev = agg["real_rev"].to_numpy()
+    real_cost = agg["real_cost"].to_numpy()
+    plan_profit = plan_rev - plan_cost
+    real_profit = real_rev - real_cost
+
+    return pd.DataFrame({
+        "專案代碼": df_proj["project_code"].to_numpy(),
+        "專案名稱": df_proj["project_name"].to_numpy(),
+        "客戶": cust.to_numpy(),
+        "預算總收入": plan_rev,
+        "預算總成本": plan_cost,
+        "預算毛利 $": plan_profit,
+        "預算毛利率 %": _safe_ratio(plan_profit, plan_rev),
+        "實際總收入": real_rev,
+        "實際總成本": real_cost,
+        "實際毛利 $": real_profit,
+        "實際毛利率 %": _safe_ratio(real_profit, real_rev),
+        "達成率 (Rev)": _safe_ratio(real_rev, plan_rev),
+    }, columns=columns)
+
+# --- 效能測試 (python dashboard_engine.py) ---
+def _benchmark(n_projects=500, n_months=36, n_items=22, repeat=5):
+    import time
+    rng = np.random.default_rng(0)
+    codes = [f"P{i:04d}" for i in range(n_projects)]
+    items = [f"2.{i} 收入" for i in range(n_items // 3)] + [f"3.{i} 費用" for i in range(n_items - n_items // 3 - 1)] + ["1.0 訂單總額 (PO Amount)"]
+    months = pd.date_range("2026-01-01", periods=n_months, freq="MS").strftime("%Y-%m-%d")
+
+    idx = pd.MultiIndex.from_product([codes, months, items], names=["project_code", "year_month", "cost_item"])
+    df_matrix = idx.to_frame(index=False)
+    df_matrix["plan_amount"] = rng.integers(0, 100000, len(df_matrix)).astype(float)
+    df_matrix["real_amount"] = rng.integers(0, 100000, len(df_matrix)).astype(float)
+    df_proj = pd.DataFrame({
+        "project_code": codes,
+        "project_name": [f"Project {c}" for c in codes],
+        "partners": [{"name": "Bench Co."}] * n_projects,
+    })
+
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        df_dash = build_dashboard(df_proj, df_matrix)
+        best = min(best, time.perf_counter() - t0)
+    print(f"build_dashboard: {n_projects} projects x {n_months} months x {n_items} items "
+          f"= {len(df_matrix):,} cells -> {len(df_dash)} rows, best of {repeat}: {best * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    _benchmark()
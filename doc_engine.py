@@ -0,0 +1,37 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+import streamlit as st
+
+# --- 單據產生快取 (Excel PO / 收貨單 ...) ---
+# 以「單據內容 + 公司設定」的 hash 當 key，相同內容只產生一次；
+# 全程序共用一個有上限的 LRU，超過上限時淘汰最久沒用的檔案。
+
+DOC_CACHE_SIZE = 64
+
+@st.cache_resource(show_spinner=False)
+def _doc_cache():
+    return {"lock": threading.Lock(), "lru": OrderedDict()}
+
+def content_hash(*parts):
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def render_cached(kind, renderer, doc_data, my_company):
+    # kind 區分不同單據 (同一張 PO 的 PO 與收貨單內容 hash 相同)
+    key = (kind, content_hash(doc_data, my_company))
+    cache = _doc_cache()
+    with cache["lock"]:
+        if key in cache["lru"]:
+            cache["lru"].move_to_end(key)
+            return cache["lru"][key]
+
+    data = renderer(doc_data, my_company)
+
+    with cache["lock"]:
+        cache["lru"][key] = data
+        cache["lru"].move_to_end(key)
+        while len(cache["lru"]) > DOC_CACHE_SIZE:
+            cache["lru"].popitem(last=False)
+    return data
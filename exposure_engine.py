@@ -0,0 +1,59 @@
+import cache_engine
+import core_engine
+
+# --- 供應商曝險帳 (Exposure Ledger) 讀取 ---
+# supplier_exposure 每家供應商一列 (未結採購額、已付款、曝險 = 兩者差額)，
+# 由資料庫觸發器隨 purchase_orders / po_payments 寫入增量維護 (sql/supplier_exposure.sql)。
+# 額度檢核只以 supplier_id 查一列；資料庫尚未建立曝險帳時，退回掃描該供應商的未結採購單。
+# 目前尚無付款登錄介面 (沒有任何路徑寫入 po_payments.paid_date)，paid 恆為 0，曝險即未結採購總額。
+
+EXPOSURE_TABLE = "supplier_exposure"
+REBUILD_FN = "rebuild_supplier_exposure"
+CLOSED_STATUSES = ("Closed", "Cancelled")   # 與 SQL po_is_open 相同
+DEPENDS = ("purchase_orders",)              # 存檔 / 刪單都會 bump purchase_orders
+EMPTY = {"committed": 0.0, "paid": 0.0, "exposure": 0.0, "po_count": 0}
+
+def _row(r):
+    committed, paid = float(r.get("committed") or 0), float(r.get("paid") or 0)
+    return {"committed": committed, "paid": paid, "exposure": committed - paid, "po_count": int(r.get("po_count") or 0)}
+
+def lookup(supabase, supplier_ids):
+    # 回傳 {supplier_id: {"committed", "paid", "exposure", "po_count"}}；沒有未結採購單的供應商不在結果內
+    ids = tuple(sorted({int(i) for i in supplier_ids if i is not None}))
+    if not ids: return {}
+    try:
+        rows = cache_engine.select(supabase, EXPOSURE_TABLE, "supplier_id, committed, paid, po_count",
+                                   (("in_", "supplier_id", ids),), depends=DEPENDS)
+    except Exception as e:
+        if not core_engine.is_missing_relation(e): raise
+        return _scan(supabase, ids)
+    return {r["supplier_id"]: _row(r) for r in rows}
+
+def get(supabase, supplier_id):
+    return lookup(supabase, [supplier_id]).get(supplier_id, dict(EMPTY))
+
+def _scan(supabase, ids):
+    # 舊資料庫：逐張加總未結採購單 (尚無付款登錄，已付款視為 0)
+    rows = cache_engine.select(supabase, "purchase_orders", "supplier_id, total_amount, status",
+                               (("in_", "supplier_id", ids),), depends=DEPENDS)
+    out = {}
+    for r in rows:
+        if r.get("status") in CLOSED_STATUSES: continue
+        e = out.setdefault(r["supplier_id"], {"committed": 0.0, "paid": 0.0, "po_count": 0})
+        e["committed"] += float(r.get("total_amount") or 0)
+        e["po_count"] += 1
+    return {k: _row(v) for k, v in out.items()}
+
+def projected(exposure, new_total, stored_total=0.0, same_supplier=True):
+    # 存檔後的曝險：編輯中的單據原本已計入曝險帳，先扣掉舊總額再加新總額
+    base = exposure["exposure"] - (float(stored_total or 0) if same_supplier else 0.0)
+    return base + float(new_total or 0)
+
+def utilisation(exposure, limit):
+    return exposure["exposure"] / limit if limit else None
+
+def reconcile(supabase):
+    # 從 purchase_orders / po_payments 全部重建，回傳供應商筆數
+    n = supabase.rpc(REBUILD_FN, {}).execute().data
+    cache_engine.bump(EXPOSURE_TABLE, *DEPENDS)
+    return n
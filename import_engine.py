@@ -0,0 +1,300 @@
+import io
+import numpy as np
+import pandas as pd
+import streamlit as st
+import bulk_engine
+import cache_engine
+
+# --- 批次匯入 (CSV / XLSX) ---
+# 1. 檔案分塊讀取 (CSV: read_csv chunksize；XLSX: openpyxl read_only 逐列串流)，記憶體只放一塊
+# 2. 每塊以向量化檢核 (必填、統編格式、檔案內重複、未知客戶/專案、數字與日期)，只保留被退回的列
+# 3. 合格列交給 bulk_engine 以既有衝突鍵批次 upsert (partners: name、projects: project_code)
+# 檔案內重複只記住已出現過的鍵 (不是整份資料)；退回明細最多保留 MAX_REPORT_ROWS 列，其餘只計數。
+
+CHUNK_ROWS = 5000
+MAX_REPORT_ROWS = 1000
+LOOKUP_CHUNK = 200   # 客戶/專案存在檢查：每次 in_ 查詢最多帶幾個值 (URL 長度)
+TAX_ID_PATTERN = r"^(?:\d{8}|[A-Za-z]{2}-?[A-Za-z0-9]{4,20})$"   # 台灣統編 8 碼，或國別碼開頭的外國稅號
+PARTNER_TYPES = {"Customer": "Customer", "Supplier": "Supplier", "客戶": "Customer", "供應商": "Supplier"}
+TRADE_MODES = ["收訂金", "月結30", "月結60", "其他"]
+ORDER_GRADES = ["A", "B", "C", "D"]
+
+# kind -> 匯入設定；columns: 資料庫欄位 -> 可接受的表頭 (英文欄位名或表單上的中文標籤)
+SPECS = {
+    "partners": {
+        "label": "合作夥伴", "table": "partners", "on_conflict": "name", "key": ["name"], "bump": ["partners"],
+        "required": ["type", "name"],
+        "sparse": ["credit_limit"],   # 空白不送出，不會把既有額度清成空值 / 0
+        "columns": {
+            "type": ["身分"], "name": ["公司名稱"], "nationality": ["國籍"], "tax_id": ["統編"],
+            "company_address": ["公司地址"], "credit_limit": ["交易上限"], "trade_items": ["交易項目"],
+            "company_phone": ["總機"], "company_email": ["公司通用電郵"],
+            "finance_person": ["財務窗口"], "finance_email": ["財務電郵"], "finance_phone": ["財務電話"],
+            "contact_person": ["業務窗口"], "contact_email": ["業務電郵"], "contact_mobile": ["業務手機"],
+        },
+    },
+    "projects": {
+        "label": "專案", "table": "projects", "on_conflict": "project_code", "key": ["project_code"], "bump": ["projects"],
+        "required": ["project_code", "project_name", "customer"],
+        "columns": {
+            "project_code": ["專案代號"], "project_name": ["專案名稱"], "customer": ["客戶"],
+            "order_grade": ["訂單等級"], "trade_mode": ["交易模式"], "start_date": ["開案日"], "end_date": ["預計結案日"],
+        },
+    },
+    "project_items": {
+        # 需要 (project_code, item_name) 唯一索引，見 sql/import_keys.sql
+        "label": "專案產品清單", "table": "project_items", "on_conflict": "project_code, item_name",
+        "key": ["project_code", "item_name"], "bump": ["projects"],
+        "required": ["project_code", "item_name", "quantity"],
+        "columns": {"project_code": ["專案代號"], "item_name": ["產品項目名稱"], "quantity": ["件數"]},
+    },
+}
+
+# --- 讀檔 ---
+def _read_csv(f, chunk_rows):
+    yield from pd.read_csv(f, dtype=str, keep_default_na=False, chunksize=chunk_rows, encoding="utf-8-sig")
+
+def _read_xlsx(f, chunk_rows):
+    import openpyxl  # 只有匯入 Excel 才需要
+    wb = openpyxl.load_workbook(f, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else "" for h in next(rows, [])]
+        buf = []
+        for r in rows:
+            buf.append(["" if v is None else str(v) for v in r[:len(header)]])
+            if len(buf) >= chunk_rows:
+                yield pd.DataFrame(buf, columns=header)
+                buf = []
+        if buf:
+            yield pd.DataFrame(buf, columns=header)
+    finally:
+        wb.close()
+
+def read_chunks(f, name, chunk_rows=CHUNK_ROWS):
+    # 依副檔名分塊讀取；每塊欄位皆為字串
+    reader = _read_xlsx if str(name).lower().endswith((".xlsx", ".xlsm")) else _read_csv
+    start = 0
+    for df in reader(f, chunk_rows):
+        df.index = pd.RangeIndex(start + 2, start + 2 + len(df))   # Excel 列號 (第 1 列為表頭)
+        start += len(df)
+        yield df
+
+def normalize(df, spec):
+    # 表頭對應到資料庫欄位；回傳 (補齊所有欄位的 DataFrame, 檔案內實際有的欄位)
+    alias = {}
+    for col, names in spec["columns"].items():
+        for n in [col, *names]:
+            alias[n.strip().lower()] = col
+    mapped = {c: alias.get(str(c).strip().lower()) for c in df.columns}
+    keep = [c for c in df.columns if mapped[c]]
+    df = df[keep].rename(columns=mapped)
+    df = df.loc[:, ~df.columns.duplicated()]
+    present = [c for c in spec["columns"] if c in df.columns]
+    df = df.reindex(columns=list(spec["columns"]), fill_value="")
+    return df.apply(lambda s: s.astype(str).str.strip()), present
+
+# --- 檢核 (每個規則一次處理整塊) ---
+class Validator:
+    def __init__(self, kind, customers=None, projects=None):
+        self.kind, self.spec = kind, SPECS[kind]
+        self.customers = customers or {}            # 客戶名稱 -> id
+        self.projects = set(projects or ())
+        self.looked_up = set()                      # 已向資料庫查過的客戶名稱 / 專案代號
+        self.seen = set()                           # 檔案內已出現的鍵
+
+    def check(self, df):
+        # 回傳 (合格列 payload DataFrame, 退回原因 Series)
+        reasons = pd.Series("", index=df.index, dtype=object)
+        def flag(mask, msg):
+            nonlocal reasons
+            mask = np.asarray(mask, dtype=bool)
+            reasons = reasons.mask(mask, reasons + np.where(reasons == "", "", "; ") + msg)
+
+        for col in self.spec["required"]:
+            flag(df[col] == "", f"缺少 {col}")
+        out = df.copy()
+
+        if self.kind == "partners":
+            out["type"] = df["type"].map(PARTNER_TYPES)
+            flag((df["type"] != "") & out["type"].isna(), "身分需為 Customer / Supplier")
+            flag((df["tax_id"] != "") & ~df["tax_id"].str.match(TAX_ID_PATTERN), "統編格式錯誤")
+            out["credit_limit"] = pd.to_numeric(df["credit_limit"].str.replace(",", ""), errors="coerce")
+            flag((df["credit_limit"] != "") & ~(out["credit_limit"] >= 0), "交易上限需為非負數字")
+
+        elif self.kind == "projects":
+            out["cust_id"] = df["customer"].map(self.customers).astype("Int64")
+            flag((df["customer"] != "") & out["cust_id"].isna(), "未知客戶")
+            flag((df["order_grade"] != "") & ~df["order_grade"].isin(ORDER_GRADES), "訂單等級需為 A-D")
+            flag((df["trade_mode"] != "") & ~df["trade_mode"].isin(TRADE_MODES), "交易模式不在清單內")
+            for c in ("start_date", "end_date"):
+                d = pd.to_datetime(df[c], errors="coerce", format="mixed")
+                flag((df[c] != "") & d.isna(), f"{c} 日期格式錯誤")
+                out[c] = d.dt.strftime("%Y-%m-%d")
+            out = out.drop(columns=["customer"])
+
+        elif self.kind == "project_items":
+            q = pd.to_numeric(df["quantity"], errors="coerce")
+            flag((df["quantity"] != "") & ~((q >= 1) & (q == q.round())), "件數需為正整數")
+            out["quantity"] = q.round().astype("Int64")
+            flag((df["project_code"] != "") & ~df["project_code"].isin(self.projects), "未知專案代號")
+
+        # 檔案內重複 (含之前的塊)：保留第一次出現的列
+        key = df[self.spec["key"]].agg("\x1f".join, axis=1) if len(self.spec["key"]) > 1 else df[self.spec["key"][0]]
+        # seen 會越來越大，用 set 逐鍵查詢 (每塊 O(塊大小))，不用 isin 每次重建整個雜湊表
+        earlier = np.fromiter((k in self.seen for k in key), dtype=bool, count=len(key))
+        flag((key != "") & (key.duplicated().to_numpy() | earlier), "檔案內重複")
+        ok = (reasons == "").to_numpy()
+        self.seen.update(key[ok])
+        return out[ok], reasons[~ok]
+
+def _records(df):
+    # NaN -> None，數字轉成 JSON 可序列化的型別
+    df = df.astype(object).where(df.notna(), None)
+    return df.replace({"": None}).to_dict("records")
+
+def _filled_groups(df, sparse):
+    # sparse 欄位的空白儲存格不送出；PostgREST 批次寫入以第一列的欄位為準，
+    # 所以依這些欄位「有沒有值」分組 (最多 2^len(sparse) 組)，每組欄位一致
+    cols = [c for c in sparse if c in df.columns]
+    filled = (df[cols].notna() & (df[cols] != "")).to_numpy()
+    codes = filled @ (1 << np.arange(len(cols), dtype=np.int64))
+    for code in np.unique(codes):
+        rows = codes == code
+        drop = [c for c, f in zip(cols, filled[rows][0]) if not f]
+        yield df.loc[rows].drop(columns=drop)
+
+def _lookup(supabase, table, columns, col, values, filters=()):
+    # 只查這一塊出現的值 (in_ 分批)；每批回傳筆數不超過批量，不受 max-rows 截斷
+    values, rows = sorted(values), []
+    for i in range(0, len(values), LOOKUP_CHUNK):
+        q = supabase.table(table).select(columns).in_(col, values[i:i + LOOKUP_CHUNK])
+        for op, c, val in filters:
+            q = getattr(q, op)(c, val)
+        rows += q.execute().data or []
+    return rows
+
+def _load_refs(supabase, v, df):
+    # 逐塊補齊驗證需要的客戶/專案，不必先把整張參考表讀進記憶體
+    if v.kind == "projects":
+        names = set(df["customer"]) - v.looked_up - {""}
+        for r in _lookup(supabase, "partners", "id, name", "name", names, (("eq", "type", "Customer"),)):
+            v.customers[r["name"]] = r["id"]
+        v.looked_up |= names
+    elif v.kind == "project_items":
+        codes = set(df["project_code"]) - v.looked_up - {""}
+        v.projects |= {r["project_code"] for r in _lookup(supabase, "projects", "project_code", "project_code", codes)}
+        v.looked_up |= codes
+
+def run_import(supabase, kind, f, name, progress=None, chunk_rows=CHUNK_ROWS, **write_kw):
+    # 回傳 {"rows", "valid", "rejected", "written", "failed_rows", "errors": 退回明細 DataFrame}
+    spec = SPECS[kind]
+    v = Validator(kind)
+
+    stats = {"rows": 0, "valid": 0, "rejected": 0, "written": 0, "failed_rows": 0, "failed": []}
+    report = []
+    for raw in read_chunks(f, name, chunk_rows):
+        df, present = normalize(raw, spec)
+        _load_refs(supabase, v, df)
+        good, reasons = v.check(df)
+        # 只寫檔案裡有的欄位，沒提供的欄位不會把既有資料清空
+        good = good[[c for c in good.columns if c in present or c not in spec["columns"]]]
+        stats["rows"] += len(df)
+        stats["valid"] += len(good)
+        stats["rejected"] += len(reasons)
+        kept = sum(len(r) for r in report)
+        if len(reasons) and kept < MAX_REPORT_ROWS:
+            bad = raw.loc[reasons.index[:MAX_REPORT_ROWS - kept]].copy()
+            bad.insert(0, "原因", reasons)
+            bad.insert(0, "列號", bad.index)
+            report.append(bad)
+        for part in _filled_groups(good, spec.get("sparse", ())) if len(good) else ():
+            res = bulk_engine.bulk_write(supabase, spec["table"], _records(part), on_conflict=spec["on_conflict"], **write_kw)
+            stats["written"] += res["rows"]
+            stats["failed_rows"] += res["failed_rows"]
+            stats["failed"] += res["failed"]
+        if progress:
+            progress(stats["rows"])
+    if stats["written"]:
+        cache_engine.bump(*spec["bump"])
+    stats["errors"] = pd.concat(report, ignore_index=True) if report else pd.DataFrame(columns=["列號", "原因"])
+    return stats
+
+def template_csv(kind):
+    return (",".join(SPECS[kind]["columns"]) + "\n").encode("utf-8-sig")
+
+# --- 匯入 UI (CRM / 專案建檔共用) ---
+def render_import(supabase, kinds, key):
+    kind = kinds[0] if len(kinds) == 1 else st.radio(
+        "匯入資料", kinds, format_func=lambda k: SPECS[k]["label"], horizontal=True, key=f"{key}_import_kind")
+    spec = SPECS[kind]
+    c1, c2 = st.columns([3, 1])
+    up = c1.file_uploader("選擇 CSV / Excel 檔", type=["csv", "xlsx"], key=f"{key}_import_file_{kind}")
+    c2.download_button("📄 下載範本", template_csv(kind), file_name=f"{kind}_template.csv", mime="text/csv", key=f"{key}_tpl_{kind}")
+    st.caption(f"必填欄位: {', '.join(spec['required'])}；以 {spec['on_conflict']} 為鍵，已存在者更新")
+    if up is None or not st.button("📥 開始匯入", type="primary", key=f"{key}_import_go"):
+        return
+
+    bar = st.progress(0.0, text="讀取中...")
+    size_hint = max(up.size // 80, 1)   # 未知總列數，以檔案大小粗估
+    try:
+        stats = run_import(supabase, kind, up, up.name,
+                           progress=lambda n: bar.progress(min(n / size_hint, 1.0), text=f"已處理 {n:,} 列"))
+    except Exception as e:
+        st.error(f"匯入失敗: {e}")
+        return
+    bar.progress(1.0, text=f"完成：共 {stats['rows']:,} 列")
+
+    m1, m2, m3 = st.columns(3)
+    m1.metric("已寫入", f"{stats['written']:,}")
+    m2.metric("退回", f"{stats['rejected']:,}")
+    m3.metric("寫入失敗", f"{stats['failed_rows']:,}")
+    if stats["failed"]:
+        st.error(f"部分資料寫入失敗: {stats['failed'][0][1]}")
+    if stats["rejected"]:
+        st.warning(f"⚠️ {stats['rejected']:,} 列未通過檢核" + (f" (僅列出前 {MAX_REPORT_ROWS} 列)" if stats["rejected"] > MAX_REPORT_ROWS else ""))
+        st.dataframe(stats["errors"], hide_index=True, use_container_width=True)
+        st.download_button("⬇️ 下載退回明細", stats["errors"].to_csv(index=False).encode("utf-8-sig"),
+                           file_name=f"{kind}_rejected.csv", mime="text/csv", key=f"{key}_rej")
+    else:
+        st.success("✅ 全部資料已匯入")
+
+# --- 效能測試 (python import_engine.py [列數])：合成夥伴 CSV，約 2% 為錯誤列 ---
+def _benchmark(n_rows=100000):
+    import time
+    import tracemalloc
+
+    class _Sink:
+        def __init__(self): self.rows = 0
+        def table(self, name): return self
+        def upsert(self, rows, on_conflict=None):
+            self.rows += len(rows)
+            return self
+        def execute(self): return None
+
+    rng = np.random.default_rng(0)
+    names = [f"Partner {i:06d}" for i in range(n_rows)]
+    dup = rng.random(n_rows) < 0.01
+    names = [names[max(i - 1, 0)] if d else n for i, (n, d) in enumerate(zip(names, dup))]
+    tax = np.where(rng.random(n_rows) < 0.01, "12AB", [f"{i:08d}" for i in rng.integers(10 ** 7, 10 ** 8, n_rows)])
+    src = pd.DataFrame({"type": rng.choice(["Customer", "Supplier", "供應商"], n_rows), "name": names,
+                        "tax_id": tax, "credit_limit": rng.integers(0, 10 ** 6, n_rows).astype(str)})
+    buf = io.BytesIO(src.to_csv(index=False).encode("utf-8-sig"))
+    del src
+
+    sink = _Sink()
+    t0 = time.perf_counter()
+    stats = run_import(sink, "partners", buf, "partners.csv", workers=1)
+    dt = time.perf_counter() - t0
+
+    buf.seek(0)
+    tracemalloc.start()   # 另跑一次量記憶體高峰 (tracemalloc 會拖慢速度，不計時)
+    run_import(_Sink(), "partners", buf, "partners.csv", workers=1)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"run_import(): {stats['rows']:,} rows in {dt:.2f} s, {stats['written']:,} written, "
+          f"{stats['rejected']:,} rejected, peak {peak / 2 ** 20:.1f} MiB (file {buf.getbuffer().nbytes / 2 ** 20:.1f} MiB)")
+
+if __name__ == "__main__":
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,120 @@
+import bisect
+import streamlit as st
+
+# --- 伺服器端分頁 (Keyset Pagination) ---
+# 用「上一頁最後一筆的排序鍵」當游標，WHERE 接續往下抓，不用 OFFSET，也不用撈全表。
+# keys: [("order_date", True), ("so_number", True)] -> (欄位, 是否 desc)；最後一個欄位必須唯一且不為 null。
+
+def quote(val):
+    # PostgREST or()/and() 內的值用雙引號包起來，避免逗號、括號等保留字元破壞語法
+    s = str(val).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{s}"'
+
+def keyset_filter(keys, cursor):
+    # (k0 > v0) OR (k0 = v0 AND k1 > v1) OR ...
+    # 排序一律 nulls last：前面的欄位可為 null (例如 order_date)，null 視為排在所有值之後；
+    # 游標值為 null 時以 is.null 比對相等，且這一欄之後不會再有更後面的值
+    clauses = []
+    for i, (col, desc) in enumerate(keys):
+        if cursor[col] is None:
+            continue
+        prefix = [f"{c}.is.null" if cursor[c] is None else f"{c}.eq.{quote(cursor[c])}" for c, _ in keys[:i]]
+        tails = [f"{col}.{'lt' if desc else 'gt'}.{quote(cursor[col])}"]
+        if i < len(keys) - 1:
+            tails.append(f"{col}.is.null")
+        for tail in tails:
+            parts = prefix + [tail]
+            clauses.append(parts[0] if len(parts) == 1 else f"and({','.join(parts)})")
+    return ",".join(clauses)
+
+def search_filter(columns, keyword):
+    # 多欄位 ilike 模糊搜尋 (OR)
+    pattern = quote(f"*{keyword.strip()}*")
+    return ",".join(f"{c}.ilike.{pattern}" for c in columns)
+
+def fetch_page(query, keys, cursor=None, page_size=20):
+    # query: 已經 select() 並套好篩選的 builder；回傳 (rows, next_cursor)
+    if cursor:
+        if len(keys) == 1:
+            col, desc = keys[0]
+            query = query.lt(col, cursor[col]) if desc else query.gt(col, cursor[col])
+        else:
+            query = query.or_(keyset_filter(keys, cursor))
+    for col, desc in keys:
+        query = query.order(col, desc=desc, nullsfirst=False)
+    rows = query.limit(page_size + 1).execute().data or []
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = {col: rows[-1][col] for col, _ in keys}
+    return rows, next_cursor
+
+def fetch_all(make_query, keys, page_size=500):
+    # 逐頁讀完整個結果；make_query() 每頁建立新的 builder (builder 會累積條件，不能重複使用)
+    # page_size 須低於 PostgREST max-rows (預設 1000)：fetch_page 會多要 1 筆判斷下一頁
+    out, cursor = [], None
+    while True:
+        rows, cursor = fetch_page(make_query(), keys, cursor, page_size)
+        out.extend(rows)
+        if cursor is None:
+            return out
+
+def count_rows(query):
+    # query 需以 select(..., count="exact", head=True) 建立，只回傳筆數不回傳資料
+    return query.execute().count or 0
+
+# --- 分頁 UI ---
+# 游標堆疊存在 session_state：上一頁 = pop，下一頁 = push；篩選條件變動時回到第一頁
+def page_cursors(state_key, filter_key):
+    if st.session_state.get(f"{state_key}_filter") != filter_key:
+        st.session_state[f"{state_key}_filter"] = filter_key
+        st.session_state[f"{state_key}_cursors"] = [None]
+    return st.session_state[f"{state_key}_cursors"]
+
+def render_pager(cursors, next_cursor, state_key, total=None, page_size=None):
+    p_prev, p_info, p_next = st.columns([1, 2, 1])
+    if p_prev.button("⬅️ 上一頁", key=f"{state_key}_prev", disabled=len(cursors) <= 1, use_container_width=True):
+        cursors.pop()
+        st.rerun()
+    if total is not None and page_size:
+        pages = max(1, -(-total // page_size))
+        p_info.caption(f"第 {len(cursors)} / {pages} 頁 (共 {total:,} 筆)")
+    else:
+        p_info.caption(f"第 {len(cursors)} 頁")
+    if p_next.button("下一頁 ➡️", key=f"{state_key}_next", disabled=next_cursor is None, use_container_width=True):
+        cursors.append(next_cursor)
+        st.rerun()
+
+# --- 效能測試用：模擬 PostgREST 的 max-rows 上限 (各引擎 _benchmark 共用) ---
+class _CappedQuery:
+    # 依 keys (皆為遞增) 排序，接受 fetch_page 產生的游標 (gt 或 or_)，單次最多回傳 max_rows 筆；其他篩選一律忽略
+    def __init__(self, rows, keys, max_rows=1000):
+        assert not any(desc for _, desc in keys)
+        self.cols = [c for c, _ in keys]
+        self.rows = sorted(rows, key=self._key)
+        self.keys = [self._key(r) for r in self.rows]
+        self.max_rows, self.after, self.n = max_rows, None, None
+    def table(self, name):
+        # 也可直接當作 supabase client：每次 table() 取得共用排序資料、游標獨立的新查詢
+        q = object.__new__(type(self))
+        q.__dict__.update(self.__dict__, after=None, n=None)
+        return q
+    def _key(self, r):
+        return tuple(r[c] for c in self.cols)
+    def __getattr__(self, name):
+        return lambda *a, **k: self
+    def gt(self, col, val):
+        self.after = (type(self.rows[0][col])(val),)
+        return self
+    def or_(self, f):
+        import re
+        vals = re.findall(r'\.gt\."([^"]*)"', f)
+        self.after = tuple(type(self.rows[0][c])(v) for c, v in zip(self.cols, vals))
+        return self
+    def limit(self, n):
+        self.n = n
+        return self
+    def execute(self):
+        i = 0 if self.after is None else bisect.bisect_right(self.keys, self.after)
+        return type("Res", (), {"data": self.rows[i:i + min(self.n or self.max_rows, self.max_rows)]})()
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+# --- 36 個月預算矩陣載入器 ---
+# project_matrix 是長表 (project_code, year_month, cost_item, plan_amount, real_amount)，
+# 這裡一次 pivot 成 科目 x 月份 的寬表，所有 Tab 共用同一份，不再逐格篩選。
+
+MATRIX_KEYS = ["project_code", "year_month", "cost_item"]
+
+def pivot_matrix(rows, items, month_cols, value_col="plan_amount"):
+    df = pd.DataFrame(rows)
+    if df.empty or value_col not in df.columns:
+        return pd.DataFrame(0.0, index=pd.Index(items, name="科目"), columns=month_cols)
+
+    df = df[df["cost_item"].isin(items) & df["year_month"].isin(month_cols)]
+    values = pd.to_numeric(df[value_col], errors="coerce").fillna(0.0)
+    # 同一格理論上只有一筆 (conflict key)，保險起見取第一筆，與舊版 iloc[0] 行為一致
+    wide = (
+        df.assign(**{value_col: values})
+        .pivot_table(index="cost_item", columns="year_month", values=value_col, aggfunc="first")
+        .reindex(index=items, columns=month_cols)
+        .fillna(0.0)
+        .astype(float)
+    )
+    wide.index.name = "科目"
+    wide.columns.name = None
+    return wide
+
+def load_matrix(supabase, p_code, items, month_cols, value_col="plan_amount"):
+    try:
+        res = supabase.table("project_matrix").select(f"cost_item, year_month, {value_col}").eq("project_code", p_code).execute()
+        rows = res.data
+    except Exception:
+        rows = []
+    return pivot_matrix(rows, items, month_cols, value_col)
+
+# --- 變動格追蹤 (Dirty Cells) ---
+# 編輯後的寬表與載入時的快照逐格比較，只回傳真的有改的格子，存檔只送這些。
+CELL_TOLERANCE = 0.005  # 金額四捨五入到分，小於此差距視為沒改
+
+def diff_cells(snapshot, edited, month_cols):
+    # 回傳 [(科目, 月份, 新值)]；空白格 (NaN) 不存，與舊版行為一致
+    cols = [c for c in month_cols if c in edited.columns]
+    new = edited[cols].apply(pd.to_numeric, errors="coerce")
+    old = snapshot.reindex(index=new.index, columns=cols).fillna(0.0)
+    changed = (new.notna() & ((new - old).abs() > CELL_TOLERANCE)).to_numpy()
+    rows, cols_idx = np.nonzero(changed)
+    values = new.to_numpy()
+    return [(new.index[r], cols[c], float(values[r, c])) for r, c in zip(rows, cols_idx)]
+
+def cells_payload(p_code, cells, value_col="plan_amount"):
+    return [
+        {"project_code": p_code, "year_month": month, "cost_item": item, value_col: val}
+        for item, month, val in cells
+    ]
@@ -1,5 +1,8 @@
 import streamlit as st
 import time
+import cache_engine
+import exposure_engine
+import sync_engine
 
 def show(supabase):
     st.markdown('<p class="main-header">⚙️ 系統參數設定 (System Settings)</p>', unsafe_allow_html=True)
@@ -56,6 +59,8 @@ def show(supabase):
                         # 如果是第一次設定，執行 Insert
                         supabase.table("company_settings").insert(payload).execute()
 
+                    cache_engine.bump("company_settings")
+
                     st.success("✅ 設定已更新！單據輸出將立即生效。")
                     time.sleep(1)
                     st.rerun()
@@ -66,3 +71,31 @@ def show(supabase):
     # --- 3. 其他系統資訊 (保留未來擴充) ---
     with st.expander("🛠️ 進階設定 (Advanced)", expanded=False):
         st.info("此區塊保留給未來功能：如 SMTP 郵件伺服器設定、Logo 圖片上傳路徑、API 金鑰管理等。")
+
+        # 曝險帳由觸發器增量維護；資料曾被手動修改或初次安裝時，從採購單/付款全部重建
+        st.markdown("**供應商曝險帳對帳**")
+        if st.button("🔄 重建供應商曝險帳"):
+            try:
+                n = exposure_engine.reconcile(supabase)
+                st.success(f"✅ 已重建 {n} 家供應商的曝險")
+            except Exception as e:
+                st.error(f"重建失敗 (請確認已執行 sql/supplier_exposure.sql): {e}")
+
+        # 矩陣實際數由存檔 / 刪單差額維護；出現負數或與收付款不符時，從收付款整個專案重算
+        st.markdown("**專案實際數對帳**")
+        projects = [p["project_code"] for p in cache_engine.get_projects(supabase)]
+        r1, r2 = st.columns([2, 1])
+        sel = r1.selectbox("專案", ["(全部專案)"] + projects, key="admin_reconcile_proj", label_visibility="collapsed")
+        if r2.button("🔄 從收付款重算實際數", use_container_width=True):
+            targets = projects if sel == "(全部專案)" else [sel]
+            try:
+                n = 0
+                bar = st.progress(0.0)
+                for i, p_code in enumerate(targets, 1):
+                    n += sync_engine.reconcile(supabase, p_code) or 0
+                    bar.progress(i / max(len(targets), 1))
+                bar.empty()
+                cache_engine.bump("project_matrix")
+                st.success(f"✅ 已對帳 {len(targets)} 個專案，修正 {n} 格")
+            except Exception as e:
+                st.error(f"對帳失敗: {e}")
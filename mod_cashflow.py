@@ -1,50 +1,110 @@
 import streamlit as st
+from datetime import date
+import cashflow_engine
+import montecarlo_engine
 
 def show(supabase, dept):
     st.markdown(f'<p class="main-header">📅 {dept} 預算與現金流規劃</p>', unsafe_allow_html=True)
-    
+
     # --- 開發者工具 ---
     with st.sidebar:
         st.subheader("🛠️ 開發者工具")
         if st.button("🚀 載入全表測試數據"):
             st.session_state.test_val = {
-                "ar_cust": 850000.0, "ar_rel": 50000.0, "loan": 200000.0,
+                "opening": 3000000.0,
                 "sal_p": 150000.0, "ops_p": 35000.0, "tax_p": 12000.0,
-                "rem": "Antigravity：自動生成的 2026 預算測試數據。"
             }
             st.rerun()
         if st.button("🧹 清空"):
             st.session_state.test_val = {}
             st.rerun()
 
-    # --- 1. 時間與標籤 ---
-    c1, c2, c3 = st.columns(3)
-    year = c1.selectbox("選擇年度", [2026, 2027, 2028])
-    month = c2.selectbox("選擇月份", [f"{i:02d}" for i in range(1, 13)])
-    project = c3.text_input("專案編號 (選填)", value="GENERAL")
+    v = st.session_state.get('test_val', {})
+
+    # --- 1. 期間設定 ---
+    today = date.today()
+    c1, c2, c3, c4 = st.columns(4)
+    year = c1.selectbox("起始年度", [today.year - 1, today.year, today.year + 1, today.year + 2], index=1)
+    month = c2.selectbox("起始月份", list(range(1, 13)), index=today.month - 1, format_func=lambda m: f"{m:02d}")
+    horizon = c3.selectbox("預測期間 (月)", cashflow_engine.HORIZONS, index=cashflow_engine.HORIZONS.index(12))
+    opening = c4.number_input("期初現金", min_value=0.0, value=v.get('opening', 0.0), step=10000.0)
 
-    # --- 2. Cash In 區塊 ---
-    st.markdown("### 🟡 Cash In (應收/借款/利息)")
+    # --- 2. 每月固定支出 (不在 PO 內的薪資/營運/稅) ---
+    st.markdown("### 🔴 每月固定支出 (Plan)")
     with st.container(border=True):
-        i1, i2, i3 = st.columns(3)
-        v = st.session_state.get('test_val', {})
-        ar_cust = i1.number_input("AR-Customer", min_value=0.0, value=v.get('ar_cust', 0.0), key="in1")
-        ar_rel = i2.number_input("AR-Related Parties", min_value=0.0, value=v.get('ar_rel', 0.0), key="in2")
-        loan_in = i3.number_input("Loan (借款收入)", min_value=0.0, value=v.get('loan', 0.0), key="in3")
-
-    # --- 3. Cash Out 區塊 ---
-    st.markdown("### 🔴 Cash Out (營運/薪資/稅款)")
-    tab1, tab2 = st.tabs(["📌 預計支出 (Plan)", "✅ 實際支出 (Real)"])
-    
-    with tab1:
         p1, p2, p3 = st.columns(3)
-        sal_p = p1.number_input("Salary (薪資) - 預計", min_value=0.0, value=v.get('sal_p', 0.0), key="out1")
-        ops_p = p2.number_input("Operating EXP - 預計", min_value=0.0, value=v.get('ops_p', 0.0), key="out2")
-        tax_p = p3.number_input("Tax (稅款) - 預計", min_value=0.0, value=v.get('tax_p', 0.0), key="out3")
+        sal_p = p1.number_input("Salary (薪資)", min_value=0.0, value=v.get('sal_p', 0.0), key="out1")
+        ops_p = p2.number_input("Operating EXP", min_value=0.0, value=v.get('ops_p', 0.0), key="out2")
+        tax_p = p3.number_input("Tax (稅款)", min_value=0.0, value=v.get('tax_p', 0.0), key="out3")
+
+    # --- 3. 讀取預測 (SO 收款 = 流入，PO 付款 = 流出) ---
+    try:
+        with st.spinner("計算現金流中..."):
+            res = cashflow_engine.projection(supabase, date(year, month, 1), horizon)
+    except Exception as e:
+        st.error(f"現金流資料讀取失敗: {e}")
+        return
 
-    # --- 4. 存檔與備註 ---
+    df = cashflow_engine.with_position(res["monthly"], opening, sal_p + ops_p + tax_p)
+    n_in, n_out = res["rows"]
+    st.caption(f"收款 {n_in:,} 筆 / 付款 {n_out:,} 筆")
+
+    # --- 4. 摘要 ---
     st.divider()
-    remarks = st.text_area("備註事項", value=v.get('rem', ""))
-    
-    if st.button("💾 儲存並更新現金流數據", type="primary", use_container_width=True):
-        st.success(f"已成功對齊年度 {year}-{month} 之科目。 (資料庫寫入功能下章開啟)")
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("期間流入", f"${df['現金流入'].sum():,.0f}")
+    m2.metric("期間流出", f"${(df['現金流出'] + df['固定支出']).sum():,.0f}")
+    m3.metric("期末現金部位", f"${df['月底現金部位'].iloc[-1]:,.0f}")
+    low = df.loc[df['月底現金部位'].idxmin()]
+    m4.metric("最低現金部位", f"${low['月底現金部位']:,.0f}", help=f"發生於 {low['月份']}")
+    if (df['月底現金部位'] < 0).any():
+        first = df.loc[df['月底現金部位'] < 0, '月份'].iloc[0]
+        st.warning(f"⚠️ 預估 {first} 現金部位轉為負數，請提前安排資金。")
+
+    # --- 5. 圖表與明細 ---
+    st.markdown("### 📈 月底現金部位")
+    st.line_chart(df.set_index("月份")[["月底現金部位"]])
+    st.markdown("### 📊 每月流入 / 流出")
+    st.bar_chart(df.set_index("月份")[["現金流入", "現金流出", "固定支出"]], stack=False)
+
+    st.dataframe(
+        df.set_index("月份").style.format("{:,.0f}"),
+        use_container_width=True
+    )
+
+    with st.expander("🔍 各專案收付款明細"):
+        tab_in, tab_out = st.tabs(["🟡 流入 (SO)", "🔴 流出 (PO)"])
+        for tab, key in ((tab_in, "cash_in"), (tab_out, "cash_out")):
+            with tab:
+                mat = res[key]
+                mat = mat[mat.sum(axis=1) != 0]
+                if mat.empty:
+                    st.info("此期間無資料")
+                else:
+                    st.dataframe(mat.style.format("{:,.0f}"), use_container_width=True)
+
+    # --- 6. 延遲收付款風險模擬 ---
+    st.divider()
+    st.markdown("### 🎲 延遲收付款風險模擬 (Monte Carlo)")
+    r1, r2 = st.columns([1, 3])
+    n_sim = r1.selectbox("模擬情境數", montecarlo_engine.SCENARIOS, index=len(montecarlo_engine.SCENARIOS) - 1)
+    if r2.button("▶️ 執行模擬", use_container_width=True):
+        st.session_state.cf_mc_on = True
+    if not st.session_state.get("cf_mc_on"):
+        st.caption("依各對象歷史付款延遲 (或專案交易模式預設分佈) 抽樣，估計現金部位區間與資金缺口機率")
+        return
+
+    try:
+        with st.spinner("模擬中..."):
+            mc = montecarlo_engine.run(supabase, date(year, month, 1), horizon, n_sim, opening, sal_p + ops_p + tax_p)
+    except Exception as e:
+        st.error(f"風險模擬失敗: {e}")
+        return
+
+    k1, k2, k3 = st.columns(3)
+    k1.metric("資金缺口機率", f"{mc['p_shortfall']:.1%}", help="期間內任一月底現金部位為負的情境比例")
+    k2.metric("期末現金 P10", f"${mc['bands']['P10'].iloc[-1]:,.0f}")
+    k3.metric("期末現金 P90", f"${mc['bands']['P90'].iloc[-1]:,.0f}")
+    st.caption(f"未結款項 {mc['payments']:,} 筆，{mc['learned']} 個對象使用歷史延遲分佈")
+    st.line_chart(mc["bands"])
+    st.bar_chart(mc["shortfall"])
@@ -1,6 +1,14 @@
 import streamlit as st
-import pandas as pd
 import time
+import cache_engine
+import list_engine
+import search_engine
+import exposure_engine
+import import_engine
+
+# 伺服器端搜尋欄位 (ilike)
+SEARCH_COLUMNS = ["name", "nationality", "tax_id", "trade_items"]
+PAGE_SIZES = [10, 20, 50, 100]
 
 def show(supabase, dept):
     st.markdown('<p class="main-header">👥 合作夥伴管理 (CRM)</p>', unsafe_allow_html=True)
@@ -31,6 +39,7 @@ def show(supabase, dept):
                 }
                 try:
                     supabase.table("partners").upsert(test_data, on_conflict="name").execute()
+                    cache_engine.bump("partners")
                     st.toast("✅ 測試客戶 [Mizuno] 已生成！")
                     time.sleep(0.5)
                     st.rerun()
@@ -58,29 +67,36 @@ def show(supabase, dept):
                 }
                 try:
                     supabase.table("partners").upsert(test_supp, on_conflict="name").execute()
+                    cache_engine.bump("partners")
                     st.toast("✅ 測試供應商 [台塑化學] 已生成！")
                     time.sleep(0.5)
                     st.rerun()
                 except Exception as e:
                     st.error(f"生成失敗: {e}")
 
-    # --- 1. 讀取資料 ---
+    # --- 1. 讀取資料 (名單走快取並分頁讀完，不受 max-rows 截斷；完整資料只抓選中的那一筆) ---
     try:
-        res = supabase.table("partners").select("*").order("name").execute()
-        df_all = pd.DataFrame(res.data) if res.data else pd.DataFrame()
+        partner_names = [p["name"] for p in cache_engine.select(supabase, "partners", "id, name", order="name")]
     except Exception as e:
         st.error(f"資料讀取錯誤: {e}")
-        df_all = pd.DataFrame()
+        partner_names = []
 
     # --- 2. 新增/編輯區 ---
     with st.expander("▶️ 新增或修改夥伴資料", expanded=True):
-        target = st.selectbox("🎯 選擇對象 (留空為新增)", [""] + (df_all["name"].tolist() if not df_all.empty else []), key="crm_target_select")
+        target = search_engine.typeahead_select(
+            "🎯 選擇對象 (留空為新增)", "partner", partner_names,
+            version=cache_engine.version("partners"), fixed=[""],
+            current=st.session_state.get("crm_target_select"), key="crm_target_select"
+        )
         
         v = {}
-        if target and not df_all.empty:
-            filtered = df_all[df_all['name'] == target]
-            if not filtered.empty:
-                v = filtered.iloc[0].to_dict()
+        if target:
+            try:
+                res = supabase.table("partners").select("*").eq("name", target).limit(1).execute()
+                if res.data:
+                    v = res.data[0]
+            except Exception as e:
+                st.error(f"資料讀取錯誤: {e}")
 
         k_suffix = str(target) if target else "new"
 
@@ -130,37 +146,72 @@ def show(supabase, dept):
                 }
                 try:
                     supabase.table("partners").upsert(save_data, on_conflict="name").execute()
+                    cache_engine.bump("partners")
                     st.success(f"✅ {name} 資料已更新！")
                     time.sleep(1)
                     st.rerun()
                 except Exception as e:
                     st.error(f"儲存失敗: {e}")
 
-    # --- 3. 列表顯示 ---
+    # --- 3. 批次匯入 ---
+    with st.expander("📥 批次匯入夥伴 (CSV / Excel)"):
+        import_engine.render_import(supabase, ["partners"], "crm")
+
+    # --- 4. 列表顯示 (伺服器端搜尋 + 分頁，只渲染當頁) ---
     st.divider()
-    if not df_all.empty:
+    if partner_names:
         st.subheader("📋 夥伴名單")
-        search = st.text_input("🔍 搜尋夥伴...", placeholder="輸入名稱或國籍")
-        if search:
-            df_all = df_all[df_all.apply(lambda r: search.lower() in str(r).lower(), axis=1)]
+        c_search, c_size = st.columns([4, 1])
+        search = c_search.text_input("🔍 搜尋夥伴...", placeholder="輸入名稱、國籍、統編或交易項目")
+        page_size = c_size.selectbox("每頁筆數", PAGE_SIZES, index=1)
+
+        cursors = list_engine.page_cursors("crm", (search, page_size))
+        try:
+            query = supabase.table("partners").select("id, type, name, nationality, tax_id, credit_limit")
+            if search.strip():
+                query = query.or_(list_engine.search_filter(SEARCH_COLUMNS, search))
+            rows, next_cursor = list_engine.fetch_page(query, [("name", False)], cursors[-1], page_size)
+        except Exception as e:
+            st.error(f"資料讀取錯誤: {e}")
+            rows, next_cursor = [], None
 
-        for _, row in df_all.iterrows():
+        if not rows:
+            st.info("查無符合的夥伴。")
+
+        # 本頁供應商的未結曝險 (一次以 supplier_id 查回)
+        try:
+            exposures = exposure_engine.lookup(supabase, [r['id'] for r in rows if r['type'] != 'Customer'])
+        except Exception as e:
+            st.error(f"供應商曝險讀取失敗: {e}")
+            exposures = {}
+
+        for row in rows:
             with st.container(border=True):
                 c_head, c_info = st.columns([3, 1])
                 badge = "🟦 客戶" if row['type'] == 'Customer' else "🟧 供應商"
-                nation_str = f"({row.get('nationality', '未知')})"
+                nation_str = f"({row.get('nationality') or '未知'})"
                 c_head.markdown(f"**{badge} | {row['name']}** <small>{nation_str}</small>", unsafe_allow_html=True)
                 
                 limit_show = float(row.get('credit_limit')) if row.get('credit_limit') else 0
                 c_info.markdown(f"額度: `${limit_show:,.0f}`")
+                if row['type'] != 'Customer':
+                    exp = exposures.get(row['id'], exposure_engine.EMPTY)
+                    ratio = exposure_engine.utilisation(exp, limit_show)
+                    if ratio is None:
+                        c_info.caption(f"未結曝險 ${exp['exposure']:,.0f}")
+                    else:
+                        c_info.progress(min(max(ratio, 0.0), 1.0), text=f"已用 {ratio:.0%} (${exp['exposure']:,.0f})")
                 
                 with st.expander(f"⚙️ 管理 {row['name']}"):
-                    st.write(f"統一編號: {row.get('tax_id', '無')}")
+                    st.write(f"統一編號: {row.get('tax_id') or '無'}")
                     if st.button(f"🗑️ 永久刪除", key=f"del_{row['id']}"):
                         try:
                             supabase.table("partners").delete().eq("id", row['id']).execute()
+                            cache_engine.bump("partners")
                             st.toast(f"已刪除 {row['name']}")
                             time.sleep(1)
                             st.rerun()
                         except Exception as e:
                             st.error(f"刪除失敗 (可能已被使用): {e}")
+
+        list_engine.render_pager(cursors, next_cursor, "crm")
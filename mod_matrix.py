@@ -1,6 +1,10 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+import matrix_engine
+import cache_engine
+import search_engine
+import bulk_engine
 
 # --- 憲法神聖科目定義 ---
 HOLY_SUBJECTS = {
@@ -36,8 +40,8 @@ def show(supabase):
 
     # --- 1. 選擇專案 ---
     try:
-        res = supabase.table("projects").select("project_code, project_name, start_date").execute()
-        projects = {f"{r['project_code']} | {r['project_name']}": r for r in res.data}
+        rows = cache_engine.get_projects(supabase, "project_code, project_name, start_date")
+        projects = {f"{r['project_code']} | {r['project_name']}": r for r in rows}
     except Exception as e:
         st.error(f"讀取專案列表失敗: {e}")
         return
@@ -46,7 +50,11 @@ def show(supabase):
         st.info("尚無專案，請先建檔。")
         return
 
-    target_label = st.selectbox("📂 選擇專案", list(projects.keys()))
+    target_label = search_engine.typeahead_select(
+        "📂 選擇專案", "project", list(projects.keys()),
+        version=cache_engine.version("projects"),
+        current=st.session_state.get("matrix_project_select"), key="matrix_project_select"
+    )
     target_proj = projects[target_label]
     p_code = target_proj["project_code"]
     month_cols = get_month_list(target_proj["start_date"])
@@ -55,35 +63,14 @@ def show(supabase):
 
     st.caption(f"Code: {p_code} | Range: {month_cols[0]} ~ {month_cols[-1]}")
 
-    # --- 2. 讀取現有數據 ---
-    try:
-        data_res = supabase.table("project_matrix").select("*").eq("project_code", p_code).execute()
-        df_db = pd.DataFrame(data_res.data)
-    except:
-        df_db = pd.DataFrame()
-
-    if df_db.empty:
-        df_db = pd.DataFrame(columns=["project_code", "year_month", "cost_item", "plan_amount"])
+    # --- 2. 讀取現有數據 (一次 pivot 成 科目 x 月份) ---
+    all_items = [item for items in HOLY_SUBJECTS.values() for item in items]
+    df_plan = matrix_engine.load_matrix(supabase, p_code, all_items, month_cols)
 
     # --- 3. 準備渲染函數 (新版邏輯) ---
     def render_section(title, items, key_prefix):
-        editor_data = []
-        for item in items:
-            row_plan = {"科目": f"{item}"}
-            # 填入月份數據
-            for m in month_cols:
-                val = 0.0
-                if not df_db.empty:
-                    try:
-                        match = df_db[(df_db["cost_item"] == item) & (df_db["year_month"] == m)]
-                        if not match.empty:
-                            val = float(match.iloc[0]["plan_amount"])
-                    except: pass
-                row_plan[m] = val
-            editor_data.append(row_plan)
-        
-        # 建立 DataFrame
-        df_editor = pd.DataFrame(editor_data).set_index("科目")
+        # 直接從共用的寬表切出該大項
+        df_editor = df_plan.loc[items].copy()
         
         # [新增邏輯] 計算橫向總計 (Row Sum)
         # axis=1 代表橫向相加
@@ -189,48 +176,35 @@ def show(supabase):
         st.dataframe(display_df, use_container_width=True, hide_index=True)
 
 
-    # --- 5. 存檔邏輯 (自動過濾總計欄) ---
+    # --- 5. 存檔邏輯 (只存有變動的格子) ---
     st.divider()
-    if st.button("💾 儲存所有預算規劃", type="primary"):
-        upsert_list = []
-        
-        def process_save(df_input):
-            for idx, row in df_input.iterrows():
-                clean_item = idx 
-                for m_col in month_cols:
-                    # ★★★ 關鍵：只存月份欄位，跳過 "∑ 總計 (Total)" ★★★
-                    if m_col in row: 
-                        amount = row[m_col]
-                        if pd.notna(amount): 
-                             upsert_list.append({
-                                "project_code": p_code,
-                                "year_month": m_col,
-                                "cost_item": clean_item,
-                                "plan_amount": float(amount)
-                            })
-        
-        process_save(df_order)
-        process_save(df_rev)
-        process_save(df_cost)
-
-        if upsert_list:
-            try:
-                chunk_size = 100
-                progress_text = "存檔中，請稍候..."
-                my_bar = st.progress(0, text=progress_text)
-                
-                total_chunks = len(upsert_list) // chunk_size + 1
-                for i in range(0, len(upsert_list), chunk_size):
-                    chunk = upsert_list[i:i + chunk_size]
-                    supabase.table("project_matrix").upsert(
-                        chunk, on_conflict="project_code, year_month, cost_item"
-                    ).execute()
-                    my_bar.progress((i // chunk_size + 1) / total_chunks)
-                
-                my_bar.empty()
-                st.success("✅ 預算規劃已完整儲存！")
+    # 與載入時的快照 df_plan 比較，總計欄不在月份欄內，自然被排除
+    dirty = []
+    for df_input in (df_order, df_rev, df_cost):
+        dirty += matrix_engine.diff_cells(df_plan, df_input, month_cols)
+
+    if dirty:
+        st.caption(f"✏️ 尚未儲存的變更：{len(dirty)} 格")
+    else:
+        st.caption("✅ 沒有未儲存的變更")
+
+    if st.button("💾 儲存所有預算規劃", type="primary", disabled=not dirty):
+        try:
+            # 所有變動合併成 bulk upsert；格數多時 (初次編列) 由 bulk_engine 分塊並行送出、失敗重試
+            my_bar = st.progress(0, text="存檔中，請稍候...")
+            stats = bulk_engine.upsert_matrix(
+                supabase, matrix_engine.cells_payload(p_code, dirty),
+                progress=lambda done, total: my_bar.progress(done / total, text=f"存檔中 {done} / {total}")
+            )
+            my_bar.empty()
+            if stats["failed_rows"]:
+                st.error(f"存檔失敗: {stats['failed_rows']} 格未寫入 ({stats['failed'][0][1]})，請再按一次儲存重送")
+            else:
+                cache_engine.bump("project_matrix")
+                # 清掉編輯器狀態，重跑後以資料庫的新值為快照
+                for key_prefix in ("order", "rev", "cost"):
+                    st.session_state.pop(f"ed_{key_prefix}", None)
+                st.success(f"✅ 已儲存 {len(dirty)} 格預算！")
                 st.rerun()
-            except Exception as e:
-                st.error(f"存檔失敗: {e}")
-        else:
-            st.warning("沒有資料需要儲存")
+        except Exception as e:
+            st.error(f"存檔失敗: {e}")
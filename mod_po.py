@@ -4,6 +4,17 @@ import time
 import io
 import os
 from datetime import datetime, date
+import sync_engine
+import cache_engine
+import core_engine
+import search_engine
+import list_engine
+import doc_engine
+import export_engine
+import pdf_engine
+import persist_engine
+import save_engine
+import exposure_engine
 
 # --- 憲法 3.x 變動費用科目 ---
 COST_ITEMS = [
@@ -13,30 +24,49 @@ COST_ITEMS = [
     "3.7 廣告宣傳費", "3.7 差旅費"
 ]
 
+PO_STATUSES = ["Confirmed"]
+LIST_PAGE_SIZE = 20
+LIST_KEYS = [("order_date", True), ("po_number", True)]
+PO_ITEM_FIELDS = ["po_number", "product_name", "spec", "quantity", "unit_price", "amount"]
+PO_CPM_FIELDS = ["po_number", "material_name", "spec", "quantity", "unit", "remarks"]
+PO_PAY_FIELDS = ["po_number", "term_name", "expected_date", "amount"]
+DOC_MIME = {
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".pdf": "application/pdf",
+}
+
 def show(supabase):
     st.markdown('<p class="main-header">🛒 採購訂單管理 (Purchase Order)</p>', unsafe_allow_html=True)
 
     # --- 1. 準備資料 ---
     try:
-        res_proj = supabase.table("projects").select("project_code, project_name").execute()
-        proj_options = [f"{p['project_code']} | {p['project_name']}" for p in res_proj.data]
+        # 四支互不相依的查詢同時送出
+        ref = core_engine.run_queries({
+            "projects": lambda: cache_engine.get_projects(supabase),
+            "suppliers": lambda: cache_engine.get_partners(supabase, "id, name, credit_limit, company_address, company_phone, contact_person", p_type="Supplier"),
+            "company": lambda: cache_engine.get_company_settings(supabase),
+            "po_numbers": lambda: cache_engine.get_po_numbers(supabase),
+        })
+        proj_options = [f"{p['project_code']} | {p['project_name']}" for p in ref["projects"]]
         
-        res_supp = supabase.table("partners").select("id, name, credit_limit, company_address, company_phone, contact_person").eq("type", "Supplier").execute()
-        supp_map = {s['name']: s for s in res_supp.data}
+        supp_map = {s['name']: s for s in ref["suppliers"]}
         supp_options = list(supp_map.keys())
 
-        res_comp = supabase.table("company_settings").select("*").limit(1).execute()
-        my_company = res_comp.data[0] if res_comp.data else {}
+        my_company = ref["company"]
 
-        res_po = supabase.table("purchase_orders").select("po_number").order("created_at", desc=True).execute()
-        existing_pos = [p['po_number'] for p in res_po.data]
+        existing_pos = ref["po_numbers"]
     except Exception as e:
         st.error(f"資料讀取失敗: {e}")
         return
 
     # --- 2. 編輯/新增 切換 ---
     c_sel, _ = st.columns([3, 1])
-    target_po = c_sel.selectbox("✏️ 選擇要編輯的採購單 (或建立新單)", ["(建立新採購單)"] + existing_pos)
+    with c_sel:
+        target_po = search_engine.typeahead_select(
+            "✏️ 選擇要編輯的採購單 (或建立新單)", "po", existing_pos,
+            version=cache_engine.version("purchase_orders"), fixed=["(建立新採購單)"],
+            current=st.session_state.get("current_po_target"), key="po_target_select"
+        )
 
     # Session State 初始化
     if "current_po_target" not in st.session_state:
@@ -79,228 +109,247 @@ def show(supabase):
     # --- 3. 採購表單 (Input Area) ---
     with st.container(border=True):
         st.subheader("📋 採購單輸入 (Input)")
-        with st.form("po_main_form"):
-            # A. 表頭
-            c1, c2 = st.columns(2)
-            
-            def_proj_idx = 0
-            if form_data["project_code"]:
-                for i, opt in enumerate(proj_options):
-                    if opt.startswith(form_data["project_code"]):
-                        def_proj_idx = i
-                        break
-            sel_proj = c1.selectbox("歸屬專案", [""] + proj_options, index=def_proj_idx + 1 if form_data["project_code"] else 0)
-            
-            def_supp_idx = 0
-            if form_data["supplier_name"] in supp_options:
-                def_supp_idx = supp_options.index(form_data["supplier_name"])
-            sel_supp = c2.selectbox("供應商", supp_options, index=def_supp_idx)
-            
-            supp_limit = 0
-            if sel_supp:
-                supp_limit = supp_map[sel_supp]['credit_limit']
-                c2.caption(f"ℹ️ 額度上限: ${supp_limit:,.0f}")
-
-            c3, c4, c5, c6 = st.columns(4)
-            po_no = c3.text_input("採購單號", value=form_data["po_no"], disabled=(target_po != "(建立新採購單)"))
-            
-            def_cost_idx = 0
-            if form_data["cost_item"] in COST_ITEMS: def_cost_idx = COST_ITEMS.index(form_data["cost_item"])
-            cost_item = c4.selectbox("歸屬科目", COST_ITEMS, index=def_cost_idx)
-            
-            try:
-                if isinstance(form_data["order_date"], str): order_d = datetime.strptime(form_data["order_date"], "%Y-%m-%d").date()
-                else: order_d = form_data["order_date"]
-            except: order_d = date.today()
-            order_date = c5.date_input("採購日期", value=order_d)
-            
-            tax_type = c6.selectbox("稅別", ["含稅", "未稅", "零稅"], index=["含稅", "未稅", "零稅"].index(form_data["tax_type"]))
-
-            st.markdown("---")
-            bc1, bc2 = st.columns(2)
-            pay_terms = bc1.text_input("付款條件", value=form_data.get("payment_terms", "月結 30 天"))
-            trade_terms = bc2.selectbox("貿易條件", ["當地交貨 (Delivered)", "Ex-Works", "FOB", "CIF", "DDP"], index=0)
-
-            lc1, lc2 = st.columns(2)
-            ship_to = lc1.text_area("送貨地址 (Ship To)", value=form_data.get("ship_to_address", my_company.get("address", "")), height=70)
-            bill_to = lc2.text_area("發票地址 (Bill To)", value=form_data.get("bill_to_address", my_company.get("address", "")), height=70)
-            contact = lc1.text_input("收貨聯絡人", value=form_data.get("receiver_contact", ""))
-
-            # B. 採購明細
-            st.markdown("#### 2. 採購明細")
-            
-            editor_key = f"po_items_{target_po}"
-            if editor_key in st.session_state:
-                form_data["items"] = st.session_state[editor_key]
-
-            # 強制轉型
-            if not isinstance(form_data["items"], pd.DataFrame):
-                try: form_data["items"] = pd.DataFrame(form_data["items"])
-                except: form_data["items"] = pd.DataFrame([{"品項": "", "規格": "", "數量": 1, "單價": 0, "金額": 0}])
-
-            if "金額" not in form_data["items"].columns: form_data["items"]["金額"] = 0
-
-            # 自動計算
-            if not form_data["items"].empty:
-                try:
-                    form_data["items"]["數量"] = pd.to_numeric(form_data["items"]["數量"], errors='coerce').fillna(0)
-                    form_data["items"]["單價"] = pd.to_numeric(form_data["items"]["單價"], errors='coerce').fillna(0)
-                    form_data["items"]["金額"] = form_data["items"]["數量"] * form_data["items"]["單價"]
-                except: pass
-
-            edited_items = st.data_editor(
-                form_data["items"], 
-                num_rows="dynamic", 
-                use_container_width=True, 
-                key=editor_key,
-                column_config={
-                    "數量": st.column_config.NumberColumn(min_value=1, required=True), 
-                    "單價": st.column_config.NumberColumn(min_value=0, required=True, format="$%d"),
-                    "金額": st.column_config.NumberColumn(format="$%d", disabled=True) 
-                }
-            )
-            
-            raw_total = 0.0
-            tax_amount = 0.0
-            final_total = 0.0
-            
-            if not edited_items.empty:
-                try:
-                    sum_val = edited_items["金額"].sum()
-                    if tax_type == "含稅":
-                        final_total = sum_val
-                        raw_total = sum_val / 1.05
-                        tax_amount = final_total - raw_total
-                    elif tax_type == "未稅":
-                        raw_total = sum_val
-                        tax_amount = raw_total * 0.05
-                        final_total = raw_total + tax_amount
-                    else: 
-                        raw_total = sum_val
-                        tax_amount = 0
-                        final_total = raw_total
-                except: pass
-
-            k1, k2, k3 = st.columns(3)
-            k1.metric("銷售額 (未稅)", f"${raw_total:,.0f}")
-            k2.metric("營業稅 (5%)", f"${tax_amount:,.0f}")
-            k3.metric("總計 (含稅)", f"${final_total:,.0f}")
-
-            # C. 自備料明細
-            st.markdown("#### 3. 自備料清單")
-            cpm_key = f"po_cpm_{target_po}"
-            if cpm_key in st.session_state:
-                form_data["provided_materials"] = st.session_state[cpm_key]
-
-            if not isinstance(form_data["provided_materials"], pd.DataFrame):
-                try: form_data["provided_materials"] = pd.DataFrame(form_data["provided_materials"])
-                except: form_data["provided_materials"] = pd.DataFrame([{"自備料品項": "", "規格": "", "預計提供數量": 0, "單位": "", "備註": ""}])
-
-            edited_cpm = st.data_editor(
-                form_data["provided_materials"],
-                num_rows="dynamic",
-                use_container_width=True,
-                key=cpm_key,
-                column_config={
-                    "自備料品項": st.column_config.TextColumn(required=True),
-                    "預計提供數量": st.column_config.NumberColumn(min_value=0),
-                    "單位": st.column_config.TextColumn(width="small"),
-                    "備註": st.column_config.TextColumn(width="large")
-                }
-            )
-
-            # D. 付款計畫
-            st.markdown("#### 4. 付款計畫")
-            df_pay = form_data["payments"].copy()
-            if isinstance(df_pay, pd.DataFrame) and not df_pay.empty and "預計付款日" in df_pay.columns:
-                df_pay["預計付款日"] = pd.to_datetime(df_pay["預計付款日"]).dt.date
-            else:
-                df_pay = pd.DataFrame([{"期數": "月結", "預計付款日": date.today(), "金額": 0}])
+        render_po_form(supabase, target_po, form_data, my_company, proj_options, supp_map, supp_options)
 
-            edited_payments = st.data_editor(
-                df_pay, num_rows="dynamic", use_container_width=True, key=f"po_pay_{target_po}",
-                column_config={"預計付款日": st.column_config.DateColumn(format="YYYY-MM-DD", required=True), "金額": st.column_config.NumberColumn(required=True)}
-            )
-            
-            pay_total = 0
-            if isinstance(edited_payments, pd.DataFrame) and not edited_payments.empty:
-                pay_total = edited_payments["金額"].sum() 
-            
-            diff = final_total - pay_total
-            
-            # E. 檢核與存檔
-            is_valid = True
-            if abs(diff) < 1 and final_total > 0:
-                st.success(f"✅ 金額相符")
-            else:
-                is_valid = False
-                if final_total == 0: st.warning("⚠️ 請輸入明細")
-                else: st.error(f"❌ 付款總額不符！差額: ${diff:,.0f}")
-
-            if sel_supp and supp_limit > 0 and final_total > supp_limit:
-                is_valid = False
-                st.error(f"⛔ 超過額度上限 ${supp_limit:,.0f}！")
-
-            btn_txt = "💾 更新採購單" if target_po != "(建立新採購單)" else "💾 建立採購單"
-            submitted = st.form_submit_button(btn_txt)
-            
-            if submitted:
-                if not is_valid: st.error("無法存檔，請修正錯誤。")
-                elif not po_no or not sel_proj: st.error("必填欄位缺漏")
-                else:
-                    p_code = sel_proj.split(" | ")[0]
-                    supp_id = supp_map[sel_supp]['id']
-                    
-                    save_data = {
-                        "po_no": po_no, "p_code": p_code, "supp_id": supp_id, "cost_item": cost_item,
-                        "order_date": order_date, "tax_type": tax_type, "total": final_total,
-                        "payment_terms": pay_terms, "trade_terms": trade_terms,
-                        "ship_to": ship_to, "bill_to": bill_to, "contact": contact
-                    }
-                    save_po(supabase, save_data, edited_items, edited_cpm, edited_payments)
-
-    # --- 4. 輸出 (Simplified) ---
+    # --- 4. 輸出 (按下才產生，內容相同時直接取快取) ---
     st.divider()
     
     if target_po != "(建立新採購單)":
         st.subheader("🖨️ 單據輸出中心")
+
+        cpm_df = form_data.get("provided_materials")
+        has_cpm = (
+            isinstance(cpm_df, pd.DataFrame) and "自備料品項" in cpm_df.columns
+            and (cpm_df["自備料品項"].fillna("").astype(str) != "").any()
+        )
+
+        c_po, c_dn = st.columns(2)
         
-        full_po_data = load_po_data_raw(supabase, target_po)
+        # 1. 下載 Excel / PDF PO (保留此功能)
+        with c_po:
+            render_doc_download(supabase, target_po, my_company, "po", "Excel PO", generate_excel_po, f"{target_po}_PO.xlsx")
+            if pdf_engine.has_cjk_font():
+                render_doc_download(supabase, target_po, my_company, "po_pdf", "PDF PO", pdf_engine.render_po_pdf, f"{target_po}_PO.pdf")
+            else:
+                render_pdf_unavailable("PDF PO")
         
-        if full_po_data:
-            c_po, c_dn = st.columns(2)
-            
-            # 1. 下載 Excel PO (保留此功能)
-            with c_po:
-                excel_po = generate_excel_po(full_po_data, my_company)
-                st.download_button(
-                    label=f"📥 下載 Excel PO",
-                    data=excel_po,
-                    file_name=f"{target_po}_PO.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    use_container_width=True
-                )
-            
-            # 2. 自備料收貨單 (Excel)
-            has_cpm = len(full_po_data.get('provided_materials', [])) > 0
+        # 2. 自備料收貨單 (Excel / PDF)
+        with c_dn:
             if has_cpm:
-                with c_dn:
-                    excel_dn = generate_excel_delivery_note(full_po_data, my_company)
-                    st.download_button(
-                        label=f"📦 下載 Excel 收貨單",
-                        data=excel_dn,
-                        file_name=f"{target_po}_DeliveryNote.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        use_container_width=True
-                    )
+                render_doc_download(supabase, target_po, my_company, "dn", "Excel 收貨單", generate_excel_delivery_note, f"{target_po}_DeliveryNote.xlsx")
+                if pdf_engine.has_cjk_font():
+                    render_doc_download(supabase, target_po, my_company, "dn_pdf", "PDF 收貨單", pdf_engine.render_delivery_note_pdf, f"{target_po}_DeliveryNote.pdf")
+                else:
+                    render_pdf_unavailable("PDF 收貨單")
             else:
-                with c_dn:
-                    st.info("此單無自備料。")
+                st.info("此單無自備料。")
 
     else:
+        render_batch_export(supabase, my_company)
         render_po_list(supabase)
 
 # === Helpers ===
+@st.fragment
+def render_po_form(supabase, target_po, form_data, my_company, proj_options, supp_map, supp_options):
+    # 表頭/明細/自備料/付款/檢核 在同一個 fragment：改數量只重跑這一區重算總計與付款檢核，
+    # 不重跑參考資料查詢、採購單列表與單據輸出；存檔後 st.rerun() 才重跑整頁
+
+    # A. 表頭
+    c1, c2 = st.columns(2)
+
+    def_proj_idx = 0
+    if form_data["project_code"]:
+        for i, opt in enumerate(proj_options):
+            if opt.startswith(form_data["project_code"]):
+                def_proj_idx = i
+                break
+    sel_proj = c1.selectbox("歸屬專案", [""] + proj_options, index=def_proj_idx + 1 if form_data["project_code"] else 0)
+
+    def_supp_idx = 0
+    if form_data["supplier_name"] in supp_options:
+        def_supp_idx = supp_options.index(form_data["supplier_name"])
+    sel_supp = c2.selectbox("供應商", supp_options, index=def_supp_idx)
+
+    supp_limit, supp_exposure = 0, dict(exposure_engine.EMPTY)
+    if sel_supp:
+        supp_limit = supp_map[sel_supp]['credit_limit'] or 0
+        try: supp_exposure = exposure_engine.get(supabase, supp_map[sel_supp]['id'])
+        except Exception as e: st.error(f"供應商曝險讀取失敗: {e}")
+        c2.caption(f"ℹ️ 額度上限: ${supp_limit:,.0f} | 未結曝險: ${supp_exposure['exposure']:,.0f} ({supp_exposure['po_count']} 張)")
+
+    c3, c4, c5, c6 = st.columns(4)
+    po_no = c3.text_input("採購單號", value=form_data["po_no"], disabled=(target_po != "(建立新採購單)"))
+
+    def_cost_idx = 0
+    if form_data["cost_item"] in COST_ITEMS: def_cost_idx = COST_ITEMS.index(form_data["cost_item"])
+    cost_item = c4.selectbox("歸屬科目", COST_ITEMS, index=def_cost_idx)
+
+    try:
+        if isinstance(form_data["order_date"], str): order_d = datetime.strptime(form_data["order_date"], "%Y-%m-%d").date()
+        else: order_d = form_data["order_date"]
+    except: order_d = date.today()
+    order_date = c5.date_input("採購日期", value=order_d)
+
+    tax_type = c6.selectbox("稅別", ["含稅", "未稅", "零稅"], index=["含稅", "未稅", "零稅"].index(form_data["tax_type"]))
+
+    st.markdown("---")
+    bc1, bc2 = st.columns(2)
+    pay_terms = bc1.text_input("付款條件", value=form_data.get("payment_terms", "月結 30 天"))
+    trade_terms = bc2.selectbox("貿易條件", ["當地交貨 (Delivered)", "Ex-Works", "FOB", "CIF", "DDP"], index=0)
+
+    lc1, lc2 = st.columns(2)
+    ship_to = lc1.text_area("送貨地址 (Ship To)", value=form_data.get("ship_to_address", my_company.get("address", "")), height=70)
+    bill_to = lc2.text_area("發票地址 (Bill To)", value=form_data.get("bill_to_address", my_company.get("address", "")), height=70)
+    contact = lc1.text_input("收貨聯絡人", value=form_data.get("receiver_contact", ""))
+
+    # B. 採購明細
+    st.markdown("#### 2. 採購明細")
+
+    editor_key = f"po_items_{target_po}"
+
+    # 強制轉型
+    if not isinstance(form_data["items"], pd.DataFrame):
+        try: form_data["items"] = pd.DataFrame(form_data["items"])
+        except: form_data["items"] = pd.DataFrame([{"品項": "", "規格": "", "數量": 1, "單價": 0, "金額": 0}])
+
+    if "金額" not in form_data["items"].columns: form_data["items"]["金額"] = 0
+
+    # 自動計算
+    if not form_data["items"].empty:
+        try:
+            form_data["items"]["數量"] = pd.to_numeric(form_data["items"]["數量"], errors='coerce').fillna(0)
+            form_data["items"]["單價"] = pd.to_numeric(form_data["items"]["單價"], errors='coerce').fillna(0)
+            form_data["items"]["金額"] = form_data["items"]["數量"] * form_data["items"]["單價"]
+        except: pass
+
+    edited_items = st.data_editor(
+        form_data["items"], 
+        num_rows="dynamic", 
+        use_container_width=True, 
+        key=editor_key,
+        column_config={
+            "數量": st.column_config.NumberColumn(min_value=1, required=True), 
+            "單價": st.column_config.NumberColumn(min_value=0, required=True, format="$%d"),
+            "金額": None,  # 編輯器內的金額不會隨輸入更新，改在下方試算表顯示
+            "id": None  # 只用來對應資料庫列，不顯示
+        }
+    )
+
+    raw_total = 0.0
+    tax_amount = 0.0
+    final_total = 0.0
+
+    if not edited_items.empty:
+        try:
+            # 編輯器輸入不變 (避免重設編輯內容)，金額由編輯後的數量 x 單價重算
+            calc_df = edited_items.copy()
+            calc_df["數量"] = pd.to_numeric(calc_df["數量"], errors="coerce").fillna(0)
+            calc_df["單價"] = pd.to_numeric(calc_df["單價"], errors="coerce").fillna(0)
+            calc_df["金額"] = calc_df["數量"] * calc_df["單價"]
+            st.dataframe(
+                calc_df, use_container_width=True, hide_index=True,
+                column_config={
+                    "單價": st.column_config.NumberColumn(format="$%d"),
+                    "金額": st.column_config.NumberColumn(format="$%d", help="數量 * 單價"),
+                    "id": None
+                }
+            )
+            sum_val = calc_df["金額"].sum()
+            if tax_type == "含稅":
+                final_total = sum_val
+                raw_total = sum_val / 1.05
+                tax_amount = final_total - raw_total
+            elif tax_type == "未稅":
+                raw_total = sum_val
+                tax_amount = raw_total * 0.05
+                final_total = raw_total + tax_amount
+            else: 
+                raw_total = sum_val
+                tax_amount = 0
+                final_total = raw_total
+        except: pass
+
+    k1, k2, k3 = st.columns(3)
+    k1.metric("銷售額 (未稅)", f"${raw_total:,.0f}")
+    k2.metric("營業稅 (5%)", f"${tax_amount:,.0f}")
+    k3.metric("總計 (含稅)", f"${final_total:,.0f}")
+
+    # C. 自備料明細
+    st.markdown("#### 3. 自備料清單")
+    cpm_key = f"po_cpm_{target_po}"
+
+    if not isinstance(form_data["provided_materials"], pd.DataFrame):
+        try: form_data["provided_materials"] = pd.DataFrame(form_data["provided_materials"])
+        except: form_data["provided_materials"] = pd.DataFrame([{"自備料品項": "", "規格": "", "預計提供數量": 0, "單位": "", "備註": ""}])
+
+    edited_cpm = st.data_editor(
+        form_data["provided_materials"],
+        num_rows="dynamic",
+        use_container_width=True,
+        key=cpm_key,
+        column_config={
+            "自備料品項": st.column_config.TextColumn(required=True),
+            "預計提供數量": st.column_config.NumberColumn(min_value=0),
+            "單位": st.column_config.TextColumn(width="small"),
+            "備註": st.column_config.TextColumn(width="large"),
+            "id": None
+        }
+    )
+
+    # D. 付款計畫
+    st.markdown("#### 4. 付款計畫")
+    df_pay = form_data["payments"].copy()
+    if isinstance(df_pay, pd.DataFrame) and not df_pay.empty and "預計付款日" in df_pay.columns:
+        df_pay["預計付款日"] = pd.to_datetime(df_pay["預計付款日"]).dt.date
+    else:
+        df_pay = pd.DataFrame([{"期數": "月結", "預計付款日": date.today(), "金額": 0}])
+
+    edited_payments = st.data_editor(
+        df_pay, num_rows="dynamic", use_container_width=True, key=f"po_pay_{target_po}",
+        column_config={"預計付款日": st.column_config.DateColumn(format="YYYY-MM-DD", required=True), "金額": st.column_config.NumberColumn(required=True), "id": None}
+    )
+
+    pay_total = 0
+    if isinstance(edited_payments, pd.DataFrame) and not edited_payments.empty:
+        pay_total = edited_payments["金額"].sum() 
+
+    diff = final_total - pay_total
+
+    # E. 檢核與存檔
+    is_valid = True
+    if abs(diff) < 1 and final_total > 0:
+        st.success(f"✅ 金額相符")
+    else:
+        is_valid = False
+        if final_total == 0: st.warning("⚠️ 請輸入明細")
+        else: st.error(f"❌ 付款總額不符！差額: ${diff:,.0f}")
+
+    # 額度檢核：該供應商所有未結採購單 (曝險帳) + 本單，編輯時本單舊總額已在曝險帳內
+    if sel_supp and supp_limit > 0:
+        same_supp = form_data.get("supplier_id") == supp_map[sel_supp]['id']
+        after_save = exposure_engine.projected(supp_exposure, final_total, form_data.get("total_amount", 0), same_supp)
+        if after_save > supp_limit:
+            is_valid = False
+            st.error(f"⛔ 超過額度上限 ${supp_limit:,.0f}！(存檔後未結曝險 ${after_save:,.0f})")
+
+    btn_txt = "💾 更新採購單" if target_po != "(建立新採購單)" else "💾 建立採購單"
+    submitted = st.button(btn_txt, type="primary")
+
+    if submitted:
+        if not is_valid: st.error("無法存檔，請修正錯誤。")
+        elif not po_no or not sel_proj: st.error("必填欄位缺漏")
+        else:
+            p_code = sel_proj.split(" | ")[0]
+            supp_id = supp_map[sel_supp]['id']
+
+            save_data = {
+                "po_no": po_no, "p_code": p_code, "supp_id": supp_id, "cost_item": cost_item,
+                "order_date": order_date, "tax_type": tax_type, "total": final_total,
+                "payment_terms": pay_terms, "trade_terms": trade_terms,
+                "ship_to": ship_to, "bill_to": bill_to, "contact": contact
+            }
+            save_po(supabase, save_data, edited_items, edited_cpm, edited_payments)
+
 def get_empty_form(my_company):
     return {
         "po_no": "", "project_code": "", "supplier_name": "", "cost_item": "3.1 原料採購成本",
@@ -314,23 +363,90 @@ def get_empty_form(my_company):
         "payments": pd.DataFrame([{"期數": "月結", "預計付款日": date.today(), "金額": 0}])
     }
 
+def render_doc_download(supabase, po_no, my_company, kind, doc_name, renderer, file_name):
+    # 第一步按鈕才讀取匯出資料並產生檔案 (經 doc_engine 快取)，第二步才是下載
+    state_key = f"po_doc_{kind}_{po_no}"
+    if state_key not in st.session_state:
+        if st.button(f"🖨️ 產生 {doc_name}", key=f"gen_{state_key}", use_container_width=True):
+            full_po_data = load_po_data_raw(supabase, po_no)
+            if full_po_data:
+                st.session_state[state_key] = doc_engine.render_cached(kind, renderer, full_po_data, my_company)
+                st.rerun()
+        return
+    st.download_button(
+        label=f"📥 下載 {doc_name}",
+        data=st.session_state[state_key],
+        file_name=file_name,
+        mime=DOC_MIME.get(os.path.splitext(file_name)[1], "application/octet-stream"),
+        use_container_width=True
+    )
+
+def render_pdf_unavailable(doc_name):
+    # 沒有中文字型時 PDF 只會印出 ?，停用按鈕並說明原因
+    st.button(f"🖨️ 產生 {doc_name}", disabled=True, use_container_width=True, key=f"po_pdf_off_{doc_name}")
+    st.caption(pdf_engine.MISSING_FONT_HINT)
+
+def render_batch_export(supabase, my_company):
+    with st.expander("📦 批次匯出 (多張 PO 打包 zip)", expanded=False):
+        projects = cache_engine.get_projects(supabase)
+        b1, b2, b3 = st.columns([2, 1, 1])
+        e_proj = b1.selectbox("專案", ["(全部)"] + [p['project_code'] for p in projects], key="po_export_proj")
+        e_from = b2.date_input("採購日 (起)", value=None, key="po_export_from")
+        e_to = b3.date_input("採購日 (迄)", value=None, key="po_export_to")
+
+        if st.button("🗜️ 產生 zip", key="po_export_run"):
+            try:
+                po_list = export_engine.fetch_po_bundle(
+                    supabase, project_code=None if e_proj == "(全部)" else e_proj, date_from=e_from, date_to=e_to
+                )
+            except Exception as e:
+                st.error(f"匯出數據讀取失敗: {e}")
+                return
+            if not po_list:
+                st.warning("沒有符合條件的採購單")
+                return
+
+            my_bar = st.progress(0, text=f"產生中 0 / {len(po_list)}")
+            data, errors = export_engine.export_zip(
+                po_list, my_company,
+                progress=lambda done, total: my_bar.progress(done / total, text=f"產生中 {done} / {total}")
+            )
+            my_bar.empty()
+            st.session_state.po_export_zip = data
+            if errors:
+                st.warning(f"{len(errors)} 張產生失敗：" + "、".join(str(no) for no, _ in errors[:10]))
+            st.success(f"✅ 已打包 {len(po_list) - len(errors)} 張採購單")
+
+        if st.session_state.get("po_export_zip"):
+            st.download_button(
+                label="📥 下載 zip",
+                data=st.session_state.po_export_zip,
+                file_name=f"PO_Export_{date.today():%Y%m%d}.zip",
+                mime="application/zip",
+                use_container_width=True
+            )
+
+def clear_doc_downloads():
+    # 存檔/刪除後已產生的檔案可能過期，清掉讓使用者重新產生
+    for k in [k for k in st.session_state.keys() if str(k).startswith("po_doc_")]:
+        del st.session_state[k]
+
 def load_po_data(supabase, po_no):
     try:
-        head = supabase.table("purchase_orders").select("*, partners(name)").eq("po_number", po_no).single().execute().data
-        items = supabase.table("po_items").select("product_name, spec, quantity, unit_price, amount").eq("po_number", po_no).execute().data
-        cpm = supabase.table("po_provided_materials").select("material_name, spec, quantity, unit, remarks").eq("po_number", po_no).execute().data
-        pays = supabase.table("po_payments").select("term_name, expected_date, amount").eq("po_number", po_no).execute().data
-        
-        df_items = pd.DataFrame(items).rename(columns={"product_name": "品項", "spec": "規格", "quantity": "數量", "unit_price": "單價", "amount": "金額"})
-        df_cpm = pd.DataFrame(cpm).rename(columns={"material_name": "自備料品項", "spec": "規格", "quantity": "預計提供數量", "unit": "單位", "remarks": "備註"})
+        # 表頭與子表一次查回 (與匯出共用同一份快照)
+        head = cache_engine.get_po_doc(supabase, po_no)
+        df_items = pd.DataFrame(head["po_items"], columns=["id", "product_name", "spec", "quantity", "unit_price", "amount"]) \
+            .rename(columns={"product_name": "品項", "spec": "規格", "quantity": "數量", "unit_price": "單價", "amount": "金額"})
+        df_cpm = pd.DataFrame(head["po_provided_materials"], columns=["id", "material_name", "spec", "quantity", "unit", "remarks"]).rename(columns={"material_name": "自備料品項", "spec": "規格", "quantity": "預計提供數量", "unit": "單位", "remarks": "備註"})
         if df_cpm.empty: df_cpm = pd.DataFrame([{"自備料品項": "", "規格": "", "預計提供數量": 0, "單位": "", "備註": ""}])
 
-        df_pays = pd.DataFrame(pays).rename(columns={"term_name": "期數", "expected_date": "預計付款日", "amount": "金額"})
+        df_pays = pd.DataFrame(head["po_payments"], columns=["id", "term_name", "expected_date", "amount"]).rename(columns={"term_name": "期數", "expected_date": "預計付款日", "amount": "金額"})
         if not df_pays.empty: df_pays["預計付款日"] = pd.to_datetime(df_pays["預計付款日"]).dt.date
 
         st.session_state.po_form_data = {
             "po_no": head["po_number"], "project_code": head["project_code"], 
             "supplier_name": head["partners"]["name"], "cost_item": head["cost_item"],
+            "supplier_id": head["supplier_id"], "total_amount": head.get("total_amount") or 0,
             "order_date": datetime.strptime(head["order_date"], "%Y-%m-%d").date(),
             "tax_type": head["tax_type"], 
             "payment_terms": head.get("payment_terms", ""), "trade_terms": head.get("trade_terms", ""),
@@ -342,9 +458,10 @@ def load_po_data(supabase, po_no):
 
 def load_po_data_raw(supabase, po_no):
     try:
-        head = supabase.table("purchase_orders").select("*, partners(*), project_code").eq("po_number", po_no).single().execute().data
-        head['items'] = supabase.table("po_items").select("*").eq("po_number", po_no).execute().data
-        head['provided_materials'] = supabase.table("po_provided_materials").select("*").eq("po_number", po_no).execute().data
+        head = cache_engine.get_po_doc(supabase, po_no)
+        head['items'] = head.pop('po_items')
+        head['provided_materials'] = head.pop('po_provided_materials')
+        head['payments'] = head.pop('po_payments')
         if head.get('partners'): head['supplier_name'] = head['partners']['name']
         else: head['supplier_name'] = "Unknown Vendor"
         return head
@@ -354,80 +471,115 @@ def load_po_data_raw(supabase, po_no):
 
 def save_po(supabase, data, items_df, cpm_df, pay_df):
     try:
-        supabase.table("purchase_orders").upsert({
+        po_header = {
             "po_number": data["po_no"], "project_code": data["p_code"], "supplier_id": data["supp_id"], 
             "cost_item": data["cost_item"], "order_date": str(data["order_date"]), "tax_type": data["tax_type"], 
             "total_amount": data["total"], "status": "Confirmed",
             "payment_terms": data["payment_terms"], "trade_terms": data["trade_terms"],
             "ship_to_address": data["ship_to"], "bill_to_address": data["bill_to"], "receiver_contact": data["contact"]
-        }).execute()
-        
-        supabase.table("po_items").delete().eq("po_number", data["po_no"]).execute()
+        }
+
         items_list = []
         for _, r in items_df.iterrows():
             if r.get("品項"):
                 items_list.append({
-                    "po_number": data["po_no"], "product_name": r["品項"], "spec": r.get("規格"), 
+                    "id": r.get("id"), "po_number": data["po_no"], "product_name": r["品項"], "spec": r.get("規格"), 
                     "quantity": float(r["數量"]), "unit_price": float(r["單價"]), "amount": float(r["數量"])*float(r["單價"])
                 })
-        if items_list: supabase.table("po_items").insert(items_list).execute()
 
-        supabase.table("po_provided_materials").delete().eq("po_number", data["po_no"]).execute()
         cpm_list = []
         for _, r in cpm_df.iterrows():
             if r.get("自備料品項"):
                 cpm_list.append({
-                    "po_number": data["po_no"], "material_name": r["自備料品項"], "spec": r.get("規格"),
+                    "id": r.get("id"), "po_number": data["po_no"], "material_name": r["自備料品項"], "spec": r.get("規格"),
                     "quantity": float(r["預計提供數量"]), "unit": r.get("單位"), "remarks": r.get("備註")
                 })
-        if cpm_list: supabase.table("po_provided_materials").insert(cpm_list).execute()
 
-        supabase.table("po_payments").delete().eq("po_number", data["po_no"]).execute()
         pay_list = []
         for _, r in pay_df.iterrows():
             if r["金額"] > 0:
-                pay_list.append({"po_number": data["po_no"], "term_name": r.get("期數"), "expected_date": str(r["預計付款日"]), "amount": float(r["金額"])})
-        if pay_list: supabase.table("po_payments").insert(pay_list).execute()
-
-        sync_po_matrix(supabase, data["p_code"], data["cost_item"])
+                pay_list.append({"id": r.get("id"), "po_number": data["po_no"], "term_name": r.get("期數"), "expected_date": str(r["預計付款日"]), "amount": float(r["金額"])})
+
+        # 表頭 + 子表 + 矩陣實際數 一次 RPC、同一交易完成
+        totals = save_engine.save_po(supabase, po_header, items_list, cpm_list, pay_list)
+        if totals is None:
+            # 資料庫尚未建立 save_purchase_order 函式：逐步存檔
+            # 先記下存檔前的月份彙總 (含舊的專案/科目)，存檔後只同步差額
+            before = sync_engine.snapshot_po(supabase, data["po_no"])
+            supabase.table("purchase_orders").upsert(po_header).execute()
+            # 子表依 row id 差異存檔，只寫有變動的列
+            persist_engine.persist_children(supabase, "po_items", "po_number", data["po_no"], items_list, PO_ITEM_FIELDS)
+            persist_engine.persist_children(supabase, "po_provided_materials", "po_number", data["po_no"], cpm_list, PO_CPM_FIELDS)
+            persist_engine.persist_children(supabase, "po_payments", "po_number", data["po_no"], pay_list, PO_PAY_FIELDS)
+
+            after = sync_engine.doc_actuals(pay_list, data["p_code"], data["cost_item"])
+            sync_engine.apply_delta(supabase, before, after)
+        cache_engine.bump("purchase_orders")
+        clear_doc_downloads()
         st.success("✅ 儲存成功！")
         time.sleep(1)
         st.rerun()
     except Exception as e: st.error(f"存檔失敗: {e}")
 
-def sync_po_matrix(supabase, p_code, cost_item):
-    res = supabase.table("po_payments").select("expected_date, amount, purchase_orders!inner(project_code, cost_item)").eq("purchase_orders.project_code", p_code).eq("purchase_orders.cost_item", cost_item).execute()
-    monthly_cost = {}
-    if res.data:
-        for row in res.data:
-            d = datetime.strptime(row['expected_date'], "%Y-%m-%d")
-            m_key = d.replace(day=1).strftime("%Y-%m-%d")
-            monthly_cost[m_key] = monthly_cost.get(m_key, 0) + row['amount']
-    for m, amt in monthly_cost.items():
-        exist = supabase.table("project_matrix").select("plan_amount").eq("project_code", p_code).eq("year_month", m).eq("cost_item", cost_item).execute()
-        plan = exist.data[0]['plan_amount'] if exist.data else 0
-        supabase.table("project_matrix").upsert(
-            {"project_code": p_code, "year_month": m, "cost_item": cost_item, "plan_amount": plan, "real_amount": amt},
-            on_conflict="project_code, year_month, cost_item"
-        ).execute()
-
 def render_po_list(supabase):
+    st.subheader("📋 採購列表")
+
+    # --- 篩選列 (全部在伺服器端過濾) ---
+    projects = cache_engine.get_projects(supabase)
+    supp_map = {p['name']: p['id'] for p in cache_engine.get_partners(supabase, "id, name", p_type="Supplier")}
+    f1, f2, f3, f4, f5 = st.columns([2, 2, 1, 1, 1])
+    f_proj = f1.selectbox("專案", ["(全部)"] + [p['project_code'] for p in projects], key="po_list_proj")
+    f_supp = f2.selectbox("供應商", ["(全部)"] + list(supp_map.keys()), key="po_list_supp")
+    f_status = f3.selectbox("狀態", ["(全部)"] + PO_STATUSES, key="po_list_status")
+    d_from = f4.date_input("採購日 (起)", value=None, key="po_list_from")
+    d_to = f5.date_input("採購日 (迄)", value=None, key="po_list_to")
+
+    def apply_filters(q):
+        if f_proj != "(全部)": q = q.eq("project_code", f_proj)
+        if f_supp != "(全部)": q = q.eq("supplier_id", supp_map[f_supp])
+        if f_status != "(全部)": q = q.eq("status", f_status)
+        if d_from: q = q.gte("order_date", str(d_from))
+        if d_to: q = q.lte("order_date", str(d_to))
+        return q
+
+    cursors = list_engine.page_cursors("po_list", (f_proj, f_supp, f_status, d_from, d_to))
     try:
-        res = supabase.table("purchase_orders").select("po_number, total_amount, partners(name), project_code").order("created_at", desc=True).execute()
-        if res.data:
-            st.subheader("📋 採購列表")
-            for r in res.data:
-                with st.container(border=True):
-                    c1, c2, c3 = st.columns([3, 2, 1])
-                    c1.markdown(f"**{r['po_number']}**")
-                    c1.caption(f"{r['partners']['name']} | {r['project_code']}")
-                    c2.markdown(f"${r['total_amount']:,.0f}")
-                    if c3.button("🗑️", key=f"del_{r['po_number']}"):
-                        supabase.table("purchase_orders").delete().eq("po_number", r['po_number']).execute()
-                        st.toast("已刪除")
-                        time.sleep(1)
-                        st.rerun()
-    except: pass
+        # 總筆數 (只回 count) 與當頁資料同時查詢
+        res = core_engine.run_queries({
+            "total": lambda: list_engine.count_rows(apply_filters(supabase.table("purchase_orders").select("po_number", count="exact", head=True))),
+            "page": lambda: list_engine.fetch_page(
+                apply_filters(supabase.table("purchase_orders").select("po_number, order_date, total_amount, status, partners(name), project_code")),
+                LIST_KEYS, cursors[-1], LIST_PAGE_SIZE
+            ),
+        })
+    except Exception as e:
+        st.error(f"讀取列表失敗: {e}")
+        return
+
+    rows, next_cursor = res["page"]
+    if not rows:
+        st.info("尚無採購單")
+        return
+    for r in rows:
+        with st.container(border=True):
+            c1, c2, c3 = st.columns([3, 2, 1])
+            c1.markdown(f"**{r['po_number']}**")
+            supp_name = r['partners']['name'] if r['partners'] else "Unknown"
+            c1.caption(f"{supp_name} | {r['project_code']} | {r['order_date']}")
+            c2.markdown(f"${r['total_amount']:,.0f}")
+            if c3.button("🗑️", key=f"del_{r['po_number']}"):
+                try:
+                    before = sync_engine.snapshot_po(supabase, r['po_number'])
+                    supabase.table("purchase_orders").delete().eq("po_number", r['po_number']).execute()
+                    cache_engine.bump("purchase_orders")
+                    sync_engine.apply_delta(supabase, before, {})
+                except Exception as e:
+                    st.error(f"刪除失敗: {e}")
+                else:
+                    st.toast("已刪除")
+                    time.sleep(1)
+                    st.rerun()
+    list_engine.render_pager(cursors, next_cursor, "po_list", res["total"], LIST_PAGE_SIZE)
 
 # --- Excel Generator ---
 def generate_excel_po(po_data, my_company):
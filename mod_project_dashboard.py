@@ -1,20 +1,25 @@
 import streamlit as st
 import pandas as pd
+import dashboard_engine
+import core_engine
+import list_engine
+import rollup_engine
 
 def show(supabase):
     st.markdown('<p class="main-header">📊 經營決策看板 (Project Dashboard)</p>', unsafe_allow_html=True)
     st.caption("全公司專案戰情室 | 預算 (Plan) vs 實際 (Real) 即時監控")
 
-    # --- 1. 讀取資料 (一次撈出所有專案與矩陣數據) ---
+    # --- 1. 讀取資料 (專案清單 + 專案 x 類別 彙總，不再撈全部矩陣格子) ---
     try:
-        # 抓專案清單
-        res_proj = supabase.table("projects").select("project_code, project_name, pm_owner, start_date, end_date, partners(name)").execute()
-        df_proj = pd.DataFrame(res_proj.data)
-        
-        # 抓矩陣數據 (只抓有數值的)
-        # 注意：這裡我們把 Plan 和 Real 都抓出來
-        res_matrix = supabase.table("project_matrix").select("project_code, cost_item, plan_amount, real_amount").execute()
-        df_matrix = pd.DataFrame(res_matrix.data)
+        # 專案清單與彙總數據 (Plan 和 Real 都有) 同時查詢
+        res = core_engine.run_queries({
+            "projects": lambda: list_engine.fetch_all(
+                lambda: supabase.table("projects").select("project_code, project_name, pm_owner, start_date, end_date, partners(name)"),
+                [("project_code", False)]),
+            "totals": lambda: rollup_engine.project_totals(supabase),
+        })
+        df_proj = pd.DataFrame(res["projects"])
+        agg = dashboard_engine.aggregate_rollup(res["totals"])
 
     except Exception as e:
         st.error(f"資料讀取失敗: {e}")
@@ -25,64 +30,8 @@ def show(supabase):
         return
 
     # --- 2. 數據清洗與彙總 (Aggregation) ---
-    # 目標：算出每個專案的 總收入、總成本、毛利
-    
-    dashboard_data = []
-
-    for _, proj in df_proj.iterrows():
-        p_code = proj['project_code']
-        p_name = proj['project_name']
-        cust_name = proj['partners']['name'] if proj['partners'] else "未知"
-        
-        # 篩選該專案的矩陣資料
-        if not df_matrix.empty:
-            mask = df_matrix['project_code'] == p_code
-            my_data = df_matrix[mask]
-        else:
-            my_data = pd.DataFrame()
-
-        # 初始化數值
-        plan_rev = 0.0
-        plan_cost = 0.0
-        real_rev = 0.0
-        real_cost = 0.0
-
-        if not my_data.empty:
-            # 依據憲法科目編號邏輯分類
-            # 2.x 開頭 = 收入
-            # 3.x 開頭 = 費用
-            
-            # --- Plan 計算 ---
-            plan_rev = my_data[my_data['cost_item'].str.startswith("2.", na=False)]['plan_amount'].sum()
-            plan_cost = my_data[my_data['cost_item'].str.startswith("3.", na=False)]['plan_amount'].sum()
-            
-            # --- Real 計算 (未來 SO/PO 寫入後會自動生效) ---
-            real_rev = my_data[my_data['cost_item'].str.startswith("2.", na=False)]['real_amount'].sum()
-            real_cost = my_data[my_data['cost_item'].str.startswith("3.", na=False)]['real_amount'].sum()
-
-        # 毛利計算
-        plan_profit = plan_rev - plan_cost
-        plan_margin = (plan_profit / plan_rev * 100) if plan_rev != 0 else 0.0
-        
-        real_profit = real_rev - real_cost
-        real_margin = (real_profit / real_rev * 100) if real_rev != 0 else 0.0
-
-        dashboard_data.append({
-            "專案代碼": p_code,
-            "專案名稱": p_name,
-            "客戶": cust_name,
-            "預算總收入": plan_rev,
-            "預算總成本": plan_cost,
-            "預算毛利 $": plan_profit,
-            "預算毛利率 %": plan_margin,
-            "實際總收入": real_rev,
-            "實際總成本": real_cost,
-            "實際毛利 $": real_profit,
-            "實際毛利率 %": real_margin,
-            "達成率 (Rev)": (real_rev / plan_rev * 100) if plan_rev != 0 else 0.0
-        })
-
-    df_dash = pd.DataFrame(dashboard_data)
+    # 目標：算出每個專案的 總收入、總成本、毛利 (一次 groupby 完成全部專案)
+    df_dash = dashboard_engine.build_dashboard(df_proj, agg=agg)
 
     # --- 3. 頂部 KPI 卡片 (全公司加總) ---
     st.markdown("### 🏢 全公司匯總 (Company Overview)")
@@ -1,14 +1,17 @@
 import streamlit as st
 import pandas as pd
 import time
+import cache_engine
+import persist_engine
+import import_engine
 
 def show(supabase):
     st.markdown('<p class="main-header">🚀 專案身分建檔 (Project Identity)</p>', unsafe_allow_html=True)
 
     # --- 1. 讀取 CRM 客戶資料 (連動下拉) ---
     try:
-        res = supabase.table("partners").select("id, name").eq("type", "Customer").execute()
-        customers = {row['name']: row['id'] for row in res.data}
+        rows = cache_engine.get_partners(supabase, "id, name", p_type="Customer")
+        customers = {row['name']: row['id'] for row in rows}
     except Exception as e:
         st.error(f"讀取客戶資料失敗: {e}")
         customers = {}
@@ -71,9 +74,7 @@ def show(supabase):
                         supabase.table("projects").upsert(proj_data).execute()
 
                         # 2. 寫入子表 Project Items
-                        # 先清舊再寫新
-                        supabase.table("project_items").delete().eq("project_code", p_code).execute()
-                        
+                        # 表單沒有 row id，以品項名稱對應既有列，只寫有變動的列
                         items_to_insert = []
                         if not edited_df.empty:
                             for _, row in edited_df.iterrows():
@@ -84,9 +85,12 @@ def show(supabase):
                                         "quantity": int(row["quantity"])
                                     })
                         
-                        if items_to_insert:
-                            supabase.table("project_items").insert(items_to_insert).execute()
+                        persist_engine.persist_children(
+                            supabase, "project_items", "project_code", p_code, items_to_insert,
+                            ["project_code", "item_name", "quantity"], match_on=["item_name"]
+                        )
 
+                        cache_engine.bump("projects")
                         st.toast(f"✅ 專案 {p_code} 建立成功！")
                         time.sleep(1)
                         st.rerun()
@@ -94,6 +98,10 @@ def show(supabase):
                     except Exception as e:
                         st.error(f"寫入資料庫失敗: {e}")
 
+    # --- 批次匯入 (專案 / 產品清單) ---
+    with st.expander("📥 批次匯入專案 (CSV / Excel)"):
+        import_engine.render_import(supabase, ["projects", "project_items"], "proj")
+
     # --- 3. 專案列表與管理區 (改為卡片式顯示以便管理) ---
     st.divider()
     st.subheader("📋 已建檔專案清單")
@@ -127,6 +135,7 @@ def show(supabase):
                         if st.button(f"🗑️ 永久刪除", key=f"del_{r['project_code']}"):
                             try:
                                 supabase.table("projects").delete().eq("project_code", r['project_code']).execute()
+                                cache_engine.bump("projects")
                                 st.success(f"已刪除 {r['project_code']} 及其所有關聯資料。")
                                 time.sleep(1)
                                 st.rerun()
@@ -0,0 +1,285 @@
+import copy
+import io
+import os
+import threading
+from functools import lru_cache
+from fpdf import FPDF
+from fpdf.fonts import SubsetMap
+from fontTools import ttLib
+
+# --- PDF 單據產生器 (PO / 自備料交貨單 / Invoice) ---
+# 資料結構與 Excel 版相同 (load_po_data_raw 的 dict)。
+# 效能重點：
+# 1. 中文字型只解析一次：範本 FPDF 先 add_font，每張單共用解析好的字寬表，只另開 subset 用的字型物件
+# 2. fpdf2 內嵌 TTF 時只保留用到的字 (subset)，檔案維持在數十 KB
+# 3. Logo 原圖很大，每個程序只縮圖一次，之後重用縮好的 PNG
+
+FONT_ENV = "HTX_PDF_FONT"  # 可用環境變數指定字型檔
+FONT_CANDIDATES = [
+    "fonts/NotoSansTC-Regular.ttf",
+    "fonts/NotoSansTC-Regular.otf",
+    "fonts/NotoSansCJKtc-Regular.otf",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "C:/Windows/Fonts/msjh.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+]
+# 沒有中文字型時畫面上顯示的說明 (PDF 按鈕停用)
+MISSING_FONT_HINT = f"找不到中文字型，PDF 無法顯示中文：請將 NotoSansTC-Regular.ttf 放到 fonts/，或以環境變數 {FONT_ENV} 指定字型檔"
+LOGO_PATH = "logo.png"
+LOGO_MAX_WIDTH_PX = 600
+FONT = "cjk"
+
+_template_lock = threading.Lock()
+
+@lru_cache(maxsize=1)
+def font_path():
+    for p in [os.environ.get(FONT_ENV)] + FONT_CANDIDATES:
+        if p and os.path.exists(p):
+            return p
+    return None
+
+@lru_cache(maxsize=1)
+def logo_png():
+    if not os.path.exists(LOGO_PATH):
+        return None
+    try:
+        from PIL import Image
+    except ImportError:
+        with open(LOGO_PATH, "rb") as f:
+            return f.read()
+    with Image.open(LOGO_PATH) as img:
+        if img.width > LOGO_MAX_WIDTH_PX:
+            img = img.resize((LOGO_MAX_WIDTH_PX, round(img.height * LOGO_MAX_WIDTH_PX / img.width)))
+        out = io.BytesIO()
+        img.save(out, format="PNG", optimize=True)
+        return out.getvalue()
+
+@lru_cache(maxsize=1)
+def _font_bytes():
+    with open(font_path(), "rb") as f:
+        return f.read()
+
+@lru_cache(maxsize=1)
+def _template():
+    # 只用來保存解析好的字型 (字寬表、glyph 對照)，本身不輸出
+    pdf = FPDF(format="A4")
+    path = font_path()
+    if path:
+        pdf.add_font(FONT, "", path)
+    return pdf
+
+def _clone_font(base_font):
+    # 字寬表 cw、glyph_ids、cmap 等唯讀資料與範本共用；
+    # 輸出時 subset 會就地修改 fontTools 物件，所以每張單從記憶體中的字型檔開一個新的 (lazy)
+    font = copy.copy(base_font)
+    font.ttfont = ttLib.TTFont(
+        io.BytesIO(_font_bytes()), recalcTimestamp=False,
+        fontNumber=getattr(base_font, "collection_font_number", 0), lazy=True
+    )
+    font.missing_glyphs = []
+    font.biggest_size_pt = 0
+    font.subset = SubsetMap(font)
+    return font
+
+def _new_pdf():
+    pdf = FPDF(format="A4")
+    pdf.set_margins(12, 12, 12)
+    pdf.set_auto_page_break(True, margin=15)
+    if not font_path():
+        return pdf
+    base = _template()
+    try:
+        with _template_lock:
+            for key, base_font in base.fonts.items():
+                pdf.fonts[key] = _clone_font(base_font)
+    except Exception:
+        # fpdf2 內部結構若有變動，退回每張單自行載入字型
+        pdf.fonts.clear()
+        pdf.add_font(FONT, "", font_path())
+    return pdf
+
+def has_cjk_font():
+    return font_path() is not None
+
+def _txt(val):
+    s = "" if val is None else str(val)
+    if has_cjk_font():
+        return s
+    # 沒有中文字型時退回內建字型，無法顯示的字以 ? 取代
+    return s.encode("latin-1", "replace").decode("latin-1")
+
+def _set_font(pdf, size, bold=False):
+    if has_cjk_font():
+        pdf.set_font(FONT, size=size)
+    else:
+        pdf.set_font("helvetica", style="B" if bold else "", size=size)
+
+def _num(val):
+    try: return f"{float(val):,.0f}"
+    except (TypeError, ValueError): return ""
+
+# --- 共用版面 ---
+def _header(pdf, title, my_company):
+    pdf.add_page()
+    logo = logo_png()
+    if logo:
+        pdf.image(io.BytesIO(logo), x=12, y=10, w=55)
+    _set_font(pdf, 18, bold=True)
+    pdf.set_xy(70, 12)
+    pdf.cell(128, 12, _txt(title), align="R")
+    _set_font(pdf, 9)
+    pdf.set_xy(12, 26)
+    comp = f"{my_company.get('company_name_zh', 'HTX')}\n{my_company.get('address', '')}\nTel: {my_company.get('phone', '')}"
+    pdf.multi_cell(186, 5, _txt(comp), align="C")
+    pdf.ln(3)
+
+def _box(pdf, x, y, w, h, label, body):
+    pdf.set_xy(x, y)
+    pdf.set_fill_color(239, 239, 239)
+    _set_font(pdf, 9, bold=True)
+    pdf.cell(w, 6, _txt(label), border=1, fill=True)
+    pdf.set_xy(x, y + 6)
+    _set_font(pdf, 9)
+    pdf.multi_cell(w, 5, _txt(body), border=1, max_line_height=5)
+    pdf.rect(x, y + 6, w, h - 6)
+
+def _table(pdf, headers, widths, rows, aligns):
+    pdf.set_fill_color(217, 217, 217)
+    _set_font(pdf, 9, bold=True)
+    for h, w in zip(headers, widths):
+        pdf.cell(w, 7, _txt(h), border=1, align="C", fill=True)
+    pdf.ln()
+    _set_font(pdf, 9)
+    for row in rows:
+        for val, w, a in zip(row, widths, aligns):
+            pdf.cell(w, 6, _txt(val), border=1, align=a)
+        pdf.ln()
+
+def _signatures(pdf, left, right):
+    pdf.ln(12)
+    y = pdf.get_y()
+    _box(pdf, 12, y, 90, 28, left, "")
+    _box(pdf, 108, y, 90, 28, right, "")
+
+def _doc_number(data):
+    return data.get("invoice_no") or data.get("po_number") or data.get("so_number") or ""
+
+# --- 1. 採購單 ---
+def render_po_pdf(po_data, my_company):
+    pdf = _new_pdf()
+    _header(pdf, "採購訂單 PURCHASE ORDER", my_company)
+
+    y = pdf.get_y()
+    supp = po_data.get("partners") or {}
+    _box(pdf, 12, y, 110, 30, "Vendor (供應商):",
+         f"{supp.get('name', '')}\n{supp.get('company_address', '')}\nAttn: {supp.get('contact_person', '')}\nTel: {supp.get('company_phone', '')}")
+    _box(pdf, 126, y, 72, 30, "PO Info:",
+         f"PO NO: {po_data.get('po_number', '')}\nDATE: {po_data.get('order_date', '')}\nPROJECT: {po_data.get('project_code', '')}")
+    y += 34
+    _box(pdf, 12, y, 110, 24, "Ship To (送貨地址):", f"{po_data.get('ship_to_address', '')}\nAttn: {po_data.get('receiver_contact', '')}")
+    _box(pdf, 126, y, 72, 24, "Terms (條款):",
+         f"Pay: {po_data.get('payment_terms', '')}\nTrade: {po_data.get('trade_terms', '')}\nTax: {po_data.get('tax_type', '')}")
+    pdf.set_xy(12, y + 28)
+
+    rows = [
+        (i.get("product_name"), i.get("spec"), _num(i.get("quantity")), "pcs", _num(i.get("unit_price")), _num(i.get("amount")))
+        for i in po_data.get("items", [])
+    ]
+    _table(pdf, ["Item Name", "Spec / Description", "Qty", "Unit", "Price", "Amount"],
+           [50, 56, 18, 14, 22, 26], rows, ["L", "L", "R", "C", "R", "R"])
+    _set_font(pdf, 10, bold=True)
+    pdf.cell(160, 7, "Total:", align="R")
+    pdf.cell(26, 7, _num(po_data.get("total_amount")), border=1, align="R")
+    pdf.ln()
+
+    _signatures(pdf, "Confirmed By (Supplier):", "Approved By (Buyer):")
+    return bytes(pdf.output())
+
+# --- 2. 自備料交貨單 ---
+def render_delivery_note_pdf(po_data, my_company):
+    pdf = _new_pdf()
+    _header(pdf, "自備料交貨單 MATERIAL DELIVERY NOTE", my_company)
+
+    _set_font(pdf, 12, bold=True)
+    pdf.cell(186, 8, _txt(f"Ref PO No.: {po_data.get('po_number', '')}"), align="C")
+    pdf.ln(10)
+    supp = po_data.get("partners") or {}
+    y = pdf.get_y()
+    _box(pdf, 12, y, 90, 14, "To (Receiver):", supp.get("name", po_data.get("supplier_name", "Unknown")))
+    _box(pdf, 108, y, 90, 14, "From (Sender):", my_company.get("company_name_zh", "HTX"))
+    pdf.set_xy(12, y + 18)
+
+    rows = [
+        (m.get("material_name"), m.get("spec"), _num(m.get("quantity")), m.get("unit"), m.get("remarks"))
+        for m in po_data.get("provided_materials", [])
+    ]
+    _table(pdf, ["Item Name", "Spec", "Quantity", "Unit", "Remarks"], [50, 46, 24, 20, 46], rows, ["L", "L", "R", "C", "L"])
+
+    pdf.ln(6)
+    _set_font(pdf, 9)
+    pdf.multi_cell(186, 5, _txt("聲明：收到上述物料無誤，本批物料僅供指定 PO 訂單加工使用，加工完成後餘料需退回。"))
+    _signatures(pdf, "Received By (Sign):", "Date:")
+    return bytes(pdf.output())
+
+# --- 3. Invoice (頁尾帶 company_settings.bank_info) ---
+def render_invoice_pdf(inv_data, my_company):
+    pdf = _new_pdf()
+    _header(pdf, "發票 INVOICE", my_company)
+
+    y = pdf.get_y()
+    cust = inv_data.get("partners") or {}
+    _box(pdf, 12, y, 110, 26, "Bill To (客戶):",
+         f"{cust.get('name', '')}\n{cust.get('company_address', '')}\nTax ID: {cust.get('tax_id', '')}")
+    _box(pdf, 126, y, 72, 26, "Invoice Info:",
+         f"NO: {_doc_number(inv_data)}\nDATE: {inv_data.get('order_date', '')}\nPROJECT: {inv_data.get('project_code', '')}")
+    pdf.set_xy(12, y + 30)
+
+    rows = [
+        (i.get("product_name"), i.get("spec"), _num(i.get("quantity")), _num(i.get("unit_price")), _num(i.get("amount")))
+        for i in inv_data.get("items", [])
+    ]
+    _table(pdf, ["Item Name", "Spec / Description", "Qty", "Price", "Amount"], [56, 64, 18, 22, 26], rows, ["L", "L", "R", "R", "R"])
+    _set_font(pdf, 10, bold=True)
+    pdf.cell(160, 7, _txt(f"Total ({inv_data.get('tax_type', '')}):"), align="R")
+    pdf.cell(26, 7, _num(inv_data.get("total_amount")), border=1, align="R")
+    pdf.ln(12)
+
+    bank = my_company.get("bank_info") or ""
+    if bank:
+        _box(pdf, 12, pdf.get_y(), 186, 30, "Bank Info (匯款資料):", bank)
+    return bytes(pdf.output())
+
+RENDERERS = {"po": render_po_pdf, "dn": render_delivery_note_pdf, "invoice": render_invoice_pdf}
+
+def render_batch(kind, docs, my_company):
+    # 同一程序內連續產生，字型/Logo 只在第一張時載入
+    renderer = RENDERERS[kind]
+    return [renderer(d, my_company) for d in docs]
+
+# --- 效能測試 (python pdf_engine.py [張數]) ---
+def _benchmark(n_docs=200):
+    import time
+    my_company = {"company_name_zh": "HTX 測試股份有限公司", "address": "台北市", "phone": "02-0000-0000",
+                  "bank_info": "台灣銀行 城中分行\n帳號 000-00-000000"}
+    doc = {
+        "po_number": "PO-BENCH-00001", "order_date": "2026-01-15", "project_code": "SLS-MFG-Miz-2601",
+        "tax_type": "含稅", "total_amount": 100000, "payment_terms": "月結 60 天", "trade_terms": "FOB",
+        "ship_to_address": "台北市松山區", "receiver_contact": "王小明",
+        "partners": {"name": "台塑化學 (Formosa Plastics)", "company_address": "台北市松山區敦化北路201號"},
+        "items": [{"product_name": f"PP塑膠粒-T{j}", "spec": "25kg/包", "quantity": 200, "unit_price": 450, "amount": 90000} for j in range(15)],
+        "provided_materials": [{"material_name": "機能布料", "spec": "150cm", "quantity": 20, "unit": "roll", "remarks": ""}],
+    }
+    t0 = time.perf_counter()
+    _template(); logo_png()
+    print(f"font: {font_path() or '(none, built-in latin font)'}; preload {(time.perf_counter() - t0) * 1000:.0f} ms")
+    for kind in RENDERERS:
+        t0 = time.perf_counter()
+        out = render_batch(kind, [doc] * n_docs, my_company)
+        dt = time.perf_counter() - t0
+        print(f"{kind:8s}: {n_docs} docs, {dt / n_docs * 1000:.1f} ms/doc, {len(out[0]) / 1024:.0f} KB/doc")
+
+if __name__ == "__main__":
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,76 @@
+import math
+import numbers
+
+# --- 子表差異存檔 (so_items / po_items / 付款 ...) ---
+# 以前存檔是「整批刪除再整批新增」，改一行也要重寫整張單。
+# 現在依 row id 比對資料庫現況與編輯後的列：
+#   - 資料庫有、編輯後沒有 -> 一次 in_() 刪除
+#   - 兩邊都有但內容不同   -> 一次 bulk upsert (帶 id)
+#   - 沒有 id 的新列       -> 一次 bulk insert
+# 內容沒變的列完全不寫。
+
+ROW_ID = "id"
+ID_CHUNK = 200  # in_() 單批 id 數，避免 URL 過長
+
+def clean_id(val):
+    # data_editor 新增的列 id 為 NaN/None
+    if val is None or (isinstance(val, str) and not val.strip()):
+        return None
+    if isinstance(val, numbers.Real) and not isinstance(val, bool):
+        if isinstance(val, numbers.Integral): return int(val)
+        if math.isnan(val): return None
+        return int(val)
+    return val
+
+def _blank(val):
+    # None / NaN / pandas 的 NA、NaT 都視為空值
+    if val is None: return True
+    try: return bool(val != val)
+    except TypeError: return True   # pd.NA 無法轉成 bool
+
+def _same(a, b):
+    a, b = (None if _blank(a) else a), (None if _blank(b) else b)
+    if isinstance(a, numbers.Real) and isinstance(b, numbers.Real):
+        return abs(float(a) - float(b)) < 1e-9
+    return str(a if a is not None else "") == str(b if b is not None else "")
+
+def diff_rows(stored, rows, fields, id_col=ROW_ID, match_on=None):
+    # stored: 資料庫現有列 (含 id)；rows: 編輯後的列 (新列沒有 id)
+    # match_on: 表單不帶 id 時改用自然鍵 (例如 item_name) 對應既有列
+    # 回傳 (inserts, updates, delete_ids)
+    by_id = {r[id_col]: r for r in stored}
+    by_key = {}
+    if match_on:
+        for r in stored:
+            by_key.setdefault(tuple(str(r.get(c)) for c in match_on), []).append(r[id_col])
+    inserts, updates, seen = [], [], set()
+    for row in rows:
+        rid = clean_id(row.get(id_col))
+        body = {k: v for k, v in row.items() if k != id_col}
+        if rid is None and match_on:
+            free = [i for i in by_key.get(tuple(str(body.get(c)) for c in match_on), []) if i not in seen]
+            rid = free[0] if free else None
+        old = by_id.get(rid)
+        if old is None or rid in seen:
+            # 沒有 id 或 id 已不屬於這張單 (例如被刪掉) -> 視為新列
+            inserts.append(body)
+            continue
+        seen.add(rid)
+        if any(not _same(old.get(f), body.get(f)) for f in fields):
+            # id 取資料庫原值 (DataFrame 內可能是 numpy 型別，無法序列化)
+            updates.append({id_col: old[id_col], **body})
+    delete_ids = [rid for rid in by_id if rid not in seen]
+    return inserts, updates, delete_ids
+
+def persist_children(supabase, table, parent_col, parent_val, rows, fields, id_col=ROW_ID, match_on=None):
+    # rows 需帶 parent_col 與 fields 欄位；回傳 {"insert": n, "update": n, "delete": n}
+    stored = supabase.table(table).select(", ".join([id_col, *fields])).eq(parent_col, parent_val).execute().data or []
+    inserts, updates, delete_ids = diff_rows(stored, rows, fields, id_col, match_on)
+
+    for i in range(0, len(delete_ids), ID_CHUNK):
+        supabase.table(table).delete().in_(id_col, delete_ids[i:i + ID_CHUNK]).execute()
+    if updates:
+        supabase.table(table).upsert(updates, on_conflict=id_col).execute()
+    if inserts:
+        supabase.table(table).insert(inserts).execute()
+    return {"insert": len(inserts), "update": len(updates), "delete": len(delete_ids)}
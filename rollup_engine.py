@@ -0,0 +1,77 @@
+import pandas as pd
+import streamlit as st
+import cache_engine
+import core_engine
+import dashboard_engine
+import list_engine
+
+# --- 月份彙總 (Rollup) 讀取 ---
+# project_month_rollup (專案 x 月份 x 類別) 由資料庫觸發器隨 project_matrix 寫入增量維護 (sql/matrix_rollup.sql)，
+# 專案看板只讀它的專案總計 view，筆數與矩陣格數無關。
+# 資料庫尚未建立彙總表時，退回撈 project_matrix 在本機彙總 (結果相同，只是比較慢)。
+
+ROLLUP_TABLE = "project_month_rollup"
+TOTALS_VIEW = "project_rollup_totals"
+CATEGORIES = ["order", "rev", "cost", "other"]
+# 這些表寫入時 project_matrix 會跟著變 (預算存檔 / SO、PO 收付款同步)
+DEPENDS = ("project_matrix", "sales_orders", "purchase_orders")
+# 分頁游標 (必須唯一)：view 每專案每類別一列；矩陣以 (專案, 月份, 科目) 唯一
+TOTALS_KEYS = (("project_code", False), ("category", False))
+MATRIX_KEYS = (("project_code", False), ("year_month", False), ("cost_item", False))
+
+def rollup_from_cells(rows):
+    # project_matrix 原始格子 -> 與 project_month_rollup 相同欄位
+    cols = ["project_code", "year_month", "category", "plan_amount", "real_amount"]
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return pd.DataFrame(columns=cols)
+    df["year_month"] = pd.to_datetime(df["year_month"]).dt.to_period("M").dt.to_timestamp().dt.strftime("%Y-%m-%d")
+    df["category"] = dashboard_engine.classify_items(df["cost_item"])
+    for c in ("plan_amount", "real_amount"):
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0.0)
+    return df.groupby(["project_code", "year_month", "category"], as_index=False)[["plan_amount", "real_amount"]].sum()[cols]
+
+def _numeric(df):
+    for c in ("plan_amount", "real_amount"):
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0.0)
+    return df
+
+@st.cache_data(ttl=cache_engine.DEFAULT_TTL, show_spinner=False)
+def _read_all(relation, columns, keys, ver, _supabase):
+    # PostgREST 單次最多回 max-rows (1000) 筆，整張表/view 以 keyset 分頁讀完
+    return list_engine.fetch_all(lambda: _supabase.table(relation).select(columns), list(keys))
+
+def _select_all(supabase, relation, columns, keys):
+    ver = tuple(cache_engine.version(t) for t in DEPENDS)
+    return _read_all(relation, columns, keys, ver, supabase)
+
+def _rollup_from_matrix(supabase):
+    cells = _select_all(supabase, "project_matrix", "project_code, year_month, cost_item, plan_amount, real_amount", MATRIX_KEYS)
+    return rollup_from_cells(cells)
+
+def project_totals(supabase):
+    # 每個專案每類別一列：DataFrame[project_code, category, plan_amount, real_amount]
+    try:
+        rows = _select_all(supabase, TOTALS_VIEW, "project_code, category, plan_amount, real_amount", TOTALS_KEYS)
+        return _numeric(pd.DataFrame(rows, columns=["project_code", "category", "plan_amount", "real_amount"]))
+    except Exception as e:
+        if not core_engine.is_missing_relation(e): raise
+    df = _rollup_from_matrix(supabase)
+    return df.groupby(["project_code", "category"], as_index=False)[["plan_amount", "real_amount"]].sum()
+
+# --- 效能測試 (python rollup_engine.py [專案數])：view 超過 max-rows 時要讀到每個專案 ---
+def _benchmark(n_projects=500, max_rows=1000):
+    import time
+    rows = [{"project_code": f"P{p:04d}", "category": c, "plan_amount": 1.0, "real_amount": 1.0}
+            for p in range(n_projects) for c in CATEGORIES]
+    db = list_engine._CappedQuery(rows, list(TOTALS_KEYS), max_rows)
+
+    t0 = time.perf_counter()
+    df = project_totals(db)
+    dt = time.perf_counter() - t0
+    assert df["project_code"].nunique() == n_projects, f"lost projects: {df['project_code'].nunique()} of {n_projects}"
+    print(f"project_totals(): {n_projects} projects, {len(df):,} rows (server max-rows {max_rows}) in {dt * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
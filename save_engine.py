@@ -0,0 +1,150 @@
+import json
+import numbers
+import os
+from datetime import date, datetime
+import core_engine
+import persist_engine
+
+# --- 單據原子存檔 (Atomic Save RPC) ---
+# 表頭 + 所有子表 + 矩陣實際數 一次送到 Postgres 函式 (sql/save_documents.sql)，
+# 在同一個交易內完成：一次來回，中途失敗整張單回滾，不會留下存一半的單據。
+# 資料庫尚未建立函式時回傳 None，呼叫端退回逐步存檔。
+
+SO_SAVE_FN = "save_sales_order"
+PO_SAVE_FN = "save_purchase_order"
+SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql")
+
+def _value(v):
+    if isinstance(v, (date, datetime)): return v.isoformat()[:10]
+    if isinstance(v, numbers.Integral) and not isinstance(v, bool): return int(v)
+    if isinstance(v, numbers.Real) and not isinstance(v, bool):
+        return None if v != v else float(v)  # NaN -> null
+    return v
+
+def _rows(rows):
+    out = []
+    for r in rows or []:
+        row = {k: _value(v) for k, v in r.items() if k != persist_engine.ROW_ID}
+        rid = persist_engine.clean_id(r.get(persist_engine.ROW_ID))
+        if rid is not None: row[persist_engine.ROW_ID] = rid
+        out.append(row)
+    return out
+
+def _call(supabase, fn, params):
+    try:
+        return supabase.rpc(fn, params).execute().data
+    except Exception as e:
+        if core_engine.is_missing_function(e): return None
+        raise
+
+def save_so(supabase, header, items, payments):
+    # 回傳 {"total_amount", "payment_total", "items", "payments", "matrix_cells"}；函式不存在時回傳 None
+    return _call(supabase, SO_SAVE_FN, {
+        "p_header": {k: _value(v) for k, v in header.items()},
+        "p_items": _rows(items), "p_payments": _rows(payments),
+    })
+
+def save_po(supabase, header, items, materials, payments):
+    return _call(supabase, PO_SAVE_FN, {
+        "p_header": {k: _value(v) for k, v in header.items()},
+        "p_items": _rows(items), "p_materials": _rows(materials), "p_payments": _rows(payments),
+    })
+
+# --- 效能比較 (python save_engine.py <postgres dsn> [次數] [模擬 RTT ms]) ---
+# 需要 psycopg；在本機 Postgres 建立 htx_bench schema，比較
+#   atomic : 一次 select save_sales_order(...)
+#   steps  : 逐步存檔 (snapshot、表頭、子表 diff、矩陣)，每個請求各自一次來回 (同 PostgREST)
+def _benchmark(dsn, n=50, rtt_ms=0.0):
+    import time
+    import psycopg
+
+    def sql_file(name):
+        with open(os.path.join(SQL_DIR, name), encoding="utf-8") as f:
+            return f.read()
+
+    conn = psycopg.connect(dsn, autocommit=True)
+    conn.execute("drop schema if exists htx_bench cascade")
+    conn.execute("create schema htx_bench")
+    conn.execute("set search_path to htx_bench")
+    conn.execute(sql_file("local_schema.sql"))
+    conn.execute(sql_file("save_documents.sql"))
+
+    calls = [0]
+    def q(sql, params=None):
+        calls[0] += 1
+        if rtt_ms: time.sleep(rtt_ms / 1000)
+        cur = conn.execute(sql, params)
+        return cur.fetchall() if cur.description else None
+
+    def make_doc(i, version):
+        items = [{"product_name": f"Item {j}", "spec": "25kg", "quantity": 10, "unit_price": 100 + (version if j == 0 else 0)} for j in range(30)]
+        for it in items: it["amount"] = it["quantity"] * it["unit_price"]
+        total = sum(it["amount"] for it in items)
+        pays = [{"term_name": "訂金", "expected_date": "2026-01-15", "amount": total * 0.3},
+                {"term_name": "尾款", "expected_date": "2026-03-15", "amount": total - total * 0.3}]
+        head = {"so_number": f"SO-BENCH-{i:04d}", "project_code": "P001", "cust_id": 1, "contract_no": "",
+                "order_date": "2026-01-01", "tax_type": "含稅", "total_amount": total, "status": "Confirmed"}
+        return head, items, pays
+
+    def attach_ids(so_no, items, pays):
+        # 模擬表單：載入時帶回的 id
+        for table, rows in (("so_items", items), ("so_payments", pays)):
+            ids = [r[0] for r in conn.execute(f"select id from {table} where so_number = %s order by id", (so_no,)).fetchall()]
+            for r, rid in zip(rows, ids): r["id"] = rid
+
+    def save_atomic(head, items, pays):
+        q(f"select {SO_SAVE_FN}(%s, %s, %s)", (json.dumps(head), json.dumps(_rows(items)), json.dumps(_rows(pays))))
+
+    def save_steps(head, items, pays):
+        so_no = head["so_number"]
+        before = q("select h.project_code, date_trunc('month', p.expected_date)::date, sum(p.amount) from so_payments p "
+                   "join sales_orders h using (so_number) where so_number = %s group by 1, 2", (so_no,))
+        q("insert into sales_orders (so_number, project_code, cust_id, contract_no, order_date, tax_type, total_amount, status) "
+          "values (%(so_number)s, %(project_code)s, %(cust_id)s, %(contract_no)s, %(order_date)s, %(tax_type)s, %(total_amount)s, %(status)s) "
+          "on conflict (so_number) do update set total_amount = excluded.total_amount", head)
+        for table, rows, fields in (("so_items", items, ["product_name", "spec", "quantity", "unit_price", "amount"]),
+                                    ("so_payments", pays, ["term_name", "expected_date", "amount"])):
+            cols = ", ".join(["id", *fields])
+            stored = [dict(zip(["id", *fields], r)) for r in q(f"select {cols} from {table} where so_number = %s", (so_no,))]
+            for s in stored:
+                for f in fields:
+                    if isinstance(s[f], date): s[f] = s[f].isoformat()
+                    elif isinstance(s[f], numbers.Number): s[f] = float(s[f])
+            inserts, updates, deletes = persist_engine.diff_rows(stored, rows, fields)
+            if deletes: q(f"delete from {table} where id = any(%s)", (deletes,))
+            if updates:
+                q(f"insert into {table} (id, so_number, {', '.join(fields)}) select * from json_populate_recordset(null::{table}, %s) "
+                  f"on conflict (id) do update set {', '.join(f'{f} = excluded.{f}' for f in fields)}",
+                  (json.dumps([{**u, "so_number": so_no} for u in updates]),))
+            if inserts:
+                q(f"insert into {table} (so_number, {', '.join(fields)}) select so_number, {', '.join(fields)} "
+                  f"from json_populate_recordset(null::{table}, %s)", (json.dumps([{**r, "so_number": so_no} for r in inserts]),))
+        if before or pays:
+            q("select project_code, year_month, real_amount from project_matrix where project_code = %s", (head["project_code"],))
+            q("insert into project_matrix (project_code, year_month, cost_item, real_amount) values (%s, '2026-01-01', '2.1 產品銷售收入', 0) "
+              "on conflict (project_code, year_month, cost_item) do nothing", (head["project_code"],))
+
+    results = {}
+    for label, saver in (("steps", save_steps), ("atomic", save_atomic)):
+        conn.execute("truncate sales_orders, so_items, so_payments, project_matrix cascade")
+        for i in range(n):
+            save_atomic(*make_doc(i, 0))  # 先建立單據，再量測「改一行後存檔」
+        calls[0] = 0
+        t0 = time.perf_counter()
+        for i in range(n):
+            head, items, pays = make_doc(i, 1)
+            attach_ids(head["so_number"], items, pays)
+            saver(head, items, pays)
+        dt = time.perf_counter() - t0
+        results[label] = dt
+        print(f"{label:6s}: {n} saves, {dt / n * 1000:.1f} ms/save, {calls[0] / n:.1f} requests/save (RTT {rtt_ms:g} ms)")
+    print(f"speedup: {results['steps'] / results['atomic']:.1f}x")
+    conn.execute("drop schema htx_bench cascade")
+    conn.close()
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 2:
+        print("usage: python save_engine.py <postgres dsn> [次數] [模擬 RTT ms]")
+        sys.exit(1)
+    _benchmark(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 50, float(sys.argv[3]) if len(sys.argv) > 3 else 0.0)
@@ -0,0 +1,242 @@
+import bisect
+import heapq
+from itertools import islice
+import threading
+import unicodedata
+import streamlit as st
+
+# --- 程序內搜尋索引 (夥伴 / 專案 / SO / PO 單號) ---
+# 中日韓文字切 1-gram + 2-gram，英數字切成字詞後取 3-gram (含字首標記 ^)，
+# 另維護一份排序好的正規化字串做字首 (prefix) 二分搜尋。
+# 每種資料 (kind) 一個索引，依 cache_engine 的版本戳記做增量同步，只增刪有變動的項目。
+
+MAX_CANDIDATES = 400   # 模糊比對最多驗證的候選數，確保查詢維持在毫秒以內
+
+def _is_cjk(ch):
+    o = ord(ch)
+    return (
+        0x4E00 <= o <= 0x9FFF or 0x3400 <= o <= 0x4DBF or 0xF900 <= o <= 0xFAFF  # 漢字
+        or 0x3040 <= o <= 0x30FF                                                  # 平假名/片假名
+        or 0xAC00 <= o <= 0xD7AF                                                  # 韓文
+    )
+
+def normalize(text):
+    return unicodedata.normalize("NFKC", str(text or "")).lower().strip()
+
+def _runs(text):
+    # 切成 (是否CJK, 片段) 的連續區段，其他符號視為分隔
+    runs, buf, buf_cjk = [], [], None
+    for ch in text:
+        cjk = _is_cjk(ch)
+        if not cjk and not ch.isalnum():
+            cjk = None
+        if cjk != buf_cjk and buf:
+            if buf_cjk is not None:
+                runs.append((buf_cjk, "".join(buf)))
+            buf = []
+        buf_cjk = cjk
+        buf.append(ch)
+    if buf and buf_cjk is not None:
+        runs.append((buf_cjk, "".join(buf)))
+    return runs
+
+def tokenize(text):
+    grams = set()
+    for cjk, run in _runs(normalize(text)):
+        if cjk:
+            grams.update(run)
+            grams.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            word = "^" + run
+            if len(word) <= 3:
+                grams.add(word)
+            grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+class SearchIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.docs = {}        # key -> (norm_text, grams)
+        self.postings = {}    # gram -> set(keys)
+        self.sorted_norm = [] # [(norm_text, key)] 供字首搜尋
+        self.last_candidates = 0  # 上一次查詢驗證的模糊候選數 (效能測試用)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def _add(self, key, text, keep_sorted=True):
+        norm = normalize(text)
+        grams = tokenize(text)
+        self.docs[key] = (norm, grams)
+        for g in grams:
+            self.postings.setdefault(g, set()).add(key)
+        if keep_sorted:
+            bisect.insort(self.sorted_norm, (norm, key))
+        else:
+            self.sorted_norm.append((norm, key))
+
+    def _remove(self, key):
+        norm, grams = self.docs.pop(key)
+        for g in grams:
+            keys = self.postings.get(g)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[g]
+        i = bisect.bisect_left(self.sorted_norm, (norm, key))
+        if i < len(self.sorted_norm) and self.sorted_norm[i] == (norm, key):
+            del self.sorted_norm[i]
+
+    def upsert(self, key, text=None):
+        text = key if text is None else text
+        with self.lock:
+            if key in self.docs:
+                if self.docs[key][0] == normalize(text):
+                    return
+                self._remove(key)
+            self._add(key, text)
+
+    def remove(self, key):
+        with self.lock:
+            if key in self.docs:
+                self._remove(key)
+
+    def sync(self, entries, version=None):
+        # entries: {key: text}；只套用差異 (新增/刪除/內容變動)
+        if version is not None and version == self.version:
+            return
+        with self.lock:
+            for key in [k for k in self.docs if k not in entries]:
+                self._remove(key)
+            added = 0
+            for key, text in entries.items():
+                norm = normalize(text)
+                if key in self.docs:
+                    if self.docs[key][0] == norm:
+                        continue
+                    self._remove(key)
+                # 大量新增時先附加，最後整批排序一次
+                self._add(key, text, keep_sorted=False)
+                added += 1
+            if added:
+                self.sorted_norm.sort()
+            self.version = version
+
+    def search(self, query, limit=20):
+        q = normalize(query)
+        if not q:
+            return []
+        q_grams = tokenize(query)
+        scores = {}
+
+        with self.lock:
+            self.last_candidates = 0
+            # 1. 字首命中 (最高分)
+            i = bisect.bisect_left(self.sorted_norm, (q, ""))
+            while i < len(self.sorted_norm) and len(scores) < limit and self.sorted_norm[i][0].startswith(q):
+                scores[self.sorted_norm[i][1]] = 3.0
+                i += 1
+
+            # 2. n-gram 模糊比對：從最稀有的 gram 取候選，再計算重疊比例
+            if q_grams and len(scores) < limit:
+                postings = sorted((self.postings.get(g, ()) for g in q_grams), key=len)
+                candidates = set()
+                for keys in postings:
+                    room = MAX_CANDIDATES - len(candidates)
+                    if room <= 0:
+                        break
+                    candidates.update(keys if len(keys) <= room else islice(keys, room))
+                self.last_candidates = len(candidates)
+                need = max(1, int(len(q_grams) * 0.5 + 0.5))
+                for key in candidates:
+                    if key in scores:
+                        continue
+                    norm, grams = self.docs[key]
+                    hit = len(q_grams & grams)
+                    if hit < need:
+                        continue
+                    score = hit / len(q_grams) + (1.0 if q in norm else 0.0)
+                    scores[key] = score
+
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda kv: (-kv[1], kv[0]))
+        return [k for k, _ in ranked]
+
+# --- 全程序共用索引 ---
+@st.cache_resource(show_spinner=False)
+def _registry():
+    return {"lock": threading.Lock(), "indexes": {}}
+
+def get_index(kind):
+    reg = _registry()
+    with reg["lock"]:
+        if kind not in reg["indexes"]:
+            reg["indexes"][kind] = SearchIndex()
+        return reg["indexes"][kind]
+
+def filter_options(kind, options, query, version=None, limit=50):
+    # options 即為索引的 key (呼叫端以 cache_engine 分頁讀完整張表)；沒有輸入關鍵字時原樣回傳
+    idx = get_index(kind)
+    if version is not None:
+        # 版本戳記沒變但選項清單不同 (例如別的篩選條件) 時也要重新同步
+        version = (version, len(options), hash(tuple(options)))
+    idx.sync({o: o for o in options}, version)
+    if not query or not query.strip():
+        return options
+    return idx.search(query, limit)
+
+def typeahead_select(label, kind, options, version=None, fixed=(), current=None, key=None, limit=50):
+    # 搜尋框 + 篩選後的 selectbox；fixed 為永遠置頂的選項 (例如「建立新單」)，
+    # current 為目前編輯中的選項，即使不在搜尋結果也保留，避免畫面被切換到別張單
+    query = st.text_input("🔍 快速搜尋", key=f"{key}_q" if key else None, placeholder="輸入關鍵字 (支援中英文、模糊比對)")
+    hits = filter_options(kind, options, query, version, limit)
+    shown = list(fixed)
+    if current and current not in fixed and current not in hits:
+        shown.append(current)
+    shown += [h for h in hits if h not in shown]
+    index = shown.index(current) if current in shown else 0
+    return st.selectbox(label, shown, index=index, key=key)
+
+# --- 效能測試 (python search_engine.py [筆數])：經 cache_engine 分頁讀入 (模擬 max-rows 1000)，量同步與查詢延遲 ---
+def _benchmark(n_entities=100000, max_rows=1000, repeat=50):
+    import random
+    import time
+    import cache_engine
+    import list_engine
+
+    rng = random.Random(1)
+    cjk = "台塑化學紡織美津濃運動機能布料成衣工業股份有限公司東京大阪新竹桃園"
+    kinds = [lambda i: f"PO-2026{i:06d}", lambda i: f"SO-2025{i:06d}",
+             lambda i: f"SLS-MFG-{i:06d} | Project {rng.choice(['Alpha', 'Bravo', 'Delta', 'Falcon'])} {i}",
+             lambda i: "".join(rng.choice(cjk) for _ in range(6)) + f" Co {i}"]
+    rows = [{"id": i, "name": kinds[i % 4](i)} for i in range(n_entities)]
+
+    db = list_engine._CappedQuery(rows, [("id", False)], max_rows)
+    t0 = time.perf_counter()
+    names = [r["name"] for r in cache_engine.get_partners(db, "name")]
+    t_read = time.perf_counter() - t0
+    assert len(names) == n_entities, f"read {len(names)} of {n_entities}"
+
+    idx = SearchIndex()
+    t0 = time.perf_counter()
+    idx.sync({n: n for n in names}, 1)
+    t_sync = time.perf_counter() - t0
+    print(f"{n_entities:,} entities: paged read {t_read * 1000:.0f} ms (max-rows {max_rows}), index sync {t_sync:.2f} s")
+
+    worst = 0.0
+    for q in ["PO-2026000123", "po-2026", "falcon 123", "台塑", "美津濃", "falcn", "SLS-MFG-000042", "Co 99", "Mizuno"]:
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            hits = idx.search(q, 20)
+            times.append(time.perf_counter() - t0)
+        times.sort()
+        worst = max(worst, times[len(times) // 2])
+        assert idx.last_candidates <= MAX_CANDIDATES
+        print(f"  {q!r:>18}: median {times[len(times) // 2] * 1000:.3f} ms, max {times[-1] * 1000:.3f} ms, "
+              f"{idx.last_candidates} candidates, {len(hits)} hits")
+    print(f"worst median {worst * 1000:.3f} ms (candidate cap {MAX_CANDIDATES})")
+
+if __name__ == "__main__":
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,12 @@
+-- =========================================================
+-- 批次匯入 (import_engine.py) 用的衝突鍵
+-- partners.name、projects.project_code 已是唯一鍵；project_items 以 (專案, 品項名稱) 對應既有列，
+-- 與 mod_project_init 存檔時 match_on=["item_name"] 的規則相同。
+-- 若既有資料已有重複品項，先保留 id 最小的一列再建索引。
+-- =========================================================
+
+delete from project_items a
+ using project_items b
+ where a.project_code = b.project_code and a.item_name = b.item_name and a.id > b.id;
+
+create unique index if not exists project_items_project_item_key on project_items (project_code, item_name);
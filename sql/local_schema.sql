@@ -0,0 +1,88 @@
+-- =========================================================
+-- 本機測試用的精簡 schema (只含 SO / PO 存檔與矩陣同步用到的欄位)
+-- 供 save_engine.py 的效能比較使用，正式環境以 Supabase 上的資料表為準
+-- =========================================================
+
+create table if not exists sales_orders (
+    so_number text primary key,
+    project_code text,
+    cust_id bigint,
+    contract_no text,
+    order_date date,
+    tax_type text,
+    total_amount numeric default 0,
+    status text,
+    created_at timestamptz default now()
+);
+
+create table if not exists so_items (
+    id bigint generated by default as identity primary key,
+    so_number text references sales_orders (so_number) on delete cascade,
+    product_name text,
+    spec text,
+    quantity numeric,
+    unit_price numeric,
+    amount numeric
+);
+
+create table if not exists so_payments (
+    id bigint generated by default as identity primary key,
+    so_number text references sales_orders (so_number) on delete cascade,
+    term_name text,
+    expected_date date,
+    amount numeric
+);
+
+create table if not exists purchase_orders (
+    po_number text primary key,
+    project_code text,
+    supplier_id bigint,
+    cost_item text,
+    order_date date,
+    tax_type text,
+    total_amount numeric default 0,
+    status text,
+    payment_terms text,
+    trade_terms text,
+    ship_to_address text,
+    bill_to_address text,
+    receiver_contact text,
+    created_at timestamptz default now()
+);
+
+create table if not exists po_items (
+    id bigint generated by default as identity primary key,
+    po_number text references purchase_orders (po_number) on delete cascade,
+    product_name text,
+    spec text,
+    quantity numeric,
+    unit_price numeric,
+    amount numeric
+);
+
+create table if not exists po_provided_materials (
+    id bigint generated by default as identity primary key,
+    po_number text references purchase_orders (po_number) on delete cascade,
+    material_name text,
+    spec text,
+    quantity numeric,
+    unit text,
+    remarks text
+);
+
+create table if not exists po_payments (
+    id bigint generated by default as identity primary key,
+    po_number text references purchase_orders (po_number) on delete cascade,
+    term_name text,
+    expected_date date,
+    amount numeric
+);
+
+create table if not exists project_matrix (
+    project_code text,
+    year_month date,
+    cost_item text,
+    plan_amount numeric default 0,
+    real_amount numeric default 0,
+    unique (project_code, year_month, cost_item)
+);
@@ -0,0 +1,137 @@
+-- =========================================================
+-- 月份彙總表 (Rollup)：專案 x 月份 x 類別 (order / rev / cost / other) 的 plan / real 合計
+-- project_matrix 每次寫入 (預算存檔、SO/PO 收付款同步、原子存檔 RPC) 由觸發器把差額加進來，
+-- 專案看板只讀這張小表的專案總計 view，不再把所有格子撈回來加總。
+-- 於 Supabase SQL Editor 執行一次即可 (會順便從現有資料重建)；Python 端見 rollup_engine.py
+-- =========================================================
+
+create table if not exists project_month_rollup (
+    project_code text not null,
+    year_month date not null,
+    category text not null,           -- order = 1.x 訂單, rev = 2.x 收入, cost = 3.x 費用, other
+    plan_amount numeric not null default 0,
+    real_amount numeric not null default 0,
+    cell_count integer not null default 0,
+    primary key (project_code, year_month, category)
+);
+
+-- 科目編號 -> 類別 (與 dashboard_engine.classify_items 相同規則)
+create or replace function matrix_category(p_cost_item text)
+returns text
+language sql
+immutable
+as $$
+    select case
+        when p_cost_item like '1.%' then 'order'
+        when p_cost_item like '2.%' then 'rev'
+        when p_cost_item like '3.%' then 'cost'
+        else 'other'
+    end;
+$$;
+
+-- 把一批 (正負) 差額加進彙總表
+create or replace function _rollup_apply(p_delta jsonb)
+returns void
+language plpgsql
+as $$
+begin
+    insert into project_month_rollup as r (project_code, year_month, category, plan_amount, real_amount, cell_count)
+    select project_code, year_month, category, sum(plan_amount), sum(real_amount), sum(cell_count)
+      from jsonb_to_recordset(p_delta)
+        as d(project_code text, year_month date, category text, plan_amount numeric, real_amount numeric, cell_count integer)
+     group by 1, 2, 3
+    on conflict (project_code, year_month, category) do update set
+        plan_amount = r.plan_amount + excluded.plan_amount,
+        real_amount = r.real_amount + excluded.real_amount,
+        cell_count = r.cell_count + excluded.cell_count;
+
+    -- 只檢查這批差額碰到的鍵，不掃整張表
+    delete from project_month_rollup r
+     using (select distinct project_code, year_month, category
+              from jsonb_to_recordset(p_delta) as d(project_code text, year_month date, category text)) k
+     where r.project_code = k.project_code and r.year_month = k.year_month and r.category = k.category
+       and r.cell_count <= 0;
+end;
+$$;
+
+-- 語句層級觸發器：整批 upsert 只觸發一次，用 transition table 一次算完差額
+create or replace function _rollup_matrix_trigger()
+returns trigger
+language plpgsql
+as $$
+declare
+    v_delta jsonb;
+begin
+    if TG_OP = 'INSERT' then
+        select jsonb_agg(x) into v_delta from (
+            select project_code, date_trunc('month', year_month::date)::date as year_month,
+                   matrix_category(cost_item) as category,
+                   coalesce(plan_amount, 0) as plan_amount, coalesce(real_amount, 0) as real_amount, 1 as cell_count
+              from new_rows
+        ) x;
+    elsif TG_OP = 'DELETE' then
+        select jsonb_agg(x) into v_delta from (
+            select project_code, date_trunc('month', year_month::date)::date as year_month,
+                   matrix_category(cost_item) as category,
+                   -coalesce(plan_amount, 0) as plan_amount, -coalesce(real_amount, 0) as real_amount, -1 as cell_count
+              from old_rows
+        ) x;
+    else
+        select jsonb_agg(x) into v_delta from (
+            select project_code, date_trunc('month', year_month::date)::date as year_month,
+                   matrix_category(cost_item) as category,
+                   coalesce(plan_amount, 0) as plan_amount, coalesce(real_amount, 0) as real_amount, 1 as cell_count
+              from new_rows
+            union all
+            select project_code, date_trunc('month', year_month::date)::date,
+                   matrix_category(cost_item),
+                   -coalesce(plan_amount, 0), -coalesce(real_amount, 0), -1
+              from old_rows
+        ) x;
+    end if;
+
+    if v_delta is not null then
+        perform _rollup_apply(v_delta);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists project_matrix_rollup_ins on project_matrix;
+drop trigger if exists project_matrix_rollup_upd on project_matrix;
+drop trigger if exists project_matrix_rollup_del on project_matrix;
+
+create trigger project_matrix_rollup_ins after insert on project_matrix
+    referencing new table as new_rows for each statement execute function _rollup_matrix_trigger();
+create trigger project_matrix_rollup_upd after update on project_matrix
+    referencing old table as old_rows new table as new_rows for each statement execute function _rollup_matrix_trigger();
+create trigger project_matrix_rollup_del after delete on project_matrix
+    referencing old table as old_rows for each statement execute function _rollup_matrix_trigger();
+
+-- 全部重建 (初次安裝或對帳用)
+create or replace function rebuild_project_month_rollup()
+returns integer
+language plpgsql
+as $$
+declare
+    v_rows integer;
+begin
+    lock table project_month_rollup in exclusive mode;
+    delete from project_month_rollup;
+    insert into project_month_rollup (project_code, year_month, category, plan_amount, real_amount, cell_count)
+    select project_code, date_trunc('month', year_month::date)::date, matrix_category(cost_item),
+           sum(coalesce(plan_amount, 0)), sum(coalesce(real_amount, 0)), count(*)
+      from project_matrix
+     group by 1, 2, 3;
+    get diagnostics v_rows = row_count;
+    return v_rows;
+end;
+$$;
+
+-- 專案 x 類別 總計 (看板用，一個專案最多 4 列)
+create or replace view project_rollup_totals as
+select project_code, category, sum(plan_amount) as plan_amount, sum(real_amount) as real_amount
+  from project_month_rollup
+ group by project_code, category;
+
+select rebuild_project_month_rollup();
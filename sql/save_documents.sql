@@ -0,0 +1,239 @@
+-- =========================================================
+-- 單據原子存檔 (Atomic Save)：SO / PO 表頭 + 所有子表 + 矩陣實際數，一次 RPC、一個交易
+-- 於 Supabase SQL Editor 執行一次即可；Python 端見 save_engine.py
+-- 子表依 id 差異寫入 (與 persist_engine 相同)：payload 沒有的 id 刪除、有 id 的更新、沒有 id 的新增
+-- =========================================================
+
+-- 將單據的收付款依月份彙總 (before / after 相減後加到 project_matrix.real_amount)
+-- 在資料庫內做 real_amount = real_amount + 差額，併發存檔不會互相覆蓋；不動 plan_amount，也不截到 0 (負數代表資料不一致)
+create or replace function _apply_actuals_delta(p_delta jsonb)
+returns integer
+language plpgsql
+as $$
+declare
+    v_rows integer;
+begin
+    insert into project_matrix as m (project_code, year_month, cost_item, real_amount)
+    select project_code, year_month, cost_item, round(sum(amount), 2)
+      from jsonb_to_recordset(p_delta) as x(project_code text, year_month date, cost_item text, amount numeric)
+     group by 1, 2, 3
+    having round(sum(amount), 2) <> 0
+    on conflict (project_code, year_month, cost_item) do update
+        set real_amount = coalesce(m.real_amount, 0) + excluded.real_amount;
+    get diagnostics v_rows = row_count;
+    return v_rows;
+end;
+$$;
+
+-- 供逐步存檔 / 刪單 RPC 呼叫 (Python 端見 sync_engine.apply_delta)
+create or replace function apply_actuals_delta(p_delta jsonb)
+returns integer
+language sql
+as $$
+    select _apply_actuals_delta(p_delta);
+$$;
+
+create or replace function save_sales_order(
+    p_header jsonb, p_items jsonb, p_payments jsonb,
+    p_revenue_item text default '2.1 產品銷售收入'
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_so text := p_header->>'so_number';
+    v_project text := p_header->>'project_code';
+    v_total numeric;
+    v_pay_total numeric;
+    v_delta jsonb;
+    v_matrix integer;
+begin
+    -- 同一張單同時存檔時排隊
+    perform pg_advisory_xact_lock(hashtext('so:' || v_so));
+
+    -- 1. 存檔前的月份彙總 (負值) + 存檔後 (正值) = 差額
+    select coalesce(jsonb_agg(x), '[]') into v_delta from (
+        select h.project_code, date_trunc('month', p.expected_date::date)::date as year_month,
+               p_revenue_item as cost_item, -sum(p.amount) as amount
+          from so_payments p join sales_orders h on h.so_number = p.so_number
+         where p.so_number = v_so and p.expected_date is not null
+         group by 1, 2
+        union all
+        select v_project, date_trunc('month', r.expected_date)::date, p_revenue_item, sum(r.amount)
+          from jsonb_populate_recordset(null::so_payments, p_payments) r
+         where r.expected_date is not null
+         group by 2
+    ) x;
+
+    -- 2. 表頭 (總額由明細重算)
+    select coalesce(sum(r.quantity * r.unit_price), 0) into v_total
+      from jsonb_populate_recordset(null::so_items, p_items) r;
+
+    insert into sales_orders (so_number, project_code, cust_id, contract_no, order_date, tax_type, total_amount, status)
+    select r.so_number, r.project_code, r.cust_id, r.contract_no, r.order_date, r.tax_type, v_total, coalesce(r.status, 'Confirmed')
+      from jsonb_populate_record(null::sales_orders, p_header) r
+    on conflict (so_number) do update set
+        project_code = excluded.project_code, cust_id = excluded.cust_id, contract_no = excluded.contract_no,
+        order_date = excluded.order_date, tax_type = excluded.tax_type,
+        total_amount = excluded.total_amount, status = excluded.status;
+
+    -- 3. 明細
+    delete from so_items t
+     where t.so_number = v_so
+       and t.id::text not in (select e->>'id' from jsonb_array_elements(p_items) e where e->>'id' is not null);
+
+    update so_items t set
+        product_name = r.product_name, spec = r.spec, quantity = r.quantity,
+        unit_price = r.unit_price, amount = r.quantity * r.unit_price
+      from jsonb_populate_recordset(null::so_items, p_items) r
+     where t.so_number = v_so and t.id = r.id
+       and (t.product_name, t.spec, t.quantity, t.unit_price, t.amount)
+           is distinct from (r.product_name, r.spec, r.quantity, r.unit_price, r.quantity * r.unit_price);
+
+    insert into so_items (so_number, product_name, spec, quantity, unit_price, amount)
+    select v_so, r.product_name, r.spec, r.quantity, r.unit_price, r.quantity * r.unit_price
+      from jsonb_populate_recordset(null::so_items, p_items) r
+     where r.id is null or not exists (select 1 from so_items t where t.so_number = v_so and t.id = r.id);
+
+    -- 4. 收款計畫
+    delete from so_payments t
+     where t.so_number = v_so
+       and t.id::text not in (select e->>'id' from jsonb_array_elements(p_payments) e where e->>'id' is not null);
+
+    update so_payments t set
+        term_name = r.term_name, expected_date = r.expected_date, amount = r.amount
+      from jsonb_populate_recordset(null::so_payments, p_payments) r
+     where t.so_number = v_so and t.id = r.id
+       and (t.term_name, t.expected_date, t.amount) is distinct from (r.term_name, r.expected_date, r.amount);
+
+    insert into so_payments (so_number, term_name, expected_date, amount)
+    select v_so, r.term_name, r.expected_date, r.amount
+      from jsonb_populate_recordset(null::so_payments, p_payments) r
+     where r.id is null or not exists (select 1 from so_payments t where t.so_number = v_so and t.id = r.id);
+
+    select coalesce(sum(amount), 0) into v_pay_total from so_payments where so_number = v_so;
+
+    -- 5. 矩陣實際數
+    v_matrix := _apply_actuals_delta(v_delta);
+
+    return jsonb_build_object(
+        'so_number', v_so, 'total_amount', v_total, 'payment_total', v_pay_total,
+        'items', (select count(*) from so_items where so_number = v_so),
+        'payments', (select count(*) from so_payments where so_number = v_so),
+        'matrix_cells', v_matrix
+    );
+end;
+$$;
+
+-- --- 採購單 ---
+create or replace function save_purchase_order(
+    p_header jsonb, p_items jsonb, p_materials jsonb, p_payments jsonb
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_po text := p_header->>'po_number';
+    v_items_total numeric;
+    v_pay_total numeric;
+    v_delta jsonb;
+    v_matrix integer;
+begin
+    perform pg_advisory_xact_lock(hashtext('po:' || v_po));
+
+    -- 1. 差額 (舊專案/科目為負，新專案/科目為正)
+    select coalesce(jsonb_agg(x), '[]') into v_delta from (
+        select h.project_code, date_trunc('month', p.expected_date::date)::date as year_month,
+               h.cost_item, -sum(p.amount) as amount
+          from po_payments p join purchase_orders h on h.po_number = p.po_number
+         where p.po_number = v_po and p.expected_date is not null
+         group by 1, 2, 3
+        union all
+        select p_header->>'project_code', date_trunc('month', r.expected_date)::date, p_header->>'cost_item', sum(r.amount)
+          from jsonb_populate_recordset(null::po_payments, p_payments) r
+         where r.expected_date is not null
+         group by 2
+    ) x;
+
+    -- 2. 表頭 (總額含稅別計算，沿用前端算好的 total_amount)
+    insert into purchase_orders (
+        po_number, project_code, supplier_id, cost_item, order_date, tax_type, total_amount, status,
+        payment_terms, trade_terms, ship_to_address, bill_to_address, receiver_contact
+    )
+    select r.po_number, r.project_code, r.supplier_id, r.cost_item, r.order_date, r.tax_type, r.total_amount,
+           coalesce(r.status, 'Confirmed'), r.payment_terms, r.trade_terms, r.ship_to_address, r.bill_to_address, r.receiver_contact
+      from jsonb_populate_record(null::purchase_orders, p_header) r
+    on conflict (po_number) do update set
+        project_code = excluded.project_code, supplier_id = excluded.supplier_id, cost_item = excluded.cost_item,
+        order_date = excluded.order_date, tax_type = excluded.tax_type, total_amount = excluded.total_amount,
+        status = excluded.status, payment_terms = excluded.payment_terms, trade_terms = excluded.trade_terms,
+        ship_to_address = excluded.ship_to_address, bill_to_address = excluded.bill_to_address,
+        receiver_contact = excluded.receiver_contact;
+
+    -- 3. 採購明細
+    delete from po_items t
+     where t.po_number = v_po
+       and t.id::text not in (select e->>'id' from jsonb_array_elements(p_items) e where e->>'id' is not null);
+
+    update po_items t set
+        product_name = r.product_name, spec = r.spec, quantity = r.quantity,
+        unit_price = r.unit_price, amount = r.quantity * r.unit_price
+      from jsonb_populate_recordset(null::po_items, p_items) r
+     where t.po_number = v_po and t.id = r.id
+       and (t.product_name, t.spec, t.quantity, t.unit_price, t.amount)
+           is distinct from (r.product_name, r.spec, r.quantity, r.unit_price, r.quantity * r.unit_price);
+
+    insert into po_items (po_number, product_name, spec, quantity, unit_price, amount)
+    select v_po, r.product_name, r.spec, r.quantity, r.unit_price, r.quantity * r.unit_price
+      from jsonb_populate_recordset(null::po_items, p_items) r
+     where r.id is null or not exists (select 1 from po_items t where t.po_number = v_po and t.id = r.id);
+
+    -- 4. 自備料
+    delete from po_provided_materials t
+     where t.po_number = v_po
+       and t.id::text not in (select e->>'id' from jsonb_array_elements(p_materials) e where e->>'id' is not null);
+
+    update po_provided_materials t set
+        material_name = r.material_name, spec = r.spec, quantity = r.quantity, unit = r.unit, remarks = r.remarks
+      from jsonb_populate_recordset(null::po_provided_materials, p_materials) r
+     where t.po_number = v_po and t.id = r.id
+       and (t.material_name, t.spec, t.quantity, t.unit, t.remarks)
+           is distinct from (r.material_name, r.spec, r.quantity, r.unit, r.remarks);
+
+    insert into po_provided_materials (po_number, material_name, spec, quantity, unit, remarks)
+    select v_po, r.material_name, r.spec, r.quantity, r.unit, r.remarks
+      from jsonb_populate_recordset(null::po_provided_materials, p_materials) r
+     where r.id is null or not exists (select 1 from po_provided_materials t where t.po_number = v_po and t.id = r.id);
+
+    -- 5. 付款計畫
+    delete from po_payments t
+     where t.po_number = v_po
+       and t.id::text not in (select e->>'id' from jsonb_array_elements(p_payments) e where e->>'id' is not null);
+
+    update po_payments t set
+        term_name = r.term_name, expected_date = r.expected_date, amount = r.amount
+      from jsonb_populate_recordset(null::po_payments, p_payments) r
+     where t.po_number = v_po and t.id = r.id
+       and (t.term_name, t.expected_date, t.amount) is distinct from (r.term_name, r.expected_date, r.amount);
+
+    insert into po_payments (po_number, term_name, expected_date, amount)
+    select v_po, r.term_name, r.expected_date, r.amount
+      from jsonb_populate_recordset(null::po_payments, p_payments) r
+     where r.id is null or not exists (select 1 from po_payments t where t.po_number = v_po and t.id = r.id);
+
+    select coalesce(sum(amount), 0) into v_items_total from po_items where po_number = v_po;
+    select coalesce(sum(amount), 0) into v_pay_total from po_payments where po_number = v_po;
+
+    -- 6. 矩陣實際數
+    v_matrix := _apply_actuals_delta(v_delta);
+
+    return jsonb_build_object(
+        'po_number', v_po, 'total_amount', (p_header->>'total_amount')::numeric,
+        'items_total', v_items_total, 'payment_total', v_pay_total,
+        'items', (select count(*) from po_items where po_number = v_po),
+        'materials', (select count(*) from po_provided_materials where po_number = v_po),
+        'payments', (select count(*) from po_payments where po_number = v_po),
+        'matrix_cells', v_matrix
+    );
+end;
+$$;
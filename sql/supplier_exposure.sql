@@ -0,0 +1,207 @@
+-- =========================================================
+-- 供應商曝險帳 (Exposure Ledger)：每家供應商「未結採購額 - 已付款」一列
+-- purchase_orders / po_payments 每次寫入 (原子存檔 RPC、逐步存檔、刪單) 由觸發器加減差額，
+-- PO 額度檢核與 CRM 額度使用率只需以 supplier_id 查一列，不必掃描所有採購單。
+-- 於 Supabase SQL Editor 執行一次即可 (會順便從現有資料重建)；Python 端見 exposure_engine.py
+-- =========================================================
+
+-- 實際付款日：有值才算「已付」 (付款登錄功能上線前皆為 null，曝險 = 未結採購總額)
+alter table po_payments add column if not exists paid_date date;
+
+create table if not exists supplier_exposure (
+    supplier_id bigint primary key,
+    committed numeric not null default 0,   -- 未結採購單 total_amount 合計
+    paid numeric not null default 0,        -- 上述採購單已付款合計
+    po_count integer not null default 0,
+    exposure numeric generated always as (committed - paid) stored
+);
+
+-- 未結狀態 (與 exposure_engine.CLOSED_STATUSES 相同)
+create or replace function po_is_open(p_status text)
+returns boolean
+language sql
+immutable
+as $$
+    select coalesce(p_status, '') not in ('Closed', 'Cancelled');
+$$;
+
+-- 把一批 (正負) 差額加進曝險帳
+create or replace function _exposure_apply(p_delta jsonb)
+returns void
+language plpgsql
+as $$
+begin
+    insert into supplier_exposure as e (supplier_id, committed, paid, po_count)
+    select supplier_id, sum(committed), sum(paid), sum(po_count)
+      from jsonb_to_recordset(p_delta) as d(supplier_id bigint, committed numeric, paid numeric, po_count integer)
+     where supplier_id is not null
+     group by 1
+    on conflict (supplier_id) do update set
+        committed = e.committed + excluded.committed,
+        paid = e.paid + excluded.paid,
+        po_count = e.po_count + excluded.po_count;
+
+    -- 只檢查這批差額碰到的供應商，不掃整張表
+    delete from supplier_exposure e
+     using (select distinct supplier_id from jsonb_to_recordset(p_delta) as d(supplier_id bigint)) k
+     where e.supplier_id = k.supplier_id and e.po_count <= 0;
+end;
+$$;
+
+-- 單張採購單目前的已付款
+create or replace function _po_paid(p_po text)
+returns numeric
+language sql
+stable
+as $$
+    select coalesce(sum(amount), 0) from po_payments where po_number = p_po and paid_date is not null;
+$$;
+
+-- 表頭新增 / 修改 (語句層級)：舊列扣除、新列加回；換供應商或結案時已付款跟著搬
+create or replace function _exposure_po_trigger()
+returns trigger
+language plpgsql
+as $$
+declare
+    v_delta jsonb;
+begin
+    if TG_OP = 'INSERT' then
+        select jsonb_agg(x) into v_delta from (
+            select supplier_id, coalesce(total_amount, 0) as committed, _po_paid(po_number) as paid, 1 as po_count
+              from new_rows where po_is_open(status)
+        ) x;
+    else
+        select jsonb_agg(x) into v_delta from (
+            select supplier_id, coalesce(total_amount, 0) as committed, _po_paid(po_number) as paid, 1 as po_count
+              from new_rows where po_is_open(status)
+            union all
+            select supplier_id, -coalesce(total_amount, 0), -_po_paid(po_number), -1
+              from old_rows where po_is_open(status)
+        ) x;
+    end if;
+
+    if v_delta is not null then
+        perform _exposure_apply(v_delta);
+    end if;
+    return null;
+end;
+$$;
+
+-- 刪單 (列層級 BEFORE)：付款會被 on delete cascade 一併刪掉，必須在刪除前算已付款
+create or replace function _exposure_po_delete_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    if po_is_open(OLD.status) then
+        perform _exposure_apply(jsonb_build_array(jsonb_build_object(
+            'supplier_id', OLD.supplier_id, 'committed', -coalesce(OLD.total_amount, 0),
+            'paid', -_po_paid(OLD.po_number), 'po_count', -1)));
+    end if;
+    return OLD;
+end;
+$$;
+
+-- 付款新增 / 修改 / 刪除 (語句層級)：只計未結採購單上、已有 paid_date 的款項
+-- 連同表頭被 cascade 刪除的付款 join 不到表頭而自動略過 (已在刪單觸發器扣除)
+-- INSERT / DELETE 時另一張 transition table 不存在，因此三種操作各自一個函式
+create or replace function _exposure_pay_delta(p_rows jsonb)
+returns void
+language plpgsql
+as $$
+begin
+    perform _exposure_apply(coalesce((
+        select jsonb_agg(jsonb_build_object('supplier_id', h.supplier_id, 'committed', 0, 'paid', x.paid, 'po_count', 0))
+          from (
+            select po_number, sum(amount) as paid
+              from jsonb_to_recordset(p_rows) as r(po_number text, amount numeric)
+             group by 1
+          ) x
+          join purchase_orders h on h.po_number = x.po_number
+         where po_is_open(h.status)), '[]'));
+end;
+$$;
+
+create or replace function _exposure_pay_ins_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    perform _exposure_pay_delta((
+        select jsonb_agg(jsonb_build_object('po_number', po_number, 'amount', amount))
+          from new_rows where paid_date is not null));
+    return null;
+end;
+$$;
+
+create or replace function _exposure_pay_upd_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    perform _exposure_pay_delta((
+        select jsonb_agg(x) from (
+            select po_number, amount from new_rows where paid_date is not null
+            union all
+            select po_number, -amount from old_rows where paid_date is not null
+        ) x));
+    return null;
+end;
+$$;
+
+create or replace function _exposure_pay_del_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    perform _exposure_pay_delta((
+        select jsonb_agg(jsonb_build_object('po_number', po_number, 'amount', -amount))
+          from old_rows where paid_date is not null));
+    return null;
+end;
+$$;
+
+drop trigger if exists purchase_orders_exposure_ins on purchase_orders;
+drop trigger if exists purchase_orders_exposure_upd on purchase_orders;
+drop trigger if exists purchase_orders_exposure_del on purchase_orders;
+drop trigger if exists po_payments_exposure_ins on po_payments;
+drop trigger if exists po_payments_exposure_upd on po_payments;
+drop trigger if exists po_payments_exposure_del on po_payments;
+
+create trigger purchase_orders_exposure_ins after insert on purchase_orders
+    referencing new table as new_rows for each statement execute function _exposure_po_trigger();
+create trigger purchase_orders_exposure_upd after update on purchase_orders
+    referencing old table as old_rows new table as new_rows for each statement execute function _exposure_po_trigger();
+create trigger purchase_orders_exposure_del before delete on purchase_orders
+    for each row execute function _exposure_po_delete_trigger();
+create trigger po_payments_exposure_ins after insert on po_payments
+    referencing new table as new_rows for each statement execute function _exposure_pay_ins_trigger();
+create trigger po_payments_exposure_upd after update on po_payments
+    referencing old table as old_rows new table as new_rows for each statement execute function _exposure_pay_upd_trigger();
+create trigger po_payments_exposure_del after delete on po_payments
+    referencing old table as old_rows for each statement execute function _exposure_pay_del_trigger();
+
+-- 全部重建 (初次安裝或對帳用)
+create or replace function rebuild_supplier_exposure()
+returns integer
+language plpgsql
+as $$
+declare
+    v_rows integer;
+begin
+    lock table supplier_exposure in exclusive mode;
+    delete from supplier_exposure;
+    insert into supplier_exposure (supplier_id, committed, paid, po_count)
+    select h.supplier_id, sum(coalesce(h.total_amount, 0)), sum(coalesce(p.paid, 0)), count(*)
+      from purchase_orders h
+      left join (
+        select po_number, sum(amount) as paid from po_payments where paid_date is not null group by 1
+      ) p on p.po_number = h.po_number
+     where po_is_open(h.status) and h.supplier_id is not null
+     group by h.supplier_id;
+    get diagnostics v_rows = row_count;
+    return v_rows;
+end;
+$$;
+
+select rebuild_supplier_exposure();
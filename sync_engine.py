@@ -0,0 +1,107 @@
+from datetime import datetime
+import core_engine
+import list_engine
+import save_engine
+
+# --- 實際數 (real_amount) 同步引擎 ---
+# project_matrix.real_amount 只來自 SO 收款 / PO 付款 (預算矩陣只編 plan_amount)，依月份彙總。
+# 平常由存檔 / 刪單的差額 (delta) 維護；資料不一致時以 reconcile 從收付款整個專案重算。
+
+SO_REVENUE_ITEM = "2.1 產品銷售收入"
+MATRIX_CONFLICT = "project_code, year_month, cost_item"
+ACTUALS_DELTA_FN = "apply_actuals_delta"   # sql/save_documents.sql
+
+def month_key(d):
+    if isinstance(d, str):
+        d = datetime.strptime(d[:10], "%Y-%m-%d")
+    return d.replace(day=1).strftime("%Y-%m-%d")
+
+def bucket_by_month(rows, date_field="expected_date", amount_field="amount"):
+    monthly = {}
+    for r in rows or []:
+        if not r.get(date_field): continue
+        m = month_key(r[date_field])
+        monthly[m] = monthly.get(m, 0) + float(r.get(amount_field) or 0)
+    return monthly
+
+# --- 增量 (delta) 同步 ---
+# 存檔 / 刪除前先取單據原本的月份彙總 (before)，存檔後的新彙總為 after，
+# 只把差額加到 project_matrix.real_amount；搬走或刪光的月份差額為負，自然歸零。
+# 加總在資料庫內以 RPC 完成 (real_amount = real_amount + 差額)，併發存檔不會互相覆蓋。
+
+def doc_actuals(rows, p_code, cost_item, date_field="expected_date", amount_field="amount"):
+    if not p_code or not cost_item: return {}
+    return {(p_code, m, cost_item): amt for m, amt in bucket_by_month(rows, date_field, amount_field).items()}
+
+def snapshot_so(supabase, so_no):
+    res = supabase.table("so_payments").select("expected_date, amount, sales_orders!inner(project_code)").eq("so_number", so_no).execute()
+    if not res.data: return {}
+    return doc_actuals(res.data, res.data[0]["sales_orders"]["project_code"], SO_REVENUE_ITEM)
+
+def snapshot_po(supabase, po_no):
+    res = supabase.table("po_payments").select("expected_date, amount, purchase_orders!inner(project_code, cost_item)").eq("po_number", po_no).execute()
+    if not res.data: return {}
+    head = res.data[0]["purchase_orders"]
+    return doc_actuals(res.data, head["project_code"], head["cost_item"])
+
+def diff_actuals(before, after):
+    delta = {}
+    for k in set(before) | set(after):
+        d = round(after.get(k, 0) - before.get(k, 0), 2)
+        if d != 0: delta[k] = d
+    return delta
+
+def apply_delta(supabase, before, after):
+    delta = diff_actuals(before, after)
+    if not delta: return 0
+    payload = [{"project_code": p, "year_month": m, "cost_item": item, "amount": d} for (p, m, item), d in delta.items()]
+    try:
+        return supabase.rpc(ACTUALS_DELTA_FN, {"p_delta": payload}).execute().data
+    except Exception as e:
+        if not core_engine.is_missing_function(e): raise
+    return _apply_delta_rows(supabase, delta)
+
+def _apply_delta_rows(supabase, delta):
+    # 資料庫尚未建立 apply_actuals_delta：讀回目前值相加後 upsert (非原子，只寫 real_amount)
+    keys = list(delta.keys())
+    res = supabase.table("project_matrix").select("project_code, year_month, cost_item, real_amount") \
+        .in_("project_code", sorted({k[0] for k in keys})) \
+        .in_("year_month", sorted({k[1] for k in keys})) \
+        .in_("cost_item", sorted({k[2] for k in keys})).execute()
+    current = {(r["project_code"], month_key(r["year_month"]), r["cost_item"]): r for r in res.data or []}
+    payload = [
+        {"project_code": p, "year_month": m, "cost_item": item,
+         "real_amount": round(float(current.get((p, m, item), {}).get("real_amount") or 0) + d, 2)}
+        for (p, m, item), d in delta.items()
+    ]
+    supabase.table("project_matrix").upsert(payload, on_conflict=MATRIX_CONFLICT).execute()
+    return len(payload)
+
+# --- 全專案對帳 (Reconcile) ---
+# 從收付款重算專案的月份實際數，與矩陣目前的 real_amount 相減後走同一個 delta RPC；
+# 沒有收付款的月份差額為負，自然歸零。
+
+def project_actuals(supabase, p_code):
+    so_rows = list_engine.fetch_all(
+        lambda: supabase.table("so_payments").select("id, expected_date, amount, sales_orders!inner(project_code)")
+        .eq("sales_orders.project_code", p_code), [("id", False)])
+    po_rows = list_engine.fetch_all(
+        lambda: supabase.table("po_payments").select("id, expected_date, amount, purchase_orders!inner(project_code, cost_item)")
+        .eq("purchase_orders.project_code", p_code), [("id", False)])
+    actuals = doc_actuals(so_rows, p_code, SO_REVENUE_ITEM)
+    by_item = {}
+    for r in po_rows:
+        by_item.setdefault(r["purchase_orders"]["cost_item"], []).append(r)
+    for item, rows in by_item.items():
+        actuals.update(doc_actuals(rows, p_code, item))
+    return actuals
+
+def matrix_actuals(supabase, p_code):
+    rows = list_engine.fetch_all(
+        lambda: supabase.table("project_matrix").select("year_month, cost_item, real_amount")
+        .eq("project_code", p_code).neq("real_amount", 0), [("year_month", False), ("cost_item", False)])
+    return {(p_code, month_key(r["year_month"]), r["cost_item"]): float(r["real_amount"] or 0) for r in rows}
+
+def reconcile(supabase, p_code):
+    # 回傳修正的格數
+    return apply_delta(supabase, matrix_actuals(supabase, p_code), project_actuals(supabase, p_code))